@@ -0,0 +1,67 @@
+"""
+genai.Client を呼び出しごとに作る場合と、プール済みのクライアントを使い回す場合の
+セットアップ時間を比較するマイクロベンチマーク
+
+実際のネットワークには出ず、クライアント生成 (認証情報の探索と TLS 接続) と
+API 呼び出しにかかる時間はスタブで模擬する
+
+    python benchmarks/bench_client_pool.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "media_agent", "tools"))
+
+import clients  # noqa: E402
+
+SETUP_SECONDS = float(os.getenv("BENCH_SETUP_SECONDS", "0.02"))
+CALL_SECONDS = float(os.getenv("BENCH_CALL_SECONDS", "0.001"))
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "200"))
+
+
+class _StubModels:
+    def generate_images(self, **kwargs):
+        time.sleep(CALL_SECONDS)
+
+
+class _StubClient:
+    """Stands in for genai.Client: setup pays for ADC lookup and a TLS handshake."""
+
+    def __init__(self, **kwargs):
+        time.sleep(SETUP_SECONDS)
+        self.models = _StubModels()
+
+
+def _per_call() -> float:
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        clients.genai.Client().models.generate_images()
+    return time.perf_counter() - started
+
+
+def _pooled() -> float:
+    clients.reset_clients()
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        clients.get_client("bench", "us-central1", True).models.generate_images()
+    return time.perf_counter() - started
+
+
+def main():
+    clients.genai.Client = _StubClient
+
+    per_call = _per_call()
+    pooled = _pooled()
+    saved = (per_call - pooled) / ITERATIONS
+
+    print(f"iterations:        {ITERATIONS}")
+    print(f"client per call:   {per_call * 1000 / ITERATIONS:.3f} ms/call")
+    print(f"pooled client:     {pooled * 1000 / ITERATIONS:.3f} ms/call")
+    print(f"setup time saved:  {saved * 1000:.3f} ms/call")
+    print(f"pool stats:        {clients.client_stats()}")
+
+
+if __name__ == "__main__":
+    main()
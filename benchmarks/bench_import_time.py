@@ -0,0 +1,64 @@
+"""
+エージェントモジュールの import にかかる時間を `python -X importtime` で計測し、
+予算 (IMPORT_TIME_BUDGET_MS) を超えたら終了コード 1 で失敗するベンチマーク
+
+認証情報やネットワークがなくても import できることもあわせて確認する
+
+    python benchmarks/bench_import_time.py
+"""
+
+import os
+import re
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+MODULES = ["media_agent", "media_agent_mcp"]
+
+# オフラインでも import できることを確かめるため、認証情報は参照させない
+ENV = dict(
+    os.environ,
+    GOOGLE_APPLICATION_CREDENTIALS="/nonexistent/credentials.json",
+    GENMEDIA_BUCKET=os.getenv("GENMEDIA_BUCKET", "bench-bucket"),
+    REFERENCE_IMAGE_URI=os.getenv("REFERENCE_IMAGE_URI", "gs://bench-bucket/ref.png"),
+)
+
+LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$")
+
+
+def measure(module: str) -> float:
+    """Returns the cumulative import time of `module` in milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=ENV,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    for line in reversed(result.stderr.splitlines()):
+        match = LINE.match(line)
+        if match and match.group(2) == module:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f"no importtime entry for {module}")
+
+
+def main():
+    failed = False
+    for module in MODULES:
+        try:
+            elapsed = measure(module)
+        except RuntimeError as e:
+            print(e)
+            failed = True
+            continue
+        verdict = "ok" if elapsed <= BUDGET_MS else "OVER BUDGET"
+        failed = failed or elapsed > BUDGET_MS
+        print(f"{module:<20} {elapsed:8.1f} ms  (budget {BUDGET_MS:.0f} ms)  {verdict}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
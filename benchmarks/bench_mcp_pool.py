@@ -0,0 +1,120 @@
+"""
+MCP ツール呼び出しのレイテンシを、従来の MCPToolset とセッションプール
+(PooledMCPToolset) で比較するベンチマーク
+
+スタブの MCP サーバ (このスクリプト自身を --serve で起動する stdio サーバ) に対して
+
+- first call: ツールセットを作ってから最初の 1 回 (プールは warm 済み)
+- per turn: get_tools + ツール呼び出し (LLM のターンごとに発生する)
+- concurrent: 同時に CONCURRENCY 件のツール呼び出し
+
+を計測する
+
+    python benchmarks/bench_mcp_pool.py
+"""
+
+import os
+import sys
+import time
+import asyncio
+import statistics
+import warnings
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+STUB_LATENCY_MS = float(os.getenv("BENCH_STUB_LATENCY_MS", "50"))
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "20"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "4"))
+
+
+def serve():
+    from mcp.server.mcpserver import MCPServer
+
+    server = MCPServer("genmedia-stub")
+
+    @server.tool()
+    async def imagen_t2i(prompt: str) -> str:
+        """Generates an image (stub)."""
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+        return "gs://bench-bucket/out/0.png"
+
+    server.run()
+
+
+def _toolset(pooled: bool):
+    from google.adk.tools.mcp_tool.mcp_toolset import (
+        MCPToolset,
+        StdioConnectionParams,
+        StdioServerParameters,
+    )
+    from media_agent_mcp.pool import PooledMCPToolset
+
+    cls = PooledMCPToolset if pooled else MCPToolset
+    kwargs = {"pool_size": CONCURRENCY} if pooled else {}
+    return cls(
+        connection_params=StdioConnectionParams(
+            server_params=StdioServerParameters(
+                command=sys.executable, args=[os.path.abspath(__file__), "--serve"]
+            ),
+            timeout=30,
+        ),
+        tool_filter=["imagen_t2i"],
+        **kwargs,
+    )
+
+
+async def _turn(toolset) -> float:
+    started = time.perf_counter()
+    tools = await toolset.get_tools()
+    await tools[0].run_async(args={"prompt": "a cat"}, tool_context=None)
+    return (time.perf_counter() - started) * 1000
+
+
+async def _concurrent(toolset) -> float:
+    tools = await toolset.get_tools()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            tools[0].run_async(args={"prompt": "a cat"}, tool_context=None)
+            for _ in range(CONCURRENCY)
+        )
+    )
+    return (time.perf_counter() - started) * 1000
+
+
+async def measure(pooled: bool) -> dict:
+    toolset = _toolset(pooled)
+    try:
+        if pooled:
+            await toolset.warm()
+        first = await _turn(toolset)
+        turns = [await _turn(toolset) for _ in range(ITERATIONS)]
+        concurrent = [await _concurrent(toolset) for _ in range(ITERATIONS // 4 or 1)]
+    finally:
+        await toolset.close()
+    return {
+        "first call": first,
+        "per turn (p50)": statistics.median(turns),
+        f"concurrent x{CONCURRENCY} (p50)": statistics.median(concurrent),
+    }
+
+
+async def main():
+    warnings.simplefilter("ignore")
+    print(f"stub tool latency: {STUB_LATENCY_MS:.0f} ms")
+    for name, pooled in (("toolset", False), ("pooled", True)):
+        results = await measure(pooled)
+        print(
+            f"{name:<8} "
+            + "  ".join(f"{label}: {value:7.1f} ms" for label, value in results.items())
+        )
+
+
+if __name__ == "__main__":
+    if "--serve" in sys.argv:
+        serve()
+    else:
+        # media_agent_mcp パッケージの import に必要な環境変数
+        os.environ.setdefault("GENMEDIA_BUCKET", "bench-bucket")
+        os.environ.setdefault("REFERENCE_IMAGE_URI", "gs://bench-bucket/ref.png")
+        sys.path.insert(0, ROOT)
+        asyncio.run(main())
@@ -0,0 +1,128 @@
+"""
+数 MB のツール応答に対する署名 URL への書き換えの所要時間とメモリを比較するベンチマーク
+
+- dict: media_agent の関数ツールが返す辞書 (base64 の画像バイトを含む)
+- mcp: media_agent_mcp の MCP ツールが返す CallToolResult (テキストと画像の content part)
+
+従来の実装 (すべてのコンテナを作り直す / deepcopy する) と、
+変更のあった経路だけをコピーする rewrite モジュールを比べる。署名はスタブ
+
+    python benchmarks/bench_rewrite.py
+"""
+
+import os
+import re
+import sys
+import copy
+import time
+import base64
+import tracemalloc
+
+from mcp import types as mcp_types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "media_agent"))
+
+from rewrite import rewrite_mcp_result, rewrite_tree  # noqa: E402
+from scanner import GcsUrlScanner  # noqa: E402
+
+BUCKET = "bench-bucket"
+PAYLOAD_MB = float(os.getenv("BENCH_PAYLOAD_MB", "4"))
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "5"))
+
+scanner = GcsUrlScanner([BUCKET])
+_legacy_pattern = r"(gs://[^ \n\r\t]+|https://[^ \n\r\t]+)"
+
+
+def _signed(match) -> str:
+    return f"https://storage.googleapis.com/{match.bucket}/{match.object_name}?X-Goog-Signature=stub"
+
+
+def new_rewrite(text: str) -> str:
+    return scanner.rewrite(text, scanner.scan(text), _signed)
+
+
+def legacy_rewrite(text: str) -> str:
+    return re.compile(_legacy_pattern).sub(
+        lambda m: m.group(0) + "?X-Goog-Signature=stub", text
+    )
+
+
+def legacy_replace_values_recursively(obj, replacement_func, ignore_keys):
+    if isinstance(obj, dict):
+        return {
+            k: v
+            if k in ignore_keys
+            else legacy_replace_values_recursively(v, replacement_func, ignore_keys)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [
+            legacy_replace_values_recursively(v, replacement_func, ignore_keys)
+            for v in obj
+        ]
+    if isinstance(obj, str):
+        return replacement_func(obj)
+    return obj
+
+
+def legacy_mcp(result):
+    modified = copy.deepcopy(result)
+    modified.content[0].text = legacy_rewrite(result.content[0].text)
+    return modified
+
+
+def _payload() -> str:
+    return base64.b64encode(os.urandom(int(PAYLOAD_MB * 1024 * 1024 * 3 / 4))).decode()
+
+
+def _dict_response() -> dict:
+    return {
+        "status": "success",
+        "uri": f"gs://{BUCKET}/out/0.png",
+        "uris": [f"gs://{BUCKET}/out/{i}.png" for i in range(4)],
+        "image_bytes": _payload(),
+        "metadata": [{"seed": i, "safety": ["ok"] * 50} for i in range(500)],
+    }
+
+
+def _mcp_response() -> mcp_types.CallToolResult:
+    return mcp_types.CallToolResult(
+        content=[
+            mcp_types.TextContent(type="text", text=f"saved to gs://{BUCKET}/out/0.png"),
+            mcp_types.ImageContent(type="image", data=_payload(), mimeType="image/png"),
+            mcp_types.TextContent(type="text", text=f"also gs://{BUCKET}/out/1.png"),
+        ]
+    )
+
+
+def _measure(fn) -> tuple[float, float]:
+    fn()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    elapsed = (time.perf_counter() - started) / ITERATIONS
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024 / 1024
+
+
+def main():
+    response = _dict_response()
+    result = _mcp_response()
+    cases = {
+        "dict legacy": lambda: legacy_replace_values_recursively(
+            response, legacy_rewrite, {"status"}
+        ),
+        "dict rewrite": lambda: rewrite_tree(response, new_rewrite, {"status"}),
+        "mcp legacy": lambda: legacy_mcp(result),
+        "mcp rewrite": lambda: rewrite_mcp_result(result, new_rewrite),
+    }
+    print(f"binary payload: {PAYLOAD_MB} MB")
+    for name, fn in cases.items():
+        elapsed, peak = _measure(fn)
+        print(f"{name:<14} {elapsed:9.2f} ms  peak {peak:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+署名付き URL の署名バックエンドごとのスループット (signatures/sec) を比較するベンチマーク
+
+- local: テスト用に生成した RSA 鍵で LocalKeySigner がローカル署名する
+- local+pool: 上記に加え、RSA 計算をプロセスプールへ逃がす
+- iam: IAM Credentials API の signBlob を模したローカルのスタブサーバに署名させる
+
+    python benchmarks/bench_signing_backends.py
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from google.auth import credentials as auth_credentials
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from media_agent import signing  # noqa: E402
+
+IAM_LATENCY_SECONDS = float(os.getenv("BENCH_IAM_LATENCY_SECONDS", "0.03"))
+SIGNATURES = int(os.getenv("BENCH_SIGNATURES", "400"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+PROCESSES = int(os.getenv("BENCH_PROCESSES", "4"))
+EMAIL = "bench@example.iam.gserviceaccount.com"
+
+
+def _generate_key_info():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    return {"client_email": EMAIL, "private_key": pem, "private_key_id": "bench"}, key
+
+
+def _start_iam_stub(key) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(IAM_LATENCY_SECONDS)
+            signature = key.sign(
+                base64.b64decode(body["payload"]), padding.PKCS1v15(), hashes.SHA256()
+            )
+            payload = json.dumps(
+                {"keyId": "bench", "signedBlob": base64.b64encode(signature).decode()}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _StubIamSigner(auth_credentials.Signing):
+    """Signs through a signBlob-compatible endpoint, like impersonated credentials."""
+
+    def __init__(self, endpoint: str):
+        self._endpoint = endpoint
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    @property
+    def signer(self):
+        return None
+
+    @property
+    def signer_email(self):
+        return EMAIL
+
+    def sign_bytes(self, message: bytes) -> bytes:
+        response = self._session().post(
+            f"{self._endpoint}/v1/projects/-/serviceAccounts/{EMAIL}:signBlob",
+            json={"payload": base64.b64encode(message).decode()},
+        )
+        return base64.b64decode(response.json()["signedBlob"])
+
+
+def _measure(signer: auth_credentials.Signing) -> float:
+    messages = [f"GOOG4-RSA-SHA256\n{i}".encode() for i in range(SIGNATURES)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        list(executor.map(signer.sign_bytes, messages))
+    return SIGNATURES / (time.perf_counter() - started)
+
+
+def main():
+    key_info, key = _generate_key_info()
+    server = _start_iam_stub(key)
+
+    local = signing.LocalKeySigner(key_info)
+    pooled = signing.LocalKeySigner(key_info, processes=PROCESSES)
+    pooled.sign_bytes(b"warm up")
+    iam = _StubIamSigner(f"http://127.0.0.1:{server.server_port}")
+
+    print(f"signatures: {SIGNATURES}, concurrency: {CONCURRENCY}")
+    print(f"local:       {_measure(local):10.1f} signatures/sec")
+    print(f"local+pool:  {_measure(pooled):10.1f} signatures/sec")
+    print(f"iam (stub):  {_measure(iam):10.1f} signatures/sec")
+
+    pooled.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""
+GCP に接続せずに、ツールやコールバックのオーバーヘッドをまとめて計測するベンチマーク
+
+genai.Client、GCS の署名、ID トークンの取得はすべて fakes.py のフェイクで置き換える。
+フェイクの応答時間は BENCH_*_LATENCY_MS、失敗率は BENCH_FAILURE_RATE で設定できる。
+結果は JSON に書き出すので、コミット間で比較できる
+
+    python benchmarks/bench_suite.py                      # benchmarks/results/<commit>.json
+    python benchmarks/bench_suite.py --compare old.json   # 以前の結果と比較する
+    python benchmarks/bench_suite.py --only after_tool    # 名前に一致するケースだけ
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import warnings
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+os.environ.setdefault("GENMEDIA_BUCKET", "bench-bucket")
+os.environ.setdefault("REFERENCE_IMAGE_URI", "gs://bench-bucket/ref.png")
+os.environ.setdefault("IMAGEN_INSTRUCTION", "")
+os.environ.setdefault("GENMEDIA_JOB_DB", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+os.environ.setdefault("TELEMETRY_LOG_SAMPLE_RATE", "0")
+# 受け付け制御のレート制限で待たされないようにする (オーバーヘッドだけを測る)
+os.environ.setdefault("GENMEDIA_VEO_RPM", "1000000")
+os.environ.setdefault("GENMEDIA_IMAGEN_RPM", "1000000")
+os.environ.setdefault("GENMEDIA_VEO_MAX_OPERATIONS", "1000")
+os.environ.setdefault("GENMEDIA_RETRY_BASE_SECONDS", "0.001")
+warnings.simplefilter("ignore")
+
+from mcp import types as mcp_types  # noqa: E402
+
+import fakes  # noqa: E402
+from google.adk.models import LlmRequest  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from media_agent import (  # noqa: E402
+    callbacks,
+    compaction,
+    intent,
+    prompt_budget,
+    response_cache,
+)
+from media_agent.tools import genmedia, jobs, preflight  # noqa: E402
+from media_agent_mcp import auth as mcp_auth  # noqa: E402
+from media_agent_mcp import callbacks as mcp_callbacks  # noqa: E402
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "200"))
+GENAI_LATENCY_MS = float(os.getenv("BENCH_GENAI_LATENCY_MS", "1"))
+POLL_LATENCY_MS = float(os.getenv("BENCH_POLL_LATENCY_MS", "1"))
+POLLS_UNTIL_DONE = int(os.getenv("BENCH_POLLS_UNTIL_DONE", "3"))
+SIGN_LATENCY_MS = float(os.getenv("BENCH_SIGN_LATENCY_MS", "2"))
+TOKEN_LATENCY_MS = float(os.getenv("BENCH_TOKEN_LATENCY_MS", "20"))
+FAILURE_RATE = float(os.getenv("BENCH_FAILURE_RATE", "0"))
+REFERENCES = int(os.getenv("BENCH_REFERENCES", "20"))
+
+BUCKET = os.environ["GENMEDIA_BUCKET"]
+
+
+def _latency(ms: float) -> fakes.Latency:
+    return fakes.Latency(ms / 1000, failure_rate=FAILURE_RATE)
+
+
+PARAMS = {
+    "iterations": ITERATIONS,
+    "genai_latency_ms": GENAI_LATENCY_MS,
+    "poll_latency_ms": POLL_LATENCY_MS,
+    "polls_until_done": POLLS_UNTIL_DONE,
+    "sign_latency_ms": SIGN_LATENCY_MS,
+    "token_latency_ms": TOKEN_LATENCY_MS,
+    "failure_rate": FAILURE_RATE,
+    "references": REFERENCES,
+}
+
+
+class Case:
+    """
+    One benchmark. `run` is called `iterations` times (awaited when async);
+    `setup` runs before each call and is not timed. `simulated_ms` is the
+    latency the fakes add per call, subtracted to report overhead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Any],
+        setup: Optional[Callable[[], Any]] = None,
+        iterations: int = ITERATIONS,
+        simulated_ms: float = 0.0,
+        ok: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.iterations = iterations
+        self.simulated_ms = simulated_ms
+        self.ok = ok
+
+    async def measure(self) -> Dict[str, Any]:
+        samples: List[float] = []
+        failures = 0
+        for _ in range(self.iterations):
+            if self.setup:
+                self.setup()
+            started = time.perf_counter()
+            result = self.run()
+            if asyncio.iscoroutine(result):
+                result = await result
+            samples.append((time.perf_counter() - started) * 1000)
+            if self.ok and not self.ok(result):
+                failures += 1
+        samples.sort()
+        mean = statistics.fmean(samples)
+        return {
+            "iterations": self.iterations,
+            "mean_ms": round(mean, 4),
+            "p50_ms": round(samples[len(samples) // 2], 4),
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 4),
+            "min_ms": round(samples[0], 4),
+            "overhead_ms": round(mean - self.simulated_ms, 4),
+            "ops_per_sec": round(1000 / mean, 1) if mean else None,
+            "failures": failures,
+        }
+
+
+def _text() -> str:
+    parts = []
+    for i in range(REFERENCES):
+        parts.append(f"saved gs://{BUCKET}/out/{i}.png and")
+        parts.append(f"https://storage.googleapis.com/{BUCKET}/out/{i}.mp4 see")
+        parts.append("https://example.com/page lorem ipsum dolor sit amet " * 4)
+    return " ".join(parts)
+
+
+def _tool_response() -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "uri": f"gs://{BUCKET}/out/0.png",
+        "uris": [f"gs://{BUCKET}/out/{i}.png" for i in range(REFERENCES)],
+        "results": [
+            {"index": i, "uris": [f"gs://{BUCKET}/out/{i}.png"], "error": None}
+            for i in range(REFERENCES)
+        ],
+    }
+
+
+def _mcp_response() -> mcp_types.CallToolResult:
+    return mcp_types.CallToolResult(
+        content=[
+            mcp_types.TextContent(type="text", text=_text()),
+            mcp_types.ImageContent(type="image", data="QUJD" * 4096, mimeType="image/png"),
+        ]
+    )
+
+
+def _llm_request(instruction: str) -> LlmRequest:
+    # 以前の before_model が指示を付け足していた履歴
+    contents = []
+    for i in range(REFERENCES):
+        text = f"{instruction}\n\nmake image {i}"
+        contents.append(types.Content(role="user", parts=[types.Part(text=text)]))
+        contents.append(
+            types.Content(role="model", parts=[types.Part(text=f"done {i}")])
+        )
+    return LlmRequest(contents=contents)
+
+
+def _signed_history() -> LlmRequest:
+    # after_tool が署名付き URL に置き換えたツール応答と、それを繰り返したモデルの応答
+    signed = (
+        f"https://storage.googleapis.com/{BUCKET}/out/%d.png"
+        "?X-Goog-Algorithm=GOOG4-RSA-SHA256&X-Goog-Expires=300"
+        "&X-Goog-SignedHeaders=host&X-Goog-Signature=" + "ab" * 256
+    )
+    contents = []
+    for i in range(REFERENCES):
+        response = {"status": "success", "uris": [signed % i], "prompt": "a cat " * 50}
+        contents += [
+            types.Content(role="user", parts=[types.Part(text=f"make image {i}")]),
+            types.Content(
+                role="model",
+                parts=[
+                    types.Part(
+                        function_call=types.FunctionCall(
+                            name="imagen_t2i", args={"prompt": "a cat"}
+                        )
+                    )
+                ],
+            ),
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part(
+                        function_response=types.FunctionResponse(
+                            name="imagen_t2i", response=response
+                        )
+                    )
+                ],
+            ),
+            types.Content(role="model", parts=[types.Part(text=f"done {signed % i}")]),
+        ]
+    contents.append(types.Content(role="user", parts=[types.Part(text="one more")]))
+    return LlmRequest(contents=contents)
+
+
+class _Tool:
+    name = "imagen_t2i"
+
+
+class _ToolContext:
+    agent_name = "media_agent"
+    function_call_id = None
+
+
+def _succeeded(response: Dict[str, Any]) -> bool:
+    return response.get("status") in ("success", "submitted")
+
+
+def _clear_signed_urls() -> None:
+    callbacks.signed_url_cache.clear()
+    mcp_callbacks.signed_url_cache.clear()
+
+
+def build_cases() -> List[Case]:
+    genai_ms, poll_ms = GENAI_LATENCY_MS, POLL_LATENCY_MS
+    text = _text()
+    response = _tool_response()
+    mcp_response = _mcp_response()
+
+    async def veo_job() -> Dict[str, Any]:
+        submitted = await genmedia.veo_i2v(
+            "a cat", f"gs://{BUCKET}/ref.png", BUCKET, force_new=True
+        )
+        if submitted.get("status") != "submitted":
+            return submitted
+        return await genmedia.get_media_job(submitted["job_id"], wait_seconds=10)
+
+    instruction = "Always answer in Japanese. " * 20
+    llm_requests: List[LlmRequest] = []
+    history = _llm_request("")
+
+    def apply_prompt_budget() -> LlmRequest:
+        request = llm_requests.pop()
+        prompt_budget.apply_prompt_budget(request, instruction)
+        return request
+
+    def compact_history() -> Any:
+        return compaction.compact_history(llm_requests.pop(), True)
+
+    def budget_applied(request: LlmRequest) -> bool:
+        texts = [c.parts[0].text for c in request.contents]
+        return request.config.system_instruction == instruction and not any(
+            t.startswith(instruction) for t in texts
+        )
+
+    return [
+        Case(
+            "veo_i2v.poll_loop",
+            lambda: genmedia._generate_videos(
+                "a cat",
+                f"gs://{BUCKET}/ref.png",
+                "image/png",
+                f"gs://{BUCKET}/",
+                1,
+                "16:9",
+                6,
+                genmedia.veo_model,
+            ),
+            iterations=max(1, ITERATIONS // 4),
+            simulated_ms=genai_ms + POLLS_UNTIL_DONE * poll_ms,
+        ),
+        Case(
+            "veo_i2v.submit_and_get_job",
+            veo_job,
+            iterations=max(1, ITERATIONS // 4),
+            # 入力画像の確認 (メタデータの取得) と生成
+            simulated_ms=2 * genai_ms + POLLS_UNTIL_DONE * poll_ms,
+            ok=_succeeded,
+        ),
+        Case(
+            "preflight_image.cached",
+            lambda: preflight.preflight_image(f"gs://{BUCKET}/ref.png", "16:9"),
+            simulated_ms=genai_ms,
+            ok=lambda check: check.error is None,
+        ),
+        Case(
+            "preflight_image.rejected",
+            lambda: preflight.preflight_image(f"gs://{BUCKET}/portrait.png", "16:9"),
+            simulated_ms=genai_ms,
+            ok=lambda check: check.error is not None,
+        ),
+        Case(
+            "imagen_t2i.call",
+            lambda: genmedia.imagen_t2i("a cat", BUCKET, force_new=True),
+            simulated_ms=genai_ms,
+            ok=_succeeded,
+        ),
+        Case(
+            "imagen_t2i.cached",
+            lambda: genmedia.imagen_t2i("a cached cat", BUCKET),
+            ok=_succeeded,
+        ),
+        Case(
+            "parse_gcs_path",
+            lambda: callbacks.parse_gcs_path(
+                f"https://storage.googleapis.com/{BUCKET}/out/0.png", BUCKET
+            ),
+            iterations=ITERATIONS * 10,
+        ),
+        Case(
+            "replace_gcs_paths_with_signed_urls.cold",
+            lambda: callbacks.replace_gcs_paths_with_signed_urls(text),
+            setup=_clear_signed_urls,
+            iterations=max(1, ITERATIONS // 4),
+        ),
+        Case(
+            "replace_gcs_paths_with_signed_urls.warm",
+            lambda: callbacks.replace_gcs_paths_with_signed_urls(text),
+        ),
+        Case(
+            "replace_values_recursively",
+            lambda: callbacks.replace_values_recursively(
+                response, lambda s: s.replace("gs://", "https://"), {"status"}
+            ),
+        ),
+        Case(
+            "after_tool.media_agent",
+            lambda: callbacks.after_tool(_Tool(), {}, _ToolContext(), response),
+            setup=_clear_signed_urls,
+            iterations=max(1, ITERATIONS // 4),
+        ),
+        Case(
+            "after_tool.media_agent_mcp",
+            lambda: mcp_callbacks.after_tool(_Tool(), {}, _ToolContext(), mcp_response),
+            setup=_clear_signed_urls,
+            iterations=max(1, ITERATIONS // 4),
+        ),
+        Case(
+            "apply_prompt_budget.history",
+            apply_prompt_budget,
+            setup=lambda: llm_requests.append(_llm_request(instruction)),
+            ok=budget_applied,
+        ),
+        Case(
+            "compact_history",
+            compact_history,
+            setup=lambda: llm_requests.append(_signed_history()),
+            ok=lambda tokens: tokens[1] < tokens[0],
+        ),
+        Case(
+            "response_cache.request_key",
+            lambda: response_cache.request_key(history),
+            ok=lambda key: key is not None,
+        ),
+        Case(
+            "intent.classify",
+            lambda: intent.classify("こんにちは、何ができますか？"),
+            iterations=ITERATIONS * 10,
+            ok=lambda result: result.label == intent.CAPABILITIES,
+        ),
+        Case(
+            "get_google_token_from_aud.miss",
+            lambda: mcp_auth.get_google_token_from_aud(0, "https://bench.run.app"),
+            setup=mcp_auth.id_token_manager.clear,
+            iterations=max(1, ITERATIONS // 10),
+            simulated_ms=TOKEN_LATENCY_MS,
+        ),
+        Case(
+            "get_google_token_from_aud.hit",
+            lambda: mcp_auth.get_google_token_from_aud(0, "https://bench.run.app"),
+            iterations=ITERATIONS * 10,
+        ),
+    ]
+
+
+async def run(only: Optional[str]) -> Dict[str, Any]:
+    client = fakes.FakeGenaiClient(
+        _latency(GENAI_LATENCY_MS), _latency(POLL_LATENCY_MS), POLLS_UNTIL_DONE
+    )
+    signer = fakes.FakeSigner(_latency(SIGN_LATENCY_MS))
+    storage = (None, fakes.fake_storage_client())
+    gcs = fakes.FakeGcsClient(
+        {
+            (BUCKET, "ref.png"): fakes.png_header(1280, 720),
+            (BUCKET, "portrait.png"): fakes.png_header(720, 1280),
+        },
+        _latency(GENAI_LATENCY_MS),
+    )
+    job_manager = jobs.JobManager(
+        jobs.SqliteJobStore(os.environ["GENMEDIA_JOB_DB"]), poll_interval=0
+    )
+
+    cases = build_cases()
+    results = {}
+    with (
+        fakes.patched(genmedia, get_client=lambda: client, poll_interval=0, job_manager=job_manager),
+        fakes.patched(jobs, get_client=lambda: client),
+        fakes.patched(preflight, _storage=_Ready(gcs)),
+        fakes.patched(callbacks, get_local_signer=lambda: signer, _storage=_Ready(storage)),
+        fakes.patched(mcp_callbacks, get_local_signer=lambda: signer, _storage=_Ready(storage)),
+        fakes.fake_id_tokens(mcp_auth, _latency(TOKEN_LATENCY_MS)),
+    ):
+        for case in cases:
+            if only and only not in case.name:
+                continue
+            results[case.name] = await case.measure()
+            _print(case.name, results[case.name])
+    return results
+
+
+class _Ready:
+    """A Lazy that is already built."""
+
+    def __init__(self, value):
+        self._value = value
+        self.ready = True
+
+    def get(self):
+        return self._value
+
+
+def _print(name: str, stats: Dict[str, Any]) -> None:
+    print(
+        f"{name:<42} mean {stats['mean_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms  "
+        f"overhead {stats['overhead_ms']:9.3f} ms  failures {stats['failures']}"
+    )
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    print(f"\ncompared with {old.get('commit')} ({old.get('created_at')})")
+    for name, stats in new["results"].items():
+        before = old.get("results", {}).get(name)
+        if not before:
+            continue
+        ratio = stats["mean_ms"] / before["mean_ms"] if before["mean_ms"] else 0
+        print(
+            f"{name:<42} {before['mean_ms']:9.3f} -> {stats['mean_ms']:9.3f} ms  ({ratio:5.2f}x)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default=os.getenv("BENCH_OUTPUT"))
+    parser.add_argument("--compare")
+    parser.add_argument("--only")
+    args = parser.parse_args()
+
+    commit = _commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": PARAMS,
+        "results": asyncio.run(run(args.only)),
+    }
+
+    output = args.output or os.path.join(HERE, "results", f"{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
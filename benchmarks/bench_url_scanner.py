@@ -0,0 +1,111 @@
+"""
+大きなツール応答に対する GCS URL 書き換えのスループットを比較するベンチマーク
+
+- legacy: 呼び出しごとに正規表現をコンパイルし、すべての https URL を解析していた従来の実装
+- scanner: 事前コンパイル済みの GcsUrlScanner で検出し、一度の join で書き換える実装
+
+署名はスタブで、書き換えにかかる時間だけを計測する
+
+    python benchmarks/bench_url_scanner.py
+"""
+
+import os
+import re
+import sys
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "media_agent"))
+
+from scanner import GcsUrlScanner  # noqa: E402
+
+BUCKET = "bench-bucket"
+ASSETS = int(os.getenv("BENCH_ASSETS", "200"))
+FILLER_KB = int(os.getenv("BENCH_FILLER_KB", "2048"))
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "10"))
+
+
+_sign_calls = [0]
+
+
+def _signed(bucket: str, obj: str) -> str:
+    _sign_calls[0] += 1
+    return f"https://storage.googleapis.com/{bucket}/{obj}?X-Goog-Signature=stub"
+
+
+def _legacy_parse(path: str, bucket_name: str):
+    initial_object_name = None
+    if path.startswith(f"gs://{bucket_name}/"):
+        initial_object_name = path.replace(f"gs://{bucket_name}/", "")
+    elif path.startswith("https://"):
+        path = urlparse(path).path
+        index = path.find(f"/{bucket_name}/")
+        if index != -1:
+            initial_object_name = path[index + len(bucket_name) + 2 :]
+    if initial_object_name:
+        match = re.compile(r"(.*?\.jpeg|.*?\.png|.*?\.mp4)").search(
+            initial_object_name
+        )
+        if match:
+            return bucket_name, match.group(1)
+    return None, None
+
+
+def legacy_rewrite(text: str) -> str:
+    url_pattern = re.compile(r"(gs://[^ \n\r\t]+|https://[^ \n\r\t]+)")
+
+    def replacer(match):
+        bucket, obj = _legacy_parse(match.group(0), BUCKET)
+        return _signed(bucket, obj) if bucket else match.group(0)
+
+    return url_pattern.sub(replacer, text)
+
+
+def scanner_rewrite(scanner: GcsUrlScanner, text: str) -> str:
+    matches = scanner.scan(text)
+    return scanner.rewrite(text, matches, lambda m: _signed(m.bucket, m.object_name))
+
+
+def _build_response() -> str:
+    filler = "lorem ipsum dolor sit amet " * (FILLER_KB * 1024 // 27 // ASSETS)
+    parts = []
+    for i in range(ASSETS):
+        if i % 4 == 0:
+            parts.append(_signed(BUCKET, f"done/{i}.png"))
+        elif i % 4 == 1:
+            parts.append(f"https://example.com/page/{i}")
+        else:
+            parts.append(f"gs://{BUCKET}/out/{i}.mp4")
+        parts.append(filler)
+    return " ".join(parts)
+
+
+def _measure(rewrite, text: str) -> float:
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        rewrite(text)
+    return (time.perf_counter() - started) / ITERATIONS
+
+
+def main():
+    text = _build_response()
+    scanner = GcsUrlScanner([BUCKET])
+    mb = len(text.encode("utf-8")) / 1024 / 1024
+
+    print(f"response size: {mb:.2f} MB, references: {ASSETS}")
+    rewrites = {
+        "legacy": legacy_rewrite,
+        "scanner": lambda t: scanner_rewrite(scanner, t),
+    }
+    for name, rewrite in rewrites.items():
+        elapsed = _measure(rewrite, text)
+        _sign_calls[0] = 0
+        rewrite(text)
+        print(
+            f"{name:<8} {elapsed * 1000:8.2f} ms/response  {mb / elapsed:8.1f} MB/s  "
+            f"signatures requested: {_sign_calls[0]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+ベンチマーク用のフェイク: genai.Client、GCS の署名と読み取り、ID トークンの取得を
+実際の GCP に接続せずに模擬する
+
+どのフェイクも Latency で応答時間と失敗率を設定でき、失敗は例外として注入される
+"""
+
+import time
+import random
+import asyncio
+import struct
+import itertools
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+from google import genai
+from google.api_core import exceptions
+from google.auth import credentials as auth_credentials
+
+
+@dataclass
+class Latency:
+    """Simulated latency in seconds, with optional jitter and failure injection."""
+
+    seconds: float = 0.0
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    seed: Optional[int] = 0
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+
+    def _delay(self) -> float:
+        return max(0.0, self.seconds + self._random.uniform(-self.jitter, self.jitter))
+
+    def _maybe_fail(self, what: str) -> None:
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise exceptions.ServiceUnavailable(f"injected failure: {what}")
+
+    def wait(self, what: str = "call") -> None:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        self._maybe_fail(what)
+
+    async def await_(self, what: str = "call") -> None:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self._maybe_fail(what)
+
+
+# --- genai ---
+
+
+class _FakeModels:
+    def __init__(self, client: "FakeGenaiClient"):
+        self._client = client
+
+    async def generate_videos(self, *, model, prompt, image=None, config=None):
+        await self._client.latency.await_("generate_videos")
+        # Like Vertex AI operation names, the name includes the model.
+        name = (
+            f"projects/bench/locations/us-central1/publishers/google/models/{model}"
+            f"/operations/{next(self._client._ids)}"
+        )
+        self._client.polls[name] = 0
+        return genai.types.GenerateVideosOperation(name=name, done=False)
+
+    async def generate_images(self, *, model, prompt, config=None):
+        await self._client.latency.await_("generate_images")
+        count = getattr(config, "number_of_images", None) or 1
+        bucket = getattr(config, "output_gcs_uri", None) or "gs://bench-bucket/"
+        return genai.types.GenerateImagesResponse(
+            generated_images=[
+                genai.types.GeneratedImage(
+                    image=genai.types.Image(
+                        gcs_uri=f"{bucket}{next(self._client._ids)}/sample_{i}.png"
+                    )
+                )
+                for i in range(count)
+            ]
+        )
+
+
+class _FakeOperations:
+    def __init__(self, client: "FakeGenaiClient"):
+        self._client = client
+
+    async def get(self, operation):
+        await self._client.poll_latency.await_("operations.get")
+        polls = self._client.polls.get(operation.name, 0) + 1
+        self._client.polls[operation.name] = polls
+        if polls < self._client.polls_until_done:
+            return genai.types.GenerateVideosOperation(name=operation.name, done=False)
+        return genai.types.GenerateVideosOperation(
+            name=operation.name,
+            done=True,
+            response=genai.types.GenerateVideosResponse(
+                generated_videos=[
+                    genai.types.GeneratedVideo(
+                        video=genai.types.Video(
+                            uri=f"gs://bench-bucket/{operation.name.rsplit('/', 1)[-1]}/sample_0.mp4"
+                        )
+                    )
+                ]
+            ),
+        )
+
+
+class _FakeAio:
+    def __init__(self, client: "FakeGenaiClient"):
+        self.models = _FakeModels(client)
+        self.operations = _FakeOperations(client)
+
+
+class FakeGenaiClient:
+    """
+    Stands in for genai.Client's async surface. Video operations finish after
+    `polls_until_done` calls to `operations.get`.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Latency] = None,
+        poll_latency: Optional[Latency] = None,
+        polls_until_done: int = 3,
+    ):
+        self.latency = latency or Latency()
+        self.poll_latency = poll_latency or Latency()
+        self.polls_until_done = polls_until_done
+        self.polls: Dict[str, int] = {}
+        self._ids = itertools.count()
+        self.aio = _FakeAio(self)
+
+
+# --- GCS ---
+
+
+class FakeSigner(auth_credentials.Signing, auth_credentials.Credentials):
+    """
+    Signing credentials whose signature is a fixed byte string, returned after
+    the configured latency (an IAM signBlob round trip or a local RSA sign).
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Latency] = None,
+        email: str = "bench@example.iam.gserviceaccount.com",
+    ):
+        super().__init__()
+        self.latency = latency or Latency()
+        self._email = email
+        self.token = "fake"
+
+    def refresh(self, request) -> None:
+        pass
+
+    @property
+    def signer(self):
+        return self
+
+    @property
+    def signer_email(self) -> str:
+        return self._email
+
+    @property
+    def service_account_email(self) -> str:
+        return self._email
+
+    def sign_bytes(self, message: bytes) -> bytes:
+        self.latency.wait("sign_bytes")
+        return b"\x00" * 256
+
+
+def fake_storage_client():
+    """A real storage.Client with anonymous credentials; it never hits the network to sign."""
+    from google.cloud import storage
+
+    return storage.Client(
+        project="bench", credentials=auth_credentials.AnonymousCredentials()
+    )
+
+
+def png_header(width: int = 1280, height: int = 720) -> bytes:
+    """The first bytes of a PNG of the given size (signature and IHDR chunk)."""
+    ihdr = struct.pack(">II5B", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr
+
+
+class _FakeBlob:
+    def __init__(self, client: "FakeGcsClient", bucket: str, name: str):
+        self._client = client
+        self._key = (bucket, name)
+        self.generation = None
+        self.size = None
+
+    def reload(self) -> None:
+        self._client.latency.wait("blob.reload")
+        data = self._client.objects.get(self._key)
+        if data is None:
+            raise exceptions.NotFound(f"{self._key[0]}/{self._key[1]}")
+        self.generation = 1
+        self.size = len(data)
+
+    def download_as_bytes(self, start=0, end=None, generation=None) -> bytes:
+        self._client.latency.wait("blob.download_as_bytes")
+        data = self._client.objects[self._key]
+        return data[start : None if end is None else end + 1]
+
+
+class _FakeBucket:
+    def __init__(self, client: "FakeGcsClient", name: str):
+        self._client = client
+        self._name = name
+
+    def blob(self, name: str) -> _FakeBlob:
+        return _FakeBlob(self._client, self._name, name)
+
+
+class FakeGcsClient:
+    """A storage.Client stand-in that serves `objects` {(bucket, name): bytes}."""
+
+    def __init__(self, objects: Dict[Any, bytes], latency: Optional[Latency] = None):
+        self.objects = objects
+        self.latency = latency or Latency()
+
+    def bucket(self, name: str) -> _FakeBucket:
+        return _FakeBucket(self, name)
+
+
+# --- ID tokens ---
+
+
+class FakeUserCredentials:
+    """ADC user credentials whose refresh yields an ID token after `latency`."""
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.id_token = None
+
+    def refresh(self, request) -> None:
+        self.latency.wait("credentials.refresh")
+        self.id_token = f"fake-id-token-{time.time_ns()}"
+
+
+@contextmanager
+def patched(target: Any, **attributes: Any) -> Iterator[None]:
+    """Temporarily replaces attributes of a module or object."""
+    originals = {name: getattr(target, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(target, name, value)
+
+
+@contextmanager
+def fake_id_tokens(
+    auth_module: Any,
+    latency: Optional[Latency] = None,
+    verify_latency: Optional[Latency] = None,
+    lifetime: float = 3600,
+) -> Iterator[FakeUserCredentials]:
+    """
+    Points an auth module (media_agent_mcp.auth) at fake ADC credentials and
+    a fake token verifier, so token fetches never leave the process.
+    """
+    credentials = FakeUserCredentials(latency)
+    verify_latency = verify_latency or Latency()
+
+    def verify_oauth2_token(token, request, clock_skew_in_seconds=0):
+        verify_latency.wait("verify_oauth2_token")
+        return {"exp": time.time() + lifetime}
+
+    with patched(auth_module.google.auth, default=lambda *a, **k: (credentials, "bench")):
+        with patched(auth_module.id_token, verify_oauth2_token=verify_oauth2_token):
+            auth_module.id_token_manager.clear()
+            try:
+                yield credentials
+            finally:
+                auth_module.id_token_manager.clear()
@@ -1,18 +1,22 @@
 import os
 
-import google.auth
 from google.adk.agents import LlmAgent
+from google.adk.apps import App
 
 from .tools import genmedia_tools
-from .callbacks import before_model, after_tool
+from .callbacks import before_model, after_model, before_tool, after_tool
+from .prompt_budget import context_cache_config
+from .telemetry import configure_telemetry
 from . import prompt
 
 
-_, project_id = google.auth.default()
-os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
+# プロジェクト ID は google.auth.default() による探索が重いため、初回のクライアント生成時に解決する
 os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
 os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
 
+# OTEL_EXPORTER_OTLP_ENDPOINT が設定されていれば、スパンとメトリクスを OTLP で送る
+configure_telemetry()
+
 root_agent = LlmAgent(
     name="media_agent",
     model="gemini-2.5-flash",
@@ -22,5 +26,14 @@ root_agent = LlmAgent(
     ),
     tools=genmedia_tools,
     before_model_callback=before_model,
+    after_model_callback=after_model,
+    before_tool_callback=before_tool,
     after_tool_callback=after_tool,
 )
+
+# adk web などはこの app を読み込む。システム指示とツール定義をコンテキストキャッシュに載せる
+app = App(
+    name="media_agent",
+    root_agent=root_agent,
+    context_cache_config=context_cache_config,
+)
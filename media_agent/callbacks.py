@@ -1,7 +1,7 @@
 import os
-import re
+import time
+import logging
 import datetime
-from urllib.parse import urlparse
 from typing import Optional, Dict, Any
 
 import google.auth
@@ -13,6 +13,30 @@ from google.adk.models import LlmResponse, LlmRequest
 from google.adk.tools.tool_context import ToolContext
 from google.adk.tools.base_tool import BaseTool
 
+from .compaction import HISTORY_COMPACTION, compact_history
+from .intent import fast_path, compare_with_model
+from .lazy import Lazy
+from .links import SHORT_LINK_BASE_URL, SHORT_LINKS, create_redirect_app, short_links
+from .prompt_budget import apply_prompt_budget, record_cached_tokens
+from .response_cache import lookup_response, store_response
+from .rewrite import rewrite_tree, iter_strings
+from .scanner import GcsUrlScanner
+from .telemetry import (
+    log_event,
+    timed_span,
+    record_cache,
+    added_tokens,
+    signing_duration,
+    start_tool,
+    finish_tool,
+)
+from .signing import (
+    signed_url_cache,
+    sign_concurrently,
+    get_local_signer,
+    SIGNED_URL_EXPIRATION_SECONDS,
+)
+
 
 instruction = os.getenv("IMAGEN_INSTRUCTION")
 bucket_name = os.getenv("GENMEDIA_BUCKET")
@@ -22,158 +46,273 @@ sa_email = os.getenv("GOOGLE_CLOUD_SA_EMAIL")
 def before_model(
     callback_context: CallbackContext, llm_request: LlmRequest
 ) -> Optional[LlmResponse]:
-    print(f"[Before Model callback] {callback_context.agent_name}")
-    if (
-        llm_request.contents
-        and llm_request.contents[-1].role == "user"
-        and llm_request.contents[-1].parts
-        and llm_request.contents[-1].parts[0].text
-    ):
-        llm_request.contents[-1].parts[0].text = (
-            instruction + "\n\n" + llm_request.contents[-1].parts[0].text
+    # 指示はユーザーのメッセージに毎回付け足さず、システム指示に一度だけ入れてキャッシュさせる
+    tokens = apply_prompt_budget(llm_request, instruction)
+    if tokens:
+        added_tokens.record(tokens, {"agent": callback_context.agent_name})
+        log_event(
+            "before_model", agent=callback_context.agent_name, added_tokens=tokens
+        )
+
+    # 過去のターンの署名付き URL や古いツール応答を縮め、毎ターン払う入力トークンを減らす
+    if compacted := compact_history(llm_request):
+        before, after = compacted
+        log_event(
+            "history_compacted",
+            agent=callback_context.agent_name,
+            tokens_before=before,
+            tokens_after=after,
+        )
+
+    # あいさつやできることの確認には Gemini を呼ばずにテンプレートで答える (GENMEDIA_FAST_PATH)
+    intent, response = fast_path(llm_request, callback_context.invocation_id)
+    if intent:
+        log_event(
+            "fast_path",
+            agent=callback_context.agent_name,
+            intent=intent.label,
+            confidence=round(intent.confidence, 3),
+            answered=response is not None,
+        )
+    if response is None:
+        # 同じ会話の出だしには、キャッシュしておいた応答をそのまま返す (GENMEDIA_LLM_CACHE)
+        # キャッシュの応答は gs:// URI のままで、after_model も呼ばれないため、ここで署名する
+        response = lookup_response(llm_request, callback_context.invocation_id)
+        if response is not None:
+            response = sign_response_text(response) or response
+    return response
+
+
+def after_model(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> Optional[LlmResponse]:
+    store_response(llm_response, callback_context.invocation_id)
+    if cached := record_cached_tokens(llm_response):
+        log_event(
+            "after_model", agent=callback_context.agent_name, cached_tokens=cached
+        )
+    if shadow := compare_with_model(llm_response, callback_context.invocation_id):
+        intent, agreed = shadow
+        log_event(
+            "fast_path_shadow",
+            agent=callback_context.agent_name,
+            intent=intent.label,
+            agreed=agreed,
         )
+
+    # 履歴の圧縮で gs:// URI に戻したアセットをモデルが改めて案内する場合に備え、署名し直す
+    if HISTORY_COMPACTION and not llm_response.partial:
+        return sign_response_text(llm_response)
     return None
 
 
-def after_tool(
-    tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Dict
+def sign_response_text(llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """
+    モデルの応答テキストに含まれる GCS パスを署名付き URL に置換する
+    置換するものがなければ None を返す
+    """
+    content = llm_response.content
+    if not content or not content.parts:
+        return None
+    parts = []
+    for part in content.parts:
+        if part.text and not part.thought:
+            text = replace_gcs_paths_with_signed_urls(part.text)
+            if text is not part.text:
+                part = part.model_copy(update={"text": text})
+        parts.append(part)
+    if all(new is old for new, old in zip(parts, content.parts)):
+        return None
+    return llm_response.model_copy(
+        update={"content": content.model_copy(update={"parts": parts})}
+    )
+
+
+def before_tool(
+    tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext
 ) -> Optional[Dict]:
-    print(f"[After Tool callback] Tool '{tool.name}' in '{tool_context.agent_name}'")
-    if tool_response:
-        print(f"[After Tool callback] Response '{tool_response}'")
-        modified = replace_values_recursively(
-            tool_response,
-            replace_gcs_paths_with_signed_urls,
-            ignore_keys={"status"},
-        )
-        print(f"[After Tool callback] Modified '{modified}'")
-        return modified
+    start_tool(tool_context.function_call_id)
     return None
 
 
-# GCS に作られたファイルに署名 URL を割り当てる
-# 署名にはサービスアカウントの鍵が必要になるため、ローカル環境では成り代わりが必要
-credentials, _ = google.auth.default()
-if sa_email:
-    credentials = impersonated_credentials.Credentials(
-        source_credentials=credentials,
-        target_principal=sa_email,
-        target_scopes=["https://www.googleapis.com/auth/devstorage.read_write"],
+def after_tool(
+    tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Dict
+) -> Optional[Dict]:
+    seconds = finish_tool(tool_context.function_call_id, tool.name)
+    if not tool_response:
+        return None
+
+    # 応答全体からパスを集めて一度に並行署名し、その結果で置換する
+    keys = collect_gcs_objects(tool_response, {"status"})
+    log_event(
+        "tool_response",
+        tool=tool.name,
+        agent=tool_context.agent_name,
+        seconds=round(seconds, 3) if seconds is not None else None,
+        status=tool_response.get("status") if isinstance(tool_response, dict) else None,
+        gcs_objects=len(keys),
+    )
+    if not keys:
+        return None
+    signed_urls = asset_urls(keys)
+    return replace_values_recursively(
+        tool_response,
+        lambda text: replace_gcs_paths_with_signed_urls(text, signed_urls),
+        ignore_keys={"status"},
     )
-try:
-    storage_client = storage.Client(credentials=credentials)
-except Exception as e:
-    storage_client = None
-    print(f"Error initializing GCS client: {e}")
 
 
-def parse_gcs_path(path: str, bucket_name: str) -> tuple[str | None, str | None]:
-    """
-    gs://bucket/path/to/obj や https://.../bucket/path/to/obj といった
-    文字列を (bucket_name, object_name) に分割する
-    """
-    initial_object_name = None
-    parsed_bucket_name = None
+# GCS に作られたファイルに署名 URL を割り当てる
+# 署名にはサービスアカウントの鍵が必要になるため、ローカル環境では成り代わりが必要
+# 認証情報の探索やクライアントの生成は、起動を遅くしないよう初回利用時まで遅延させる
+def _init_storage():
+    credentials, _ = google.auth.default()
+    if sa_email:
+        credentials = impersonated_credentials.Credentials(
+            source_credentials=credentials,
+            target_principal=sa_email,
+            target_scopes=["https://www.googleapis.com/auth/devstorage.read_write"],
+        )
+    try:
+        storage_client = storage.Client(credentials=credentials)
+    except Exception as e:
+        storage_client = None
+        log_event("gcs_client_init_failed", logging.ERROR, error=str(e))
+    return credentials, storage_client
 
-    if path.startswith(f"gs://{bucket_name}/"):
-        initial_object_name = path.replace(f"gs://{bucket_name}/", "")
-        parsed_bucket_name = bucket_name
 
-    elif path.startswith("https://"):
-        try:
-            path = urlparse(path).path
+_storage = Lazy(_init_storage)
 
-            bucket_search_key = f"/{bucket_name}/"
-            bucket_start_index = path.find(bucket_search_key)
 
-            if bucket_start_index != -1:
-                object_start_index = bucket_start_index + len(bucket_search_key)
-                initial_object_name = path[object_start_index:]
-                parsed_bucket_name = bucket_name
-        except (ValueError, IndexError):
-            pass
+# 応答に含まれる GCS 参照を検出するスキャナ (正規表現は読み込み時に一度だけコンパイルされる)
+scanner = GcsUrlScanner()
 
-    if initial_object_name:
-        pattern = re.compile(r"(.*?\.jpeg|.*?\.png|.*?\.mp4)")
-        match = pattern.search(initial_object_name)
-        if match:
-            valid_object_name = match.group(1)
-            return parsed_bucket_name, valid_object_name
 
-    return None, None
+def parse_gcs_path(path: str, bucket_name: str) -> tuple[str | None, str | None]:
+    """
+    gs://bucket/path/to/obj や https://storage.googleapis.com/bucket/path/to/obj といった
+    文字列を (bucket_name, object_name) に分割する
+    """
+    return GcsUrlScanner([bucket_name]).parse(path)
 
 
 def generate_signed_url_for_path(gcs_path: str, bucket_name: str) -> str | None:
     """
     GCS パス文字列から署名付き URL を生成
     """
-    if not storage_client:
-        print("GCS client is not initialized.")
-        return None
-
     bucket_name, object_name = parse_gcs_path(gcs_path, bucket_name)
     if not bucket_name or not object_name:
-        print(f"Could not parse GCS path: {gcs_path}")
+        log_event("gcs_path_unparsable", logging.WARNING, path=gcs_path)
+        return None
+    return generate_signed_url_for_object(bucket_name, object_name)
+
+
+def generate_signed_url_for_object(bucket_name: str, object_name: str) -> str | None:
+    """
+    バケット名とオブジェクト名から署名付き URL を生成
+    """
+    # 同じアセットはセッション中に何度も現れるため、有効期間が十分残っていれば使い回す
+    cached = signed_url_cache.get(bucket_name, object_name, "GET")
+    if cached:
+        record_cache("signed_url", "hit")
+        return cached
+    record_cache("signed_url", "miss")
+
+    try:
+        credentials, storage_client = _storage.get()
+    except Exception as e:
+        log_event("credentials_init_failed", logging.ERROR, error=str(e))
+        return None
+    if not storage_client:
+        log_event("gcs_client_missing", logging.ERROR)
         return None
 
+    gcs_path = f"gs://{bucket_name}/{object_name}"
     try:
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(object_name)
 
+        # 鍵ファイルがあればローカルで署名し、なければ IAM の signBlob API に署名させる
+        signer = get_local_signer()
+        if signer:
+            signing_args = {"credentials": signer}
+        else:
+            signing_args = {"service_account_email": credentials.service_account_email}
+
+        started = time.perf_counter()
         signed_url = blob.generate_signed_url(
             method="GET",
             version="v4",
-            service_account_email=credentials.service_account_email,
-            expiration=datetime.timedelta(minutes=5),
+            expiration=datetime.timedelta(seconds=SIGNED_URL_EXPIRATION_SECONDS),
+            **signing_args,
+        )
+        signing_duration.record(
+            time.perf_counter() - started, {"backend": "local" if signer else "iam"}
+        )
+        signed_url_cache.put(
+            bucket_name, object_name, "GET", signed_url, SIGNED_URL_EXPIRATION_SECONDS
         )
         return signed_url
 
     except exceptions.NotFound:
-        print(f"Object not found: {gcs_path}")
+        log_event("gcs_object_not_found", logging.WARNING, path=gcs_path)
         return None
     except Exception as e:
-        print(f"Failed to generate signed URL for {gcs_path}: {e}")
+        log_event("signing_failed", logging.ERROR, path=gcs_path, error=str(e))
         return None
 
 
-def replace_gcs_paths_with_signed_urls(text: str) -> str:
+def sign_objects(keys) -> Dict[tuple[str, str], str | None]:
     """
-    文字列内の GCS パスを検出し、署名付き URL に置換
+    複数の (bucket_name, object_name) を並行して署名し、署名付き URL への対応を返す
+    """
+    keys = list(keys)
+    with timed_span("gcs.sign_objects", objects=len(keys)):
+        return sign_concurrently(keys, lambda key: generate_signed_url_for_object(*key))
+
+
+def asset_urls(keys) -> Dict[tuple[str, str], str | None]:
+    """
+    (bucket_name, object_name) ごとにユーザーへ渡す URL を返す
+    短縮リンクが設定されていればそれを発行し、署名はリンクが開かれるまで遅らせる (links.short_link_problem)
     """
-    url_pattern = re.compile(r"(gs://[^ \n\r\t]+|https://[^ \n\r\t]+)")
+    if SHORT_LINKS:
+        return short_links(keys, SHORT_LINK_BASE_URL)
+    return sign_objects(keys)
 
-    def replacer(match):
-        original_path = match.group(0)
-        signed_url = generate_signed_url_for_path(original_path, bucket_name)
-        return signed_url if signed_url else original_path
 
-    return url_pattern.sub(replacer, text)
+# 短縮リンクのリダイレクタ (ASGI)。media_agent.server が /m にマウントする
+redirect_app = create_redirect_app(generate_signed_url_for_object)
+
+
+def replace_gcs_paths_with_signed_urls(
+    text: str, signed_urls: Optional[Dict[tuple[str, str], str | None]] = None
+) -> str:
+    """
+    文字列内の GCS パスを検出し、署名付き URL に置換
+    signed_urls が与えられなければ、文字列内のパスをまとめて並行に署名してから置換する
+    """
+    matches = scanner.scan(text)
+    if signed_urls is None:
+        signed_urls = asset_urls(m.key for m in matches)
+    return scanner.rewrite(text, matches, lambda m: signed_urls.get(m.key))
 
 
 def replace_values_recursively(obj, replacement_func, ignore_keys=None):
     """
     辞書やリストの値を再帰的にたどり、文字列に対して置換関数を適用する
+    変更のあったコンテナだけをコピーし、何も変わらなければ obj をそのまま返す
+    巨大な文字列や base64 のようなバイナリは置換の対象にしない
+    """
+    return rewrite_tree(obj, replacement_func, ignore_keys or ())
+
+
+def collect_gcs_objects(obj, ignore_keys=None) -> list[tuple[str, str]]:
+    """
+    辞書やリストを再帰的にたどり、文字列に含まれる GCS オブジェクトを集める
     """
-    if ignore_keys is None:
-        ignore_keys = set()
-
-    if isinstance(obj, dict):
-        new_dict = {}
-        for key, value in obj.items():
-            if key in ignore_keys:
-                new_dict[key] = value
-            else:
-                new_dict[key] = replace_values_recursively(
-                    value, replacement_func, ignore_keys
-                )
-        return new_dict
-
-    elif isinstance(obj, list):
-        return [
-            replace_values_recursively(item, replacement_func, ignore_keys)
-            for item in obj
-        ]
-    elif isinstance(obj, str):
-        return replacement_func(obj)
-    else:
-        return obj
+    return [
+        match.key
+        for text in iter_strings(obj, ignore_keys or ())
+        for match in scanner.scan(text)
+    ]
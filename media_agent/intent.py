@@ -0,0 +1,288 @@
+import os
+import re
+import math
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from .lazy import Lazy
+from .telemetry import intent_predictions, intent_agreement
+
+
+# before_model での即答 (fast path) のモード
+#   off:    分類しない
+#   shadow: 分類して LLM の応答との一致率だけを記録する (応答は常に LLM)
+#   on:     確信度がしきい値以上なら Gemini を呼ばずにテンプレートで応答する
+FAST_PATH = os.getenv("GENMEDIA_FAST_PATH", "shadow")
+FAST_PATH_THRESHOLD = float(os.getenv("GENMEDIA_FAST_PATH_THRESHOLD", "0.85"))
+# これより長いメッセージは依頼の可能性が高いため分類しない
+FAST_PATH_MAX_CHARS = int(os.getenv("GENMEDIA_FAST_PATH_MAX_CHARS", "40"))
+
+GREETING = "greeting"
+CAPABILITIES = "capabilities"
+CLARIFY = "clarify"
+GENERATE = "generate"
+OTHER = "other"
+
+# テンプレートで応答できる意図
+ANSWERABLE = frozenset({GREETING, CAPABILITIES, CLARIFY})
+
+TEMPLATES = {
+    GREETING: (
+        "こんにちは！自社メディア向けの画像や動画の作成をお手伝いします。"
+        "どのような画像・動画を作りましょうか？"
+    ),
+    CAPABILITIES: (
+        "自社メディアコンテンツの作成をお手伝いできます。\n"
+        "- 画像の生成 (Imagen): 作りたい画像の内容を教えてください。\n"
+        "- 動画の生成 (Veo): 参照画像をもとに短い動画を作ります。1 分ほどかかることがあります。\n"
+        "生成した画像や動画は、アクセス用の URL でお渡しします。"
+    ),
+    CLARIFY: "画像と動画、どちらを作成しましょうか？",
+}
+
+_IMAGE_WORDS = r"画像|絵|イラスト|写真|ポスター|バナー|アイコン|image|picture|photo|illustration"
+_VIDEO_WORDS = r"動画|映像|ビデオ|ムービー|アニメーション|video|movie|clip|animation"
+_MEDIA = re.compile(f"{_IMAGE_WORDS}|{_VIDEO_WORDS}")
+_CREATE = re.compile(r"作って|作成|生成|つくって|描いて|お願い|create|make|generate|draw")
+_CAPABILITIES = re.compile(
+    r"(何|なに|どんなこと)が?でき|できること|使い方|機能|ヘルプ|help|what can you"
+)
+_GREETING = re.compile(
+    r"((こんにちは|こんにちわ|こんばんは|おはよう(ございます)?|はじめまして|よろしく(お願いします)?"
+    r"|どうも|やあ|hello|hi|hey|good (morning|afternoon|evening))\s?)+"
+)
+_PUNCTUATION = re.compile(r"[!！?？。、,.~〜・…「」\"']+")
+_SPACES = re.compile(r"\s+")
+
+# 文字 n-gram のナイーブベイズを学習する例文
+EXAMPLES: Tuple[Tuple[str, str], ...] = (
+    (GREETING, "こんにちは"),
+    (GREETING, "こんばんは"),
+    (GREETING, "おはようございます"),
+    (GREETING, "はじめまして"),
+    (GREETING, "よろしくお願いします"),
+    (GREETING, "どうもこんにちは"),
+    (GREETING, "やあ"),
+    (GREETING, "hello"),
+    (GREETING, "hi there"),
+    (GREETING, "good morning"),
+    (CAPABILITIES, "何ができますか"),
+    (CAPABILITIES, "なにができるの"),
+    (CAPABILITIES, "できることを教えて"),
+    (CAPABILITIES, "どんなことができますか"),
+    (CAPABILITIES, "使い方を教えてください"),
+    (CAPABILITIES, "どんな機能がありますか"),
+    (CAPABILITIES, "あなたは何者ですか"),
+    (CAPABILITIES, "ヘルプ"),
+    (CAPABILITIES, "what can you do"),
+    (CAPABILITIES, "help"),
+    (CLARIFY, "何か作って"),
+    (CLARIFY, "猫を作って"),
+    (CLARIFY, "海の景色を生成して"),
+    (CLARIFY, "新商品の素材をお願い"),
+    (CLARIFY, "夏っぽいのを作成して"),
+    (CLARIFY, "コンテンツを作ってほしい"),
+    (CLARIFY, "かわいい犬でお願いします"),
+    (CLARIFY, "make something cool"),
+    (CLARIFY, "create a sunset"),
+    (GENERATE, "猫の画像を作って"),
+    (GENERATE, "海辺の動画を生成して"),
+    (GENERATE, "夕焼けの写真を3枚"),
+    (GENERATE, "犬が走る動画をお願いします"),
+    (GENERATE, "ロゴのイラストを描いて"),
+    (GENERATE, "バナー画像を作成して"),
+    (GENERATE, "この画像を動画にして"),
+    (GENERATE, "generate an image of a cat"),
+    (GENERATE, "make a video of the sea"),
+    (OTHER, "今日の天気は"),
+    (OTHER, "ありがとう"),
+    (OTHER, "さっきの動画はどうなった"),
+    (OTHER, "URL が開けません"),
+    (OTHER, "もう一度お願いします"),
+    (OTHER, "翻訳して"),
+    (OTHER, "株価を教えて"),
+    (OTHER, "thanks"),
+)
+
+
+class Intent(NamedTuple):
+    label: str
+    confidence: float
+
+
+def normalize(text: str) -> str:
+    """NFKC で正規化して小文字にし、句読点を取り除いて空白をまとめる"""
+    text = _PUNCTUATION.sub(" ", unicodedata.normalize("NFKC", text).lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+def _ngrams(text: str, sizes: Iterable[int] = (1, 2, 3)) -> List[str]:
+    padded = f"^{text}$"
+    return [padded[i : i + n] for n in sizes for i in range(len(padded) - n + 1)]
+
+
+class NgramClassifier:
+    """
+    A multinomial naive Bayes classifier over character 1- to 3-grams.
+
+    Character n-grams need no tokenizer, so Japanese and English messages are
+    handled alike. Training on the few dozen EXAMPLES takes well under a
+    millisecond and prediction is a dictionary lookup per n-gram.
+    """
+
+    def __init__(self, examples: Iterable[Tuple[str, str]]):
+        self._counts: Dict[str, Counter] = {}
+        docs: Counter = Counter()
+        for label, text in examples:
+            self._counts.setdefault(label, Counter()).update(_ngrams(normalize(text)))
+            docs[label] += 1
+        total = sum(docs.values())
+        self._priors = {label: math.log(n / total) for label, n in docs.items()}
+        self._totals = {label: sum(c.values()) for label, c in self._counts.items()}
+        self._vocabulary = len(set().union(*self._counts.values()))
+
+    def predict(self, text: str) -> Dict[str, float]:
+        """Returns the posterior probability of each label."""
+        grams = _ngrams(text)
+        scores = {}
+        for label, counts in self._counts.items():
+            denominator = self._totals[label] + self._vocabulary
+            scores[label] = self._priors[label] + sum(
+                math.log((counts[g] + 1) / denominator) for g in grams
+            )
+        top = max(scores.values())
+        exp = {label: math.exp(s - top) for label, s in scores.items()}
+        total = sum(exp.values())
+        return {label: v / total for label, v in exp.items()}
+
+
+_model = Lazy(lambda: NgramClassifier(EXAMPLES))
+
+
+def _rule(text: str) -> Optional[str]:
+    if _CAPABILITIES.search(text):
+        return CAPABILITIES
+    if _MEDIA.search(text):
+        return GENERATE
+    if _GREETING.fullmatch(text):
+        return GREETING
+    if _CREATE.search(text):
+        return CLARIFY
+    return None
+
+
+def classify(text: Optional[str]) -> Intent:
+    """
+    Classifies a user message without calling a model.
+
+    The n-gram model's posterior is blended with the keyword rules: when a
+    rule fires, the confidence is the mean of the rule's vote (1.0) and the
+    model's probability for that label, so a rule alone never clears a
+    threshold above 0.5 unless the model leans the same way. Messages longer
+    than FAST_PATH_MAX_CHARS are reported as OTHER.
+    """
+    text = normalize(text or "")
+    if not text or len(text) > FAST_PATH_MAX_CHARS:
+        return Intent(OTHER, 0.0)
+    posterior = _model.get().predict(text)
+    label = _rule(text)
+    if label is None:
+        label = max(posterior, key=posterior.get)
+        return Intent(label, posterior[label])
+    return Intent(label, (1.0 + posterior.get(label, 0.0)) / 2)
+
+
+def _user_text(llm_request: LlmRequest) -> Optional[str]:
+    """Returns the text of the latest user message, or None after a tool result."""
+    if not llm_request.contents:
+        return None
+    content = llm_request.contents[-1]
+    if content.role != "user" or not content.parts:
+        return None
+    if any(part.function_response for part in content.parts):
+        return None
+    return "".join(part.text for part in content.parts if part.text) or None
+
+
+def _opening_turn(llm_request: LlmRequest) -> bool:
+    """Whether the request has no model turn or tool call before the latest message."""
+    return not any(
+        content.role != "user"
+        or any(part.function_call or part.function_response for part in content.parts or ())
+        for content in llm_request.contents
+    )
+
+
+# shadow モードで LLM の応答と突き合わせるまでの予測 (invocation_id ごと)
+_PENDING_LIMIT = 1024
+_pending: "OrderedDict[str, Intent]" = OrderedDict()
+_pending_lock = threading.Lock()
+
+
+def fast_path(
+    llm_request: LlmRequest, invocation_id: str, mode: str = FAST_PATH
+) -> Tuple[Optional[Intent], Optional[LlmResponse]]:
+    """
+    Classifies the latest user message of a request.
+
+    Only the opening message of a conversation is classified: later ones
+    such as "同じのを作って" or "OK お願い" refer to earlier turns, which a
+    single message cannot tell apart from a vague request.
+
+    Returns:
+        A tuple of (intent, response). The intent is None when nothing was
+        classified. The response answers the message from TEMPLATES and is
+        only set in "on" mode for an answerable intent whose confidence is
+        at least FAST_PATH_THRESHOLD; otherwise the request goes to the model.
+    """
+    if mode not in ("on", "shadow"):
+        return None, None
+    text = _user_text(llm_request)
+    if text is None or not _opening_turn(llm_request):
+        return None, None
+    intent = classify(text)
+    confident = intent.label in ANSWERABLE and intent.confidence >= FAST_PATH_THRESHOLD
+    if mode == "on" and confident:
+        intent_predictions.add(1, {"intent": intent.label, "action": "answered"})
+        return intent, LlmResponse(
+            content=types.Content(
+                role="model", parts=[types.Part(text=TEMPLATES[intent.label])]
+            )
+        )
+    action = "shadow" if mode == "shadow" and confident else "passed"
+    intent_predictions.add(1, {"intent": intent.label, "action": action})
+    if action == "shadow":
+        with _pending_lock:
+            _pending[invocation_id] = intent
+            while len(_pending) > _PENDING_LIMIT:
+                _pending.popitem(last=False)
+    return intent, None
+
+
+def compare_with_model(
+    llm_response: LlmResponse, invocation_id: str
+) -> Optional[Tuple[Intent, bool]]:
+    """
+    Compares a shadow prediction with the model's answer to the same message.
+
+    The model agrees when it answered with text only; calling a tool means
+    it treated the message as a generation request.
+
+    Returns:
+        A tuple of (intent, agreed), or None without a pending prediction.
+    """
+    if llm_response.partial:
+        return None
+    with _pending_lock:
+        intent = _pending.pop(invocation_id, None)
+    if intent is None:
+        return None
+    parts = (llm_response.content and llm_response.content.parts) or []
+    agreed = not any(part.function_call for part in parts)
+    intent_agreement.add(1, {"intent": intent.label, "agreed": agreed})
+    return intent, agreed
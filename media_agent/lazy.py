@@ -0,0 +1,38 @@
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Lazy(Generic[T]):
+    """
+    A thread-safe holder that builds its value on first use.
+
+    Credentials, clients and toolsets are expensive to create and may need the
+    network, so modules keep them in a Lazy instead of building them at import
+    time. The factory runs at most once; if it raises, the next call retries.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    self._value = self._factory()
+                    self._ready = True
+        return self._value
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+            self._ready = False
@@ -0,0 +1,249 @@
+import os
+import hmac
+import time
+import logging
+import base64
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple
+
+from .lazy import Lazy
+from .telemetry import log_event, record_cache
+
+
+# 短縮リンクの発行元 (リダイレクタを /m にマウントしたサーバの URL)。未設定なら従来どおり署名付き URL を返す
+# 短縮リンクを発行するには、鍵 (GENMEDIA_SHORT_LINK_SECRET) と保存先 (GENMEDIA_SHORT_LINK_DB) も必要
+SHORT_LINK_BASE_URL = os.getenv("GENMEDIA_SHORT_LINK_BASE_URL", "").rstrip("/")
+SHORT_LINK_PREFIX = "/m/"
+# 発行したリンクを覚えておく期間 (秒) と件数
+SHORT_LINK_TTL_SECONDS = float(os.getenv("GENMEDIA_SHORT_LINK_TTL_SECONDS", "604800"))
+SHORT_LINK_CACHE_SIZE = int(os.getenv("GENMEDIA_SHORT_LINK_CACHE_SIZE", "4096"))
+# リンクを保存する SQLite のパス。発行したワーカーとリンクを開いたワーカーが共有できる場所に置く
+SHORT_LINK_DB_PATH = os.getenv("GENMEDIA_SHORT_LINK_DB")
+# ID を導く鍵。リンクを発行・解決するすべてのプロセスで共通の値を設定する
+SHORT_LINK_SECRET = os.getenv("GENMEDIA_SHORT_LINK_SECRET", "")
+# ブラウザがリダイレクト先を覚えておいてよい秒数 (署名付き URL の有効期限より十分短く)
+SHORT_LINK_REDIRECT_MAX_AGE = int(
+    os.getenv("GENMEDIA_SHORT_LINK_REDIRECT_MAX_AGE", "60")
+)
+
+ObjectKey = Tuple[str, str]
+
+
+def link_id(bucket: str, object_name: str, secret: str = SHORT_LINK_SECRET) -> str:
+    """
+    Returns the opaque id of an object: 22 URL-safe characters of an HMAC.
+
+    The same object always gets the same id, so a session that mentions an
+    asset twice shows one link, and ids cannot be guessed without the secret.
+    """
+    message = f"{bucket}/{object_name}".encode("utf-8")
+    digest = hmac.new(secret.encode("utf-8"), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).rstrip(b"=").decode("ascii")
+
+
+class LinkStore(Protocol):
+    """Maps link ids to the GCS objects they point to."""
+
+    def get(self, link: str) -> Optional[ObjectKey]: ...
+
+    def put(self, link: str, key: ObjectKey) -> None: ...
+
+
+class MemoryLinkStore:
+    """A bounded in-process LRU store whose entries expire after `ttl` seconds."""
+
+    def __init__(
+        self,
+        max_size: int = SHORT_LINK_CACHE_SIZE,
+        ttl: float = SHORT_LINK_TTL_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[ObjectKey, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, link: str) -> Optional[ObjectKey]:
+        with self._lock:
+            entry = self._entries.get(link)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[link]
+                return None
+            self._entries.move_to_end(link)
+            return entry[0]
+
+    def put(self, link: str, key: ObjectKey) -> None:
+        with self._lock:
+            self._entries[link] = (key, self._clock() + self.ttl)
+            self._entries.move_to_end(link)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SqliteLinkStore:
+    """A store in a local SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path: str, ttl: float = SHORT_LINK_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS links (link TEXT PRIMARY KEY, "
+                "bucket TEXT NOT NULL, object TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, link: str) -> Optional[ObjectKey]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bucket, object FROM links WHERE link = ? AND expires_at > ?",
+                (link, time.time()),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, link: str, key: ObjectKey) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?)",
+                (link, key[0], key[1], now + self.ttl),
+            )
+            self._conn.execute("DELETE FROM links WHERE expires_at <= ?", (now,))
+
+
+def short_link_problem(
+    base_url: str = SHORT_LINK_BASE_URL,
+    secret: str = SHORT_LINK_SECRET,
+    db_path: Optional[str] = SHORT_LINK_DB_PATH,
+) -> Optional[str]:
+    """
+    Returns why short links cannot be issued with these settings, or None.
+
+    A link is issued by whichever worker signs a response and opened on
+    whichever worker serves the redirect, so both the secret and the store
+    must be shared: a per-process secret or an in-memory store would turn
+    links into 404s after a restart or on another worker.
+    """
+    if not base_url:
+        return "GENMEDIA_SHORT_LINK_BASE_URL is not set"
+    if not secret:
+        return "GENMEDIA_SHORT_LINK_SECRET is not set"
+    if not db_path:
+        return "GENMEDIA_SHORT_LINK_DB is not set"
+    return None
+
+
+# 設定が揃っていなければ短縮リンクは使わず、従来どおり署名付き URL を返す
+_problem = short_link_problem()
+if SHORT_LINK_BASE_URL and _problem:
+    log_event("short_links_disabled", logging.WARNING, reason=_problem)
+SHORT_LINKS = _problem is None
+
+
+def _create_link_store() -> LinkStore:
+    if SHORT_LINK_DB_PATH:
+        return SqliteLinkStore(SHORT_LINK_DB_PATH)
+    return MemoryLinkStore()
+
+
+# SQLite のファイルは import 時ではなく、最初にリンクを発行・解決するときに開く
+_link_store: Lazy[LinkStore] = Lazy(_create_link_store)
+
+
+def short_links(
+    keys, base_url: str = SHORT_LINK_BASE_URL, store: Optional[LinkStore] = None
+) -> Dict[ObjectKey, str]:
+    """
+    Issues a short link for each (bucket, object) without signing anything.
+
+    The link's target is signed only when somebody opens it, by the app from
+    `create_redirect_app`. `store` defaults to the one at GENMEDIA_SHORT_LINK_DB.
+    """
+    if store is None:
+        store = _link_store.get()
+    links = {}
+    for key in keys:
+        if key in links:
+            continue
+        link = link_id(*key)
+        store.put(link, key)
+        links[key] = f"{base_url}{SHORT_LINK_PREFIX}{link}"
+    return links
+
+
+async def _respond(send, status: int, headers: Dict[str, str], body: bytes = b""):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (k.encode("latin-1"), v.encode("latin-1"))
+                for k, v in dict(headers, **{"content-length": str(len(body))}).items()
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_redirect_app(
+    sign: Callable[[str, str], Optional[str]], store: Optional[LinkStore] = None
+) -> Callable[..., Awaitable[None]]:
+    """
+    Returns an ASGI app that redirects `GET /m/<id>` to a signed GCS URL.
+
+    `sign(bucket, object)` returns a signed URL or None; it runs in a worker
+    thread and is expected to cache its URLs, so repeated clicks on the same
+    asset within the URL's lifetime are not signed again. Only the last path
+    segment is read, so the app works mounted at /m or served on its own.
+    Unknown or expired ids get 404, signing failures 502. `store` defaults
+    to the one at GENMEDIA_SHORT_LINK_DB, opened on the first request.
+    """
+
+    async def app(scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await _respond(send, 405, {"allow": "GET, HEAD"})
+            return
+
+        link = scope["path"].rstrip("/").rsplit("/", 1)[-1]
+        key = (store if store is not None else _link_store.get()).get(link)
+        if key is None:
+            record_cache("short_link", "miss")
+            await _respond(send, 404, {"content-type": "text/plain"}, b"not found")
+            return
+        record_cache("short_link", "hit")
+        url = await asyncio.to_thread(sign, *key)
+        if not url:
+            log_event(
+                "short_link_sign_failed", logging.WARNING, bucket=key[0], object=key[1]
+            )
+            await _respond(send, 502, {"content-type": "text/plain"}, b"bad gateway")
+            return
+        await _respond(
+            send,
+            302,
+            {
+                "location": url,
+                "cache-control": f"private, max-age={SHORT_LINK_REDIRECT_MAX_AGE}",
+                "referrer-policy": "no-referrer",
+            },
+        )
+
+    return app
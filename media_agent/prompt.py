@@ -12,7 +12,7 @@ PROMPT = """
    **特に veo_i2v を利用するに限っては 1 分ほど時間を要することも** 応答した上で
 4. 適切なツールに英語で指示しつつ、ユーザーから頼まれた画像や動画を生成してください。
 5. ユーザへの応答は日本語で、生成した動画像へのアクセス URL を含めてください。
-    URL には X-Goog-Algorithm といったクエリパラメタが付属しているはずですが
+    URL には X-Goog-Algorithm といったクエリパラメタや、短縮リンクの ID が含まれていますが
     これは **絶対に一切省略せず、一文字たりとも変更せずに** 応答に含めてください。
 
 veo_i2v を使う時、image_uri パラメタにはユーザーから明示的に指定されない限り
@@ -27,12 +27,18 @@ imagen_t2i で作った画像ではなく {reference_image_uri} を指定して
 3. 依頼が動画像の生成なら、まずはいったん作業に着手する旨を応答した上で
 4. 適切なツールに英語で指示しつつ、ユーザーから頼まれた画像や動画を生成してください。
 5. ユーザへの応答は日本語で、生成した画像へのアクセス URL を含めてください。
-    URL には X-Goog-Algorithm といったクエリパラメタが付属しているはずですが
+    URL には X-Goog-Algorithm といったクエリパラメタや、短縮リンクの ID が含まれていますが
     これは **絶対に一切省略せず、一文字たりとも変更せずに** 応答に含めてください。
 
 veo_i2v を使う時、image_uri パラメタにはユーザーから明示的に指定されない限り
 imagen_t2i で作った画像ではなく {reference_image_uri} を指定してください。
 
+複数のバリエーションを頼まれた場合は、ツールを何度も呼び出さずに
+imagen_t2i_batch や veo_i2v_batch で一度にまとめて生成してください。
+同じ内容で作り直してほしいと明示された場合に限り force_new を true にしてください。
+veo_i2v はすぐに job_id を返すので、続けて get_media_job にその job_id を渡して動画を受け取ってください。
+status が running の間は get_media_job を繰り返し呼び出してください。
+
 また veo_i2v に渡す prompt は以下のベストプラクティスに従った英文としてください。
 
 <veo_i2v に渡す promp のヒント>
@@ -0,0 +1,89 @@
+import os
+from typing import Optional
+
+from google.adk.agents.context_cache_config import ContextCacheConfig
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from .telemetry import estimate_tokens, tokens_saved
+
+
+# 静的なプレフィックス (システム指示とツール定義) を Gemini のコンテキストキャッシュに載せるか
+CONTEXT_CACHE = os.getenv("GENMEDIA_CONTEXT_CACHE", "on") != "off"
+# キャッシュの TTL (秒) と、何回の呼び出しごとに作り直すか
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GENMEDIA_CONTEXT_CACHE_TTL_SECONDS", "1800"))
+CONTEXT_CACHE_INTERVALS = int(os.getenv("GENMEDIA_CONTEXT_CACHE_INTERVALS", "10"))
+# 直前のリクエストのトークン数がこれ未満ならキャッシュしない (Gemini 2.5 がキャッシュできる最小のトークン数)
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GENMEDIA_CONTEXT_CACHE_MIN_TOKENS", "2048"))
+
+# ADK はアプリ (App) に設定されたときだけキャッシュを作るため、各エージェントの App に渡す
+context_cache_config = (
+    ContextCacheConfig(
+        cache_intervals=CONTEXT_CACHE_INTERVALS,
+        ttl_seconds=CONTEXT_CACHE_TTL_SECONDS,
+        min_tokens=CONTEXT_CACHE_MIN_TOKENS,
+    )
+    if CONTEXT_CACHE
+    else None
+)
+
+
+def _strip_injected(content: types.Content, prefix: str) -> Optional[types.Content]:
+    """
+    Returns a copy of a user content without `prefix` at the start of its
+    first text part, or None when it has none. Copying keeps the session's
+    own history untouched.
+    """
+    if content.role != "user" or not content.parts:
+        return None
+    part = content.parts[0]
+    if not part.text or not part.text.startswith(prefix):
+        return None
+    stripped = part.model_copy(update={"text": part.text[len(prefix) :]})
+    return content.model_copy(update={"parts": [stripped, *content.parts[1:]]})
+
+
+def apply_prompt_budget(llm_request: LlmRequest, instruction: Optional[str]) -> int:
+    """
+    Puts `instruction` into the system instruction once, so that it is part
+    of the static prefix that the context cache holds.
+
+    The instruction is appended only when the system instruction does not
+    already contain it, so calling this again on the same request is a no-op.
+    Copies of the instruction that earlier versions prepended to user
+    messages are removed from the request's history. Caching itself is
+    enabled by passing `context_cache_config` to the agent's App: ADK's
+    Gemini context cache manager then creates the cached content, refreshes
+    it every CONTEXT_CACHE_INTERVALS calls or when the prefix changes, and
+    lets it expire after CONTEXT_CACHE_TTL_SECONDS.
+
+    Returns:
+        The estimated number of tokens added to the system instruction.
+    """
+    added = 0
+    if instruction:
+        system_instruction = llm_request.config.system_instruction
+        if not isinstance(system_instruction, str) or instruction not in system_instruction:
+            llm_request.append_instructions([instruction])
+            added = estimate_tokens(instruction)
+
+        prefix = instruction + "\n\n"
+        stripped = 0
+        for i, content in enumerate(llm_request.contents):
+            if (copy := _strip_injected(content, prefix)) is not None:
+                llm_request.contents[i] = copy
+                stripped += 1
+        if stripped:
+            tokens_saved.record(
+                stripped * estimate_tokens(prefix), {"source": "deduplicated"}
+            )
+    return added
+
+
+def record_cached_tokens(llm_response: LlmResponse) -> int:
+    """Records and returns the prompt tokens served from the context cache."""
+    usage = llm_response.usage_metadata
+    cached = (usage.cached_content_token_count or 0) if usage else 0
+    if cached:
+        tokens_saved.record(cached, {"source": "context_cache"})
+    return cached
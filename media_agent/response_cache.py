@@ -0,0 +1,222 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.models import LlmRequest, LlmResponse
+
+from .compaction import unsign_urls
+from .telemetry import record_cache, llm_cache_saved_seconds
+
+
+# LLM の応答キャッシュ (opt-in): on / off
+LLM_CACHE = os.getenv("GENMEDIA_LLM_CACHE", "off") == "on"
+LLM_CACHE_SIZE = int(os.getenv("GENMEDIA_LLM_CACHE_SIZE", "256"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("GENMEDIA_LLM_CACHE_TTL_SECONDS", "600"))
+
+# 副作用のないツール。これ以外のツール呼び出しを含む履歴はキャッシュしない
+SIDE_EFFECT_FREE_TOOLS = frozenset({"get_media_job"})
+
+# 署名付き URL のクエリ (X-Goog-Algorithm など) は発行のたびに変わるため、キーから外す
+_SIGNED_QUERY = re.compile(r"\?[^\s\"'<>]*X-Goog-[^\s\"'<>]*")
+# 呼び出しごとに変わる ID や署名
+_VOLATILE_FIELDS = frozenset({"id", "thought_signature"})
+
+CacheEntry = Tuple[LlmResponse, float, float]
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: _strip_volatile(v) for k, v in value.items() if k not in _VOLATILE_FIELDS
+        }
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def _has_side_effects(llm_request: LlmRequest) -> bool:
+    for content in llm_request.contents:
+        for part in content.parts or ():
+            call = part.function_call
+            if call and call.name not in SIDE_EFFECT_FREE_TOOLS:
+                return True
+    return False
+
+
+def request_key(llm_request: LlmRequest) -> Optional[str]:
+    """
+    Returns a SHA-256 hash of a request's model, system instruction, tools,
+    generation settings and normalized contents, or None when the request
+    must not be served from the cache.
+
+    Function call ids, thought signatures and the query strings of signed
+    URLs are left out, since they change on every call without changing the
+    conversation. Requests whose history contains a call to a tool outside
+    SIDE_EFFECT_FREE_TOOLS get no key: replaying the answer to such a
+    history would skip over work the tool actually did.
+    """
+    if not llm_request.contents or _has_side_effects(llm_request):
+        return None
+    config = llm_request.config.model_dump(
+        mode="json",
+        exclude_none=True,
+        exclude={"tools", "http_options", "labels", "cached_content"},
+    )
+    payload = json.dumps(
+        [
+            llm_request.model,
+            sorted(llm_request.tools_dict),
+            config,
+            [
+                _strip_volatile(c.model_dump(mode="json", exclude_none=True))
+                for c in llm_request.contents
+            ],
+        ],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    payload = _SIGNED_QUERY.sub("", payload)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cacheable(llm_response: LlmResponse) -> bool:
+    """Only complete, successful answers with content are stored."""
+    return bool(
+        not llm_response.partial
+        and not llm_response.error_code
+        and llm_response.content
+        and llm_response.content.parts
+    )
+
+
+class LlmResponseCache:
+    """
+    A bounded, thread-safe LRU cache of model responses with a TTL.
+
+    Each entry remembers how long the model took to produce it, so a hit can
+    report the latency it saved. Responses are copied on the way in and out,
+    because ADK fills in ids and metadata on the objects it is handed, and
+    stored without usage metadata so replays are not billed twice in reports.
+    Signed URLs in the text are stored as the gs:// URIs of their objects,
+    since they expire long before an entry might; a hit must be signed
+    again before it reaches the user.
+    """
+
+    def __init__(
+        self,
+        max_size: int = LLM_CACHE_SIZE,
+        ttl: float = LLM_CACHE_TTL_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "saved_seconds": 0.0,
+        }
+
+    def get(self, key: str) -> Optional[Tuple[LlmResponse, float]]:
+        """Returns a copy of a fresh response and the seconds it took, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= self._clock():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            response, seconds, _ = entry
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += seconds
+        return response.model_copy(deep=True), seconds
+
+    def put(self, key: str, response: LlmResponse, seconds: float) -> None:
+        stored = response.model_copy(deep=True, update={"usage_metadata": None})
+        for part in stored.content.parts:
+            # 関数呼び出しの ID は再生のたびに ADK が振り直す
+            if part.function_call:
+                part.function_call.id = None
+            if part.text:
+                part.text = unsign_urls(part.text)
+        with self._lock:
+            self._entries[key] = (stored, seconds, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the counters, the hit rate and the current size."""
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+llm_response_cache = LlmResponseCache()
+
+# 応答待ちのリクエストのキーと開始時刻 (invocation_id ごと)。after_model が呼ばれなかった分は古い順に捨てる
+_PENDING_LIMIT = 1024
+_pending: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_pending_lock = threading.Lock()
+
+
+def lookup_response(
+    llm_request: LlmRequest, invocation_id: str, enabled: bool = LLM_CACHE
+) -> Optional[LlmResponse]:
+    """
+    Returns a cached response for `llm_request`, or None.
+
+    On a miss the request's key is remembered under `invocation_id`, so that
+    `store_response` can cache the model's answer together with its latency.
+    """
+    if not enabled:
+        return None
+    key = request_key(llm_request)
+    if key is None:
+        record_cache("llm_response", "bypass")
+        return None
+    cached = llm_response_cache.get(key)
+    if cached is not None:
+        response, seconds = cached
+        record_cache("llm_response", "hit")
+        llm_cache_saved_seconds.record(seconds)
+        response.custom_metadata = dict(response.custom_metadata or {}, llm_cache="hit")
+        return response
+    record_cache("llm_response", "miss")
+    with _pending_lock:
+        _pending[invocation_id] = (key, time.perf_counter())
+        while len(_pending) > _PENDING_LIMIT:
+            _pending.popitem(last=False)
+    return None
+
+
+def store_response(llm_response: LlmResponse, invocation_id: str) -> bool:
+    """Caches the model's answer to the request looked up last in the invocation."""
+    if llm_response.partial:
+        return False
+    with _pending_lock:
+        pending = _pending.pop(invocation_id, None)
+    if pending is None or not cacheable(llm_response):
+        return False
+    key, started = pending
+    llm_response_cache.put(key, llm_response, time.perf_counter() - started)
+    return True
@@ -0,0 +1,58 @@
+import os
+import json
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from google.adk.cli.fast_api import get_fast_api_app
+
+from .callbacks import redirect_app
+from .links import SHORT_LINK_PREFIX, SHORT_LINKS
+from .streaming import follow_progress
+
+
+# adk web と同じく、このパッケージを含むディレクトリのエージェントをすべて提供する
+AGENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 開発用の Web UI (/dev-ui) も提供するか: on / off
+SERVE_WEB_UI = os.getenv("GENMEDIA_SERVE_WEB_UI", "on") != "off"
+
+
+def add_progress_route(app: FastAPI) -> None:
+    """
+    Adds `GET /progress/{key}`, a server-sent event stream of the progress of
+    a veo_i2v call (by its function call id, as seen in /run_sse) or of a job
+    (by its job id). The stream ends with the success or error event.
+    """
+
+    @app.get("/progress/{key}")
+    async def stream_progress(key: str) -> StreamingResponse:
+        async def events():
+            async for progress in follow_progress(key):
+                yield f"data: {json.dumps(progress, ensure_ascii=False)}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def create_app(**kwargs) -> FastAPI:
+    """
+    Returns ADK's API server (the one behind `adk web` and `adk api_server`)
+    with the routes of this agent added. `kwargs` go to get_fast_api_app.
+
+    When short links are configured (see links.short_link_problem), the
+    redirector that resolves them is mounted at /m.
+    """
+    kwargs.setdefault("web", SERVE_WEB_UI)
+    app = get_fast_api_app(agents_dir=AGENTS_DIR, **kwargs)
+    add_progress_route(app)
+    if SHORT_LINKS:
+        app.mount(SHORT_LINK_PREFIX.rstrip("/"), redirect_app)
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        create_app(session_service_uri=os.getenv("ADK_SESSION_SERVICE_URI")),
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+    )
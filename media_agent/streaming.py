@@ -0,0 +1,121 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Collection, Dict
+
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.genai import types
+
+from .tools.progress import progress_hub
+
+
+# 進捗を流すツール (long-running)
+PROGRESS_TOOLS = frozenset({"veo_i2v"})
+# 投入したジョブの進捗を、終わる (成功か失敗) まで追いかける最大の秒数
+PROGRESS_FOLLOW_SECONDS = float(os.getenv("GENMEDIA_PROGRESS_FOLLOW_SECONDS", "900"))
+
+_DONE = object()
+
+
+async def follow_progress(
+    key: str, timeout: float = PROGRESS_FOLLOW_SECONDS
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields the progress of `key` (a function call id or a job id) until a
+    terminal event, or until `timeout` seconds have passed.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    events = progress_hub.subscribe(key)
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(
+                    anext(events), max(0.0, deadline - loop.time())
+                )
+            except (StopAsyncIteration, asyncio.TimeoutError):
+                return
+    finally:
+        await events.aclose()
+
+
+async def run_with_progress(
+    runner: Runner,
+    *,
+    user_id: str,
+    session_id: str,
+    new_message: types.Content,
+    progress_tools: Collection[str] = PROGRESS_TOOLS,
+    follow_seconds: float = PROGRESS_FOLLOW_SECONDS,
+) -> AsyncIterator[Event]:
+    """
+    Runs `runner.run_async` and yields its events interleaved with progress
+    events of long-running tool calls.
+
+    As soon as the model calls one of `progress_tools`, the progress that the
+    tool publishes under its function call id (queued, submitted, running
+    with the elapsed time, and the URIs once ready) is yielded as partial
+    events carrying `custom_metadata["progress"]`. Partial events are neither
+    stored in the session nor sent to the model, so progress never adds LLM
+    turns.
+
+    A submitted Veo job outlives the run that started it, so after the last
+    event of the run the stream stays open until every such call reaches
+    success or error, or `follow_seconds` have passed. Calls that published
+    no progress, such as ones answered from a cache, are not waited for.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    watchers: Dict[str, asyncio.Task] = {}
+
+    async def forward_progress(event: Event, call: types.FunctionCall) -> None:
+        async for progress in follow_progress(call.id, follow_seconds):
+            await queue.put(
+                Event(
+                    invocation_id=event.invocation_id,
+                    author=event.author,
+                    branch=event.branch,
+                    partial=True,
+                    custom_metadata={
+                        "progress": dict(
+                            progress, tool=call.name, function_call_id=call.id
+                        )
+                    },
+                )
+            )
+
+    async def follow_jobs() -> None:
+        # ツールは応答を返す前に進捗を出すため、ここで進捗のない呼び出しは以後も出さない
+        for call_id, watcher in watchers.items():
+            if not progress_hub.latest(call_id):
+                watcher.cancel()
+        pending = [watcher for watcher in watchers.values() if not watcher.done()]
+        if pending:
+            await asyncio.wait(pending)
+
+    async def forward_events() -> None:
+        try:
+            async for event in runner.run_async(
+                user_id=user_id, session_id=session_id, new_message=new_message
+            ):
+                for call in event.get_function_calls():
+                    if call.name in progress_tools and call.id:
+                        watchers[call.id] = asyncio.create_task(
+                            forward_progress(event, call)
+                        )
+                await queue.put(event)
+            await follow_jobs()
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(_DONE)
+
+    runner_task = asyncio.create_task(forward_events())
+    try:
+        while (item := await queue.get()) is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        runner_task.cancel()
+        for watcher in watchers.values():
+            watcher.cancel()
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from opentelemetry import metrics, trace
+
+
+# INFO 以下の構造化ログを出す割合 (0〜1)。WARNING 以上は常に出力する
+TELEMETRY_LOG_SAMPLE_RATE = float(os.getenv("TELEMETRY_LOG_SAMPLE_RATE", "0.1"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+tracer = trace.get_tracer("genmedia")
+meter = metrics.get_meter("genmedia")
+
+logger = logging.getLogger("genmedia")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+# --- Instruments ---
+tool_duration = meter.create_histogram(
+    "genmedia.tool.duration", unit="s", description="Wall time of a tool call"
+)
+veo_queue_time = meter.create_histogram(
+    "genmedia.veo.queue_time",
+    unit="s",
+    description="Time a Veo request waited for admission before it was submitted",
+)
+veo_poll_time = meter.create_histogram(
+    "genmedia.veo.poll_time",
+    unit="s",
+    description="Time from acceptance until the Veo operation finished",
+)
+veo_poll_count = meter.create_histogram(
+    "genmedia.veo.poll_count", unit="1", description="Polls per Veo operation"
+)
+signing_duration = meter.create_histogram(
+    "genmedia.signing.duration",
+    unit="s",
+    description="Latency of signing one GCS object (cache misses only)",
+)
+cache_lookups = meter.create_counter(
+    "genmedia.cache.lookups", unit="1", description="Cache lookups by cache and result"
+)
+added_tokens = meter.create_histogram(
+    "genmedia.before_model.added_tokens",
+    unit="{token}",
+    description="Estimated tokens before_model added to a request",
+)
+tokens_saved = meter.create_histogram(
+    "genmedia.prompt.tokens_saved",
+    unit="{token}",
+    description="Prompt tokens saved per request by deduplication, compaction "
+    "or the context cache",
+)
+history_tokens = meter.create_histogram(
+    "genmedia.history.input_tokens",
+    unit="{token}",
+    description="Estimated input tokens of a request's contents, before and after "
+    "compaction",
+)
+admission_queue_depth = meter.create_up_down_counter(
+    "genmedia.admission.queue_depth",
+    unit="{request}",
+    description="Requests waiting for admission per model",
+)
+admission_rejections = meter.create_counter(
+    "genmedia.admission.rejections",
+    unit="{request}",
+    description="Requests rejected after waiting past the admission deadline",
+)
+retries = meter.create_counter(
+    "genmedia.retries", unit="{retry}", description="Retries of transient API errors"
+)
+routing_decisions = meter.create_counter(
+    "genmedia.router.decisions",
+    unit="{request}",
+    description="Model routing decisions by family, chosen model and reason",
+)
+llm_cache_saved_seconds = meter.create_histogram(
+    "genmedia.llm_cache.saved_seconds",
+    unit="s",
+    description="Model latency saved by a hit in the LLM response cache",
+)
+intent_predictions = meter.create_counter(
+    "genmedia.intent.predictions",
+    unit="{message}",
+    description="Fast-path intent predictions by intent and action taken",
+)
+intent_agreement = meter.create_counter(
+    "genmedia.intent.shadow_agreement",
+    unit="{message}",
+    description="Shadow predictions by whether the model answered without tools too",
+)
+coalesced_calls = meter.create_counter(
+    "genmedia.singleflight.coalesced",
+    unit="{call}",
+    description="Duplicate calls attached to an identical in-flight operation",
+)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    A cheap token estimate: about four ASCII characters per token, and one
+    token per non-ASCII character (Japanese text is close to that).
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def record_cache(cache: str, result: str) -> None:
+    """Counts one lookup; `result` is "hit", "miss" or "bypass"."""
+    cache_lookups.add(1, {"cache": cache, "result": result})
+
+
+@contextmanager
+def timed_span(
+    name: str, histogram=None, **attributes: Any
+) -> Iterator[trace.Span]:
+    """
+    Runs the block in a span and, when `histogram` is given, records the
+    block's wall time in it with the same attributes.
+    """
+    started = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            if histogram is not None:
+                histogram.record(time.perf_counter() - started, attributes)
+
+
+def log_event(event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """
+    Writes one JSON log line. Events below WARNING are sampled at
+    TELEMETRY_LOG_SAMPLE_RATE, so the hot path stays cheap.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING and random.random() >= TELEMETRY_LOG_SAMPLE_RATE:
+        return
+    span_context = trace.get_current_span().get_span_context()
+    record: Dict[str, Any] = {"event": event, "severity": logging.getLevelName(level)}
+    if span_context.is_valid:
+        record["trace_id"] = format(span_context.trace_id, "032x")
+    record.update(fields)
+    logger.log(level, json.dumps(record, ensure_ascii=False, default=str))
+
+
+# ツール呼び出しの開始時刻 (function_call_id ごと)。after_tool が呼ばれなかった分は古い順に捨てる
+_TOOL_STARTS_LIMIT = 1024
+_tool_starts: Dict[str, float] = {}
+_tool_starts_lock = threading.Lock()
+
+
+def start_tool(call_id: Optional[str]) -> None:
+    if not call_id:
+        return
+    with _tool_starts_lock:
+        if len(_tool_starts) >= _TOOL_STARTS_LIMIT:
+            _tool_starts.pop(next(iter(_tool_starts)))
+        _tool_starts[call_id] = time.perf_counter()
+
+
+def finish_tool(call_id: Optional[str], tool_name: str) -> Optional[float]:
+    """Records the wall time since `start_tool` and returns it in seconds."""
+    with _tool_starts_lock:
+        started = _tool_starts.pop(call_id, None) if call_id else None
+    if started is None:
+        return None
+    elapsed = time.perf_counter() - started
+    tool_duration.record(elapsed, {"tool": tool_name})
+    return elapsed
+
+
+_configured = False
+
+
+def configure_telemetry() -> None:
+    """
+    Exports spans and metrics over OTLP/HTTP when OTEL_EXPORTER_OTLP_ENDPOINT
+    is set. Otherwise whatever the hosting runtime configured (for example
+    AdkApp's tracing) is left alone.
+    """
+    global _configured
+    if _configured or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return
+    _configured = True
+
+    from opentelemetry.exporter.otlp.proto.http.metric_exporter import (
+        OTLPMetricExporter,
+    )
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(tracer_provider)
+    metrics.set_meter_provider(
+        MeterProvider(metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter())])
+    )
+
+
+def use_in_memory_exporters() -> Tuple[Any, Any]:
+    """
+    Installs SDK providers that keep spans and metrics in memory, for tests
+    and benchmarks. Returns (span_exporter, metric_reader); read them with
+    `span_exporter.get_finished_spans()` and `metric_reader.get_metrics_data()`.
+    OpenTelemetry only lets the global providers be set once per process.
+    """
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    span_exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    trace.set_tracer_provider(tracer_provider)
+
+    metric_reader = InMemoryMetricReader()
+    metrics.set_meter_provider(MeterProvider(metric_readers=[metric_reader]))
+    return span_exporter, metric_reader
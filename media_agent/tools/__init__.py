@@ -1,4 +1,19 @@
-from .genmedia import veo_i2v, imagen_t2i
+from google.adk.tools.long_running_tool import LongRunningFunctionTool
 
+from .genmedia import (
+    veo_i2v,
+    imagen_t2i,
+    veo_i2v_batch,
+    imagen_t2i_batch,
+    get_media_job,
+)
 
-genmedia_tools = [veo_i2v, imagen_t2i]
+
+# veo_i2v は投入後すぐに返り、進捗は progress_hub に流れる
+genmedia_tools = [
+    LongRunningFunctionTool(veo_i2v),
+    imagen_t2i,
+    veo_i2v_batch,
+    imagen_t2i_batch,
+    get_media_job,
+]
@@ -0,0 +1,277 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from google import genai
+from google.api_core import exceptions
+
+from ..telemetry import admission_queue_depth, admission_rejections, retries
+
+
+# モデルごとの 1 分あたりのリクエスト数の上限と、同時に実行できる Veo の long-running operation 数
+# ここはファミリーごとの既定値で、モデルごとに GENMEDIA_<モデル>_RPM / _MAX_OPERATIONS で上書きできる
+# 例: GENMEDIA_VEO_3_0_FAST_GENERATE_001_RPM=20
+VEO_RPM = float(os.getenv("GENMEDIA_VEO_RPM", "10"))
+IMAGEN_RPM = float(os.getenv("GENMEDIA_IMAGEN_RPM", "60"))
+VEO_MAX_OPERATIONS = int(os.getenv("GENMEDIA_VEO_MAX_OPERATIONS", "4"))
+
+# 受け付けを待てる最大の秒数。これを超えると混雑として断る
+ADMISSION_TIMEOUT = float(os.getenv("GENMEDIA_ADMISSION_TIMEOUT", "30"))
+# 同時実行数の空きを確認する間隔 (秒)
+ADMISSION_POLL_SECONDS = 0.05
+
+# 一時的なエラー (429 / 5xx) を再試行する回数と、指数バックオフの基準・上限 (秒)
+RETRY_ATTEMPTS = int(os.getenv("GENMEDIA_RETRY_ATTEMPTS", "4"))
+RETRY_BASE_SECONDS = float(os.getenv("GENMEDIA_RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("GENMEDIA_RETRY_MAX_SECONDS", "30"))
+
+TRANSIENT_CODES = frozenset({429, 500, 502, 503, 504})
+
+T = TypeVar("T")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request could not be admitted before its deadline."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"{model} is busy; retry after {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `rate_per_minute`, holding at most
+    `burst` tokens.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst if burst is not None else max(1.0, rate_per_minute / 6)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class AdmissionController:
+    """
+    Admits requests to one model in FIFO order.
+
+    Each request needs a token from the model's token bucket and, when
+    `max_operations` is set, a free operation slot. A slot stays taken until
+    `release()` is called, which for Veo is when its long-running operation
+    finishes. Requests that cannot be admitted within `timeout` seconds are
+    rejected with AdmissionRejected instead of being sent to Vertex AI.
+
+    Waiting polls shared state instead of using asyncio primitives, so one
+    controller works across event loops and threads.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        rate_per_minute: float,
+        max_operations: Optional[int] = None,
+        timeout: float = ADMISSION_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.model = model
+        self.bucket = TokenBucket(rate_per_minute, clock=clock)
+        self.max_operations = max_operations
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._queue: deque = deque()
+        self._operations = 0
+
+    @property
+    def operations(self) -> int:
+        return self._operations
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _try_admit(self, ticket: object) -> float:
+        """Returns 0 when `ticket` was admitted, otherwise how long to wait."""
+        with self._lock:
+            if self._queue[0] is not ticket:
+                return ADMISSION_POLL_SECONDS
+            if self.max_operations and self._operations >= self.max_operations:
+                return ADMISSION_POLL_SECONDS
+            wait = self.bucket.try_take()
+            if wait:
+                return wait
+            self._queue.popleft()
+            if self.max_operations:
+                self._operations += 1
+            return 0.0
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        """Waits for admission. Raises AdmissionRejected after `timeout` seconds."""
+        deadline = self._clock() + (self.timeout if timeout is None else timeout)
+        ticket = object()
+        attributes = {"model": self.model}
+        with self._lock:
+            self._queue.append(ticket)
+        admission_queue_depth.add(1, attributes)
+        try:
+            while True:
+                wait = self._try_admit(ticket)
+                if not wait:
+                    return
+                remaining = deadline - self._clock()
+                if remaining <= 0 or wait == float("inf"):
+                    with self._lock:
+                        self._queue.remove(ticket)
+                    admission_rejections.add(1, attributes)
+                    raise AdmissionRejected(self.model, max(wait, ADMISSION_POLL_SECONDS))
+                await asyncio.sleep(min(wait, remaining))
+        except asyncio.CancelledError:
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+            raise
+        finally:
+            admission_queue_depth.add(-1, attributes)
+
+    def occupy(self) -> None:
+        """Takes an operation slot without waiting, e.g. for a resumed operation."""
+        if self.max_operations:
+            with self._lock:
+                self._operations += 1
+
+    def release(self) -> None:
+        """Frees the operation slot taken by `acquire` or `occupy`."""
+        if self.max_operations:
+            with self._lock:
+                self._operations = max(0, self._operations - 1)
+
+
+_controllers: Dict[str, AdmissionController] = {}
+_controllers_lock = threading.Lock()
+
+
+def model_env_name(model: str, setting: str) -> str:
+    """Returns the env var of a per-model setting, e.g. GENMEDIA_VEO_3_0_GENERATE_001_RPM."""
+    return f"GENMEDIA_{re.sub(r'[^0-9A-Za-z]+', '_', model).upper()}_{setting}"
+
+
+def _setting(model: str, setting: str, default: T) -> T:
+    value = os.getenv(model_env_name(model, setting))
+    return type(default)(value) if value else default
+
+
+def get_controller(model: str) -> AdmissionController:
+    """
+    Returns the process-wide controller for `model`, creating it from the env
+    settings. Vertex AI quotas are per model, so every model id gets its own
+    token bucket and, for Veo, its own operation cap. The limits default to
+    those of the model's family and can be overridden per model.
+    """
+    with _controllers_lock:
+        controller = _controllers.get(model)
+        if controller is None:
+            if model.startswith("veo"):
+                controller = AdmissionController(
+                    model,
+                    _setting(model, "RPM", VEO_RPM),
+                    _setting(model, "MAX_OPERATIONS", VEO_MAX_OPERATIONS),
+                )
+            else:
+                controller = AdmissionController(model, _setting(model, "RPM", IMAGEN_RPM))
+            _controllers[model] = controller
+        return controller
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    if isinstance(e, genai.errors.APIError):
+        return e.code
+    if isinstance(e, exceptions.GoogleAPICallError):
+        return e.code
+    return None
+
+
+def is_transient(e: Exception) -> bool:
+    """True for rate limiting and server-side errors that are worth retrying."""
+    if isinstance(e, (exceptions.RetryError, AdmissionRejected)):
+        return False
+    return _status_code(e) in TRANSIENT_CODES
+
+
+_RETRY_DELAY = re.compile(r"^(\d+(?:\.\d+)?)s$")
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    """
+    Returns the delay the server asked for, from a Retry-After header or a
+    google.rpc.RetryInfo detail, or None.
+    """
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    details = getattr(e, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", {}).get("details", [])
+    for detail in details if isinstance(details, list) else []:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if delay and (m := _RETRY_DELAY.match(str(delay))):
+            return float(m.group(1))
+    return None
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[T]],
+    model: str,
+    attempts: int = RETRY_ATTEMPTS,
+    base: float = RETRY_BASE_SECONDS,
+    cap: float = RETRY_MAX_SECONDS,
+) -> T:
+    """
+    Runs `call`, retrying transient errors with full-jitter exponential backoff.
+    A server-provided retry delay is honoured when it is longer.
+    """
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            delay = random.uniform(0, min(cap, base * 2**attempt))
+            delay = max(delay, min(cap, retry_after(e) or 0))
+            retries.add(1, {"model": model, "code": _status_code(e)})
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
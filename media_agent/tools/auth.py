@@ -1,103 +1,282 @@
+import os
+import re
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
 from datetime import datetime, timedelta, timezone
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 import google.auth
+import requests
 from google.auth.exceptions import GoogleAuthError
-from google.auth.transport.requests import AuthorizedSession, Request
+from google.auth.transport.requests import Request
 from google.oauth2 import id_token
 
+from ..telemetry import log_event
+
 # --- Constants ---
 BEARER_TOKEN_PREFIX = "Bearer "
 CACHE_REFRESH_MARGIN = timedelta(seconds=60)
 DEFAULT_CLOCK_SKEW = 0
+# Tokens this close to CACHE_REFRESH_MARGIN are still served, but a refresh
+# is started in the background so callers never wait on the token endpoint.
+REFRESH_AHEAD = timedelta(
+    seconds=int(os.getenv("ID_TOKEN_REFRESH_AHEAD_SECONDS", "300"))
+)
 
-_token_cache: Dict[str, Any] = {
-    "token": None,
-    "expires_at": datetime.min.replace(tzinfo=timezone.utc),
-}
+_NEVER = datetime.min.replace(tzinfo=timezone.utc)
+_MAX_AGE = re.compile(r"max-age=(\d+)")
 
 
-def _is_token_valid() -> bool:
-    """Checks if the cached token exists and is not nearing expiry."""
-    if not _token_cache["token"]:
-        return False
-    return datetime.now(timezone.utc) < (
-        _token_cache["expires_at"] - CACHE_REFRESH_MARGIN
-    )
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
 
 
-def _update_cache(new_token: str, clock_skew_in_seconds: int) -> None:
+class CachingRequest(Request):
     """
-    Validates a new token, extracts its expiry, and updates the cache.
-
-    Args:
-        new_token: The new JWT ID token string.
+    A transport that caches successful GET responses per URL.
 
-    Raises:
-        ValueError: If the token is invalid or its expiry cannot be determined.
+    Responses are kept for as long as their `Cache-Control: max-age` (minus
+    `Age`) allows, so verifying a token does not download Google's public
+    signing certificates every time. Everything else is passed through.
     """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        clock: Callable[[], datetime] = _utcnow,
+    ):
+        super().__init__(session)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._responses: Dict[str, Tuple[Any, datetime]] = {}
+
+    def __call__(self, url, method="GET", body=None, headers=None, **kwargs):
+        if method != "GET" or body is not None:
+            return super().__call__(url, method, body, headers, **kwargs)
+
+        with self._lock:
+            cached = self._responses.get(url)
+        if cached and self._clock() < cached[1]:
+            return cached[0]
+
+        response = super().__call__(url, method, body, headers, **kwargs)
+        max_age = _max_age(response.headers) if response.status == 200 else 0
+        if max_age > 0:
+            with self._lock:
+                self._responses[url] = (
+                    response,
+                    self._clock() + timedelta(seconds=max_age),
+                )
+        return response
+
+
+def _max_age(headers) -> int:
+    """Returns the remaining freshness lifetime in seconds from HTTP headers."""
+    match = _MAX_AGE.search(headers.get("Cache-Control", "") or "")
+    if not match:
+        return 0
     try:
-        # verify_oauth2_token not only decodes but also validates the token's
-        # signature and claims against Google's public keys.
-        # It's a synchronous, CPU-bound operation, safe for async contexts.
-        claims = id_token.verify_oauth2_token(
-            new_token, Request(), clock_skew_in_seconds=clock_skew_in_seconds
-        )
+        age = int(headers.get("Age", 0) or 0)
+    except ValueError:
+        age = 0
+    return int(match.group(1)) - age
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token: Optional[str] = None
+        self.expires_at: datetime = _NEVER
+        self.refreshing: Optional[Future] = None
+
+
+class IdTokenManager:
+    """
+    Caches Google ID tokens per audience and refreshes them single-flight.
+
+    Each audience gets its own cache entry. When several callers miss at the
+    same time only one of them fetches and verifies a new token, and the
+    others wait for that result. A token inside the REFRESH_AHEAD window is
+    still returned while a refresh runs in the background.
+    """
+
+    def __init__(self, clock: Callable[[], datetime] = _utcnow):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[Optional[str], _Entry] = {}
+        self._credentials = None
+        self._credentials_lock = threading.Lock()
+        self._session = requests.Session()
+        self._certs_request = CachingRequest(self._session, clock)
+
+    def _entry(self, audience: Optional[str]) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(audience)
+            if entry is None:
+                entry = self._entries[audience] = _Entry()
+            return entry
+
+    def _acquire(
+        self, audience: Optional[str], clock_skew_in_seconds: int
+    ) -> Union[str, Future]:
+        """Returns the cached token, or the future of the refresh to wait on."""
+        if clock_skew_in_seconds < 0 or clock_skew_in_seconds > 60:
+            raise ValueError(
+                f"Illegal clock_skew_in_seconds value: {clock_skew_in_seconds}. Must be between 0 and 60"
+                ", inclusive."
+            )
+        entry = self._entry(audience)
+        now = self._clock()
+        with entry.lock:
+            if entry.token and now < entry.expires_at - CACHE_REFRESH_MARGIN:
+                if now >= entry.expires_at - CACHE_REFRESH_MARGIN - REFRESH_AHEAD:
+                    self._start_refresh(entry, audience, clock_skew_in_seconds)
+                return entry.token
+            return self._start_refresh(entry, audience, clock_skew_in_seconds)
+
+    def _start_refresh(
+        self, entry: _Entry, audience: Optional[str], clock_skew_in_seconds: int
+    ) -> Future:
+        # entry.lock is held by the caller
+        if entry.refreshing is None:
+            entry.refreshing = Future()
+            threading.Thread(
+                target=self._refresh,
+                args=(entry, entry.refreshing, audience, clock_skew_in_seconds),
+                daemon=True,
+            ).start()
+        return entry.refreshing
+
+    def _refresh(
+        self,
+        entry: _Entry,
+        future: Future,
+        audience: Optional[str],
+        clock_skew_in_seconds: int,
+    ) -> None:
+        try:
+            token, expires_at = self._fetch(audience, clock_skew_in_seconds)
+        except Exception as e:
+            with entry.lock:
+                entry.refreshing = None
+                if not entry.token or self._clock() >= (
+                    entry.expires_at - CACHE_REFRESH_MARGIN
+                ):
+                    # Clear cache on failure to prevent using a stale or invalid token
+                    entry.token = None
+                    entry.expires_at = _NEVER
+                else:
+                    log_event(
+                        "id_token_refresh_failed",
+                        logging.ERROR,
+                        audience=audience,
+                        error=str(e),
+                    )
+            future.set_exception(e)
+            return
+        with entry.lock:
+            entry.token = token
+            entry.expires_at = expires_at
+            entry.refreshing = None
+        future.set_result(token)
+
+    def _fetch(
+        self, audience: Optional[str], clock_skew_in_seconds: int
+    ) -> Tuple[str, datetime]:
+        request = Request(self._session)
 
-        expiry_timestamp = claims.get("exp")
-        if not expiry_timestamp:
-            raise ValueError("Token does not contain an 'exp' claim.")
+        # Get local user credentials
+        with self._credentials_lock:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default()
+            credentials = self._credentials
+            credentials.refresh(request)
+            new_token = getattr(credentials, "id_token", None)
 
-        _token_cache["token"] = new_token
-        _token_cache["expires_at"] = datetime.fromtimestamp(
-            expiry_timestamp, tz=timezone.utc
-        )
+        if not new_token:
+            if audience is None:
+                raise Exception("You are not authenticating using User Credentials.")
+            # Get credentials for Google Cloud environments or for service account key files
+            try:
+                new_token = id_token.fetch_id_token(request, audience)
+            except GoogleAuthError as e:
+                raise GoogleAuthError(
+                    f"Failed to fetch Google ID token for audience '{audience}': {e}"
+                ) from e
+        return new_token, self._verify(new_token, clock_skew_in_seconds)
 
-    except (ValueError, GoogleAuthError) as e:
-        # Clear cache on failure to prevent using a stale or invalid token
-        _token_cache["token"] = None
-        _token_cache["expires_at"] = datetime.min.replace(tzinfo=timezone.utc)
-        raise ValueError(f"Failed to validate and cache the new token: {e}") from e
+    def _verify(self, new_token: str, clock_skew_in_seconds: int) -> datetime:
+        """
+        Validates a new token and returns its expiry.
+
+        Args:
+            new_token: The new JWT ID token string.
+            clock_skew_in_seconds: The number of seconds to tolerate.
+
+        Raises:
+            ValueError: If the token is invalid or its expiry cannot be determined.
+        """
+        try:
+            # verify_oauth2_token not only decodes but also validates the token's
+            # signature and claims against Google's public keys, which are
+            # served from the caching transport.
+            claims = id_token.verify_oauth2_token(
+                new_token,
+                self._certs_request,
+                clock_skew_in_seconds=clock_skew_in_seconds,
+            )
+            expiry_timestamp = claims.get("exp")
+            if not expiry_timestamp:
+                raise ValueError("Token does not contain an 'exp' claim.")
+            return datetime.fromtimestamp(expiry_timestamp, tz=timezone.utc)
+        except (ValueError, GoogleAuthError) as e:
+            raise ValueError(f"Failed to validate and cache the new token: {e}") from e
+
+    def get_token(
+        self,
+        audience: Optional[str] = None,
+        clock_skew_in_seconds: int = DEFAULT_CLOCK_SKEW,
+    ) -> str:
+        """
+        Returns "Bearer <google_id_token>" for `audience`, blocking on a miss.
+
+        Raises:
+            GoogleAuthError: If fetching credentials or the token fails.
+            ValueError: If the fetched token is invalid.
+        """
+        token = self._acquire(audience, clock_skew_in_seconds)
+        if isinstance(token, Future):
+            token = token.result()
+        return BEARER_TOKEN_PREFIX + token
+
+    async def get_token_async(
+        self,
+        audience: Optional[str] = None,
+        clock_skew_in_seconds: int = DEFAULT_CLOCK_SKEW,
+    ) -> str:
+        """Same as `get_token`, but waits for a refresh without blocking the event loop."""
+        token = self._acquire(audience, clock_skew_in_seconds)
+        if isinstance(token, Future):
+            token = await asyncio.wrap_future(token)
+        return BEARER_TOKEN_PREFIX + token
+
+    def clear(self) -> None:
+        """Drops every cached token and the cached credentials."""
+        with self._lock:
+            self._entries.clear()
+        with self._credentials_lock:
+            self._credentials = None
+
+
+id_token_manager = IdTokenManager()
 
 
 def get_google_token_from_aud(
     clock_skew_in_seconds: int = 0, audience: Optional[str] = None
 ) -> str:
-    if clock_skew_in_seconds < 0 or clock_skew_in_seconds > 60:
-        raise ValueError(
-            f"Illegal clock_skew_in_seconds value: {clock_skew_in_seconds}. Must be between 0 and 60"
-            ", inclusive."
-        )
-
-    if _is_token_valid():
-        return BEARER_TOKEN_PREFIX + _token_cache["token"]
-
-    # Get local user credentials
-    credentials, _ = google.auth.default()
-    session = AuthorizedSession(credentials)
-    request = Request(session)
-    credentials.refresh(request)
-
-    if hasattr(credentials, "id_token"):
-        new_id_token = getattr(credentials, "id_token", None)
-        if new_id_token:
-            _update_cache(new_id_token, clock_skew_in_seconds)
-            return BEARER_TOKEN_PREFIX + new_id_token
-
-    if audience is None:
-        raise Exception("You are not authenticating using User Credentials.")
-
-    # Get credentials for Google Cloud environments or for service account key files
-    try:
-        request = Request()
-        new_token = id_token.fetch_id_token(request, audience)
-        _update_cache(new_token, clock_skew_in_seconds)
-        return BEARER_TOKEN_PREFIX + _token_cache["token"]
-
-    except GoogleAuthError as e:
-        raise GoogleAuthError(
-            f"Failed to fetch Google ID token for audience '{audience}': {e}"
-        ) from e
+    return id_token_manager.get_token(audience, clock_skew_in_seconds)
 
 
 def get_google_id_token(
@@ -107,7 +286,7 @@ def get_google_id_token(
     Returns a SYNC function that, when called, fetches a Google ID token.
     This function uses Application Default Credentials for local systems
     and standard google auth libraries for Google Cloud environments.
-    It caches the token in memory.
+    Tokens are cached in memory per audience by `id_token_manager`.
 
     Args:
         audience: The audience for the ID token (e.g., a service URL or client
@@ -127,3 +306,25 @@ def get_google_id_token(
         return get_google_token_from_aud(clock_skew_in_seconds, audience)
 
     return _token_getter
+
+
+def id_token_header_provider(
+    audience: Optional[str] = None, clock_skew_in_seconds: int = DEFAULT_CLOCK_SKEW
+) -> Callable[[Any], Any]:
+    """
+    Returns an async header provider that builds a fresh Authorization header
+    on every call, suitable for an MCP toolset's `header_provider`.
+
+    Args:
+        audience: The audience for the ID token (e.g., the MCP server origin).
+        clock_skew_in_seconds: The number of seconds to tolerate when checking the token.
+
+    Returns:
+        An async function taking a context and returning {"Authorization": ...}.
+    """
+
+    async def _provider(_context=None) -> Dict[str, str]:
+        token = await id_token_manager.get_token_async(audience, clock_skew_in_seconds)
+        return {"Authorization": token}
+
+    return _provider
@@ -0,0 +1,98 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import google.auth
+from google import genai
+
+from ..lazy import Lazy
+
+
+ClientKey = Tuple[Optional[str], Optional[str], bool]
+
+_clients: Dict[ClientKey, genai.Client] = {}
+_lock = threading.Lock()
+_stats: Dict[str, int] = {"created": 0, "reused": 0}
+
+
+def _adc_project() -> Optional[str]:
+    _, project = google.auth.default()
+    if project:
+        os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project)
+    return project
+
+
+# 認証情報の探索は重いため、ADC にプロジェクトがない (None) 場合も結果を覚えておく
+_adc = Lazy(_adc_project)
+
+
+def _default_project() -> Optional[str]:
+    return os.getenv("GOOGLE_CLOUD_PROJECT") or _adc.get()
+
+
+def _use_vertexai() -> bool:
+    return os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "").lower() in ("1", "true")
+
+
+def get_client(
+    project: Optional[str] = None,
+    location: Optional[str] = None,
+    vertexai: Optional[bool] = None,
+) -> genai.Client:
+    """
+    Returns a process-wide genai.Client for (project, location, vertexai).
+
+    The client is created on first use and shared afterwards, so credential
+    discovery and the underlying HTTP connection pools (keep-alive, TLS) are
+    reused across tool calls and sessions. Both the sync and the `aio`
+    surfaces of the returned client are safe to use concurrently.
+
+    Args:
+        project: Google Cloud project ID. Defaults to GOOGLE_CLOUD_PROJECT.
+        location: Vertex AI location. Defaults to GOOGLE_CLOUD_LOCATION.
+        vertexai: Whether to use Vertex AI. Defaults to GOOGLE_GENAI_USE_VERTEXAI.
+
+    Returns:
+        A shared genai.Client instance.
+    """
+    use_vertexai = _use_vertexai() if vertexai is None else vertexai
+    key: ClientKey = (
+        project or (_default_project() if use_vertexai else None),
+        location or os.getenv("GOOGLE_CLOUD_LOCATION"),
+        use_vertexai,
+    )
+
+    # Fast path without the lock: dict reads are atomic under the GIL.
+    client = _clients.get(key)
+    if client is not None:
+        with _lock:
+            _stats["reused"] += 1
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            project_id, region, use_vertexai = key
+            kwargs: Dict[str, Any] = {"vertexai": use_vertexai}
+            if use_vertexai:
+                kwargs.update(project=project_id, location=region)
+            client = genai.Client(**kwargs)
+            _clients[key] = client
+            _stats["created"] += 1
+        else:
+            _stats["reused"] += 1
+        return client
+
+
+def client_stats() -> Dict[str, int]:
+    """Returns counters of created and reused clients, plus the pool size."""
+    with _lock:
+        return dict(_stats, pooled=len(_clients))
+
+
+def reset_clients() -> None:
+    """Drops every pooled client. Intended for tests and benchmarks."""
+    with _lock:
+        _clients.clear()
+        _stats.update(created=0, reused=0)
+    _adc.reset()
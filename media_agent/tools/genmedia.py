@@ -1,35 +1,267 @@
 import os
 import time
-import mimetypes
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
 
 from google import genai
 from google.adk.tools import ToolContext
 from google.api_core import exceptions
 
+from .admission import AdmissionRejected, get_controller, with_retries
+from .clients import get_client
+from .result_cache import cache_key, cached_generation, lookup
+from .jobs import job_manager, video_uris, RUNNING, SUCCEEDED
+from .preflight import preflight_image
+from .progress import progress_hub, QUEUED, SUCCESS, ERROR
+from ..routing import veo_router, imagen_router
+from ..singleflight import SingleFlight
+from ..telemetry import (
+    timed_span,
+    coalesced_calls,
+    veo_queue_time,
+    veo_poll_time,
+    veo_poll_count,
+)
 
+
+# 既定のモデル。混雑時は routing が高速なモデル (VEO_FAST_MODEL / IMAGEN_FAST_MODEL) に切り替える
 # @see https://cloud.google.com/vertex-ai/generative-ai/docs/model-reference/veo-video-generation#model-versions
-veo_model = "veo-3.0-generate-preview"
+veo_model = veo_router.model
 
 # @see https://cloud.google.com/vertex-ai/generative-ai/docs/model-reference/imagen-api#model-versions
-imagen_model = "imagen-4.0-generate-001"
+imagen_model = imagen_router.model
 
 project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
 location = os.getenv("GOOGLE_CLOUD_LOCATION")
 bucket = os.getenv("GENMEDIA_BUCKET")
 
+# Veo の long-running operation をポーリングする間隔 (秒)
+poll_interval = float(os.getenv("VEO_POLL_INTERVAL", "3"))
+
+# バッチ生成で同時に投げるリクエスト数の上限
+batch_concurrency = int(os.getenv("GENMEDIA_BATCH_CONCURRENCY", "4"))
+
+# 同じリクエストが同時に来たら、生成は 1 回だけ行って結果を共有する
+veo_flights = SingleFlight("veo_i2v")
+imagen_flights = SingleFlight("imagen_t2i")
+
+
+def _normalize_bucket(bucket: str) -> str:
+    if not bucket.startswith("gs://"):
+        bucket = f"gs://{bucket}"
+    if not bucket.endswith("/"):
+        bucket = f"{bucket}/"
+    return bucket
+
+
+def _report_progress(tool_context: ToolContext, response: dict) -> dict:
+    """
+    ツール呼び出しの結果を進捗として通知し、response をそのまま返す
+    投入済みなら、以降はジョブの進捗 (経過時間や URI) が呼び出しに転送される
+    """
+    call_id = tool_context.function_call_id if tool_context else None
+    if not call_id:
+        return response
+    if response.get("job_id"):
+        progress_hub.link(response["job_id"], call_id)
+    elif response.get("uris"):
+        progress_hub.publish(call_id, {"status": SUCCESS, "uris": response["uris"]})
+    else:
+        progress_hub.publish(call_id, {"status": ERROR, "error": response["status"]})
+    return response
+
+
+def _error_status(e: Exception) -> str:
+    if isinstance(e, AdmissionRejected):
+        return (
+            f"混雑しています: {e.model} の受け付け枠に空きがありません。"
+            f"すぐには再試行せず、{e.retry_after:.0f} 秒以上待ってからやり直してください"
+        )
+    if isinstance(e, exceptions.GoogleAPICallError):
+        return f"API 呼び出しでエラーが発生しました: {e}"
+    return f"エラーが発生しました: {e}"
+
+
+async def _submit_videos(
+    prompt: str,
+    image_uri: str,
+    mime_type: str,
+    bucket: str,
+    num_videos: int,
+    aspect_ratio: str,
+    duration: int,
+    model: str,
+):
+    """
+    Veo の動画生成を開始し、long-running operation を返す
+    受け付け (レート制限と同時実行数の枠) を待ってから投入し、一時的なエラーは再試行する
+    確保した operation の枠は、呼び出し側が operation の完了後に release する
+    """
+    config = genai.types.GenerateVideosConfigDict(
+        generate_audio=True,
+        aspect_ratio=aspect_ratio,
+        duration_seconds=duration,
+        number_of_videos=num_videos,
+        output_gcs_uri=bucket,
+    )
+    admission = get_controller(model)
+    # 待ち時間 (受け付け枠が空くまで) と投入の RPC は別々に計測する
+    with timed_span("veo.admission", veo_queue_time, model=model):
+        await admission.acquire()
+    with timed_span("veo.submit", model=model):
+        try:
+            return await with_retries(
+                lambda: get_client().aio.models.generate_videos(
+                    model=model,
+                    prompt=prompt,
+                    image=genai.types.Image(gcs_uri=image_uri, mime_type=mime_type),
+                    config=config,
+                ),
+                model,
+            )
+        except BaseException:
+            admission.release()
+            raise
+
+
+async def _generate_videos(
+    prompt: str,
+    image_uri: str,
+    mime_type: str,
+    bucket: str,
+    num_videos: int,
+    aspect_ratio: str,
+    duration: int,
+    model: str,
+) -> List[str]:
+    """
+    Veo で動画を生成し、完了を待って出力されたすべての動画の URI を返す
+    """
+    client = get_client()
+    started, seconds = time.perf_counter(), None
+    veo_router.begin()
+    try:
+        operation = await _submit_videos(
+            prompt,
+            image_uri,
+            mime_type,
+            bucket,
+            num_videos,
+            aspect_ratio,
+            duration,
+            model,
+        )
+        # asyncio.sleep で待つことで、ポーリング中もイベントループを他のセッションに譲る
+        polls = 0
+        try:
+            with timed_span("veo.poll", veo_poll_time, model=model) as span:
+                while not operation.done:
+                    await asyncio.sleep(poll_interval)
+                    current = operation
+                    operation = await with_retries(
+                        lambda: client.aio.operations.get(current), model
+                    )
+                    polls += 1
+                span.set_attribute("polls", polls)
+        finally:
+            get_controller(model).release()
+        veo_poll_count.record(polls, {"model": model})
+
+        uris, error = video_uris(operation)
+        if error:
+            raise RuntimeError(error)
+        seconds = time.perf_counter() - started
+    finally:
+        veo_router.end(model, seconds)
+    return uris
+
+
+async def _generate_images(
+    prompt: str, bucket: str, num_images: int, aspect_ratio: str, model: str
+) -> List[str]:
+    """
+    Imagen で画像を生成し、出力されたすべての画像の URI を返す
+    """
+    client = get_client()
+    started, seconds = time.perf_counter(), None
+    imagen_router.begin()
+    try:
+        with timed_span("imagen.generate", model=model, images=num_images):
+            await get_controller(model).acquire()
+            response = await with_retries(
+                lambda: client.aio.models.generate_images(
+                    model=model,
+                    prompt=prompt,
+                    config=genai.types.GenerateImagesConfig(
+                        number_of_images=num_images,
+                        aspect_ratio=aspect_ratio,
+                        output_gcs_uri=bucket,
+                    ),
+                ),
+                model,
+            )
+        seconds = time.perf_counter() - started
+    finally:
+        imagen_router.end(model, seconds)
+    return [image.image.gcs_uri for image in response.generated_images]
+
+
+async def _run_batch(
+    jobs: List[Callable[[], Awaitable[List[str]]]], limit: int
+) -> List[Dict[str, Any]]:
+    """
+    ジョブを同時実行数 limit までで並行に実行し、入力順に結果を返す
+    1 件が失敗しても他のジョブは止めず、項目ごとに URI・所要時間・エラーを記録する
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(index: int, job) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                uris, error = await job(), None
+            except Exception as e:
+                uris, error = [], _error_status(e)
+            return {
+                "index": index,
+                "uris": uris,
+                "latency_seconds": round(time.perf_counter() - started, 3),
+                "error": error,
+            }
+
+    return await asyncio.gather(*(run(i, job) for i, job in enumerate(jobs)))
+
+
+def _batch_response(results: List[Dict[str, Any]]) -> dict:
+    failed = sum(1 for r in results if r["error"])
+    if failed == 0:
+        status = "success"
+    elif failed == len(results):
+        status = "エラー: すべての生成に失敗しました"
+    else:
+        status = f"一部成功: {len(results) - failed} 件成功、{failed} 件失敗しました"
+    return {
+        "status": status,
+        "uris": [uri for r in results for uri in r["uris"]],
+        "results": results,
+    }
+
 
 # https://github.com/GoogleCloudPlatform/vertex-ai-creative-studio/blob/main/experiments/mcp-genmedia/mcp-genmedia-go/mcp-veo-go/README.md
-def veo_i2v(
+async def veo_i2v(
     prompt: str,
     image_uri: str,
     bucket: str,
     num_videos: int = 1,
     aspect_ratio: str = "16:9",
     duration: int = 6,
+    force_new: bool = False,
+    model: str = "",
     tool_context: ToolContext = None,
 ) -> dict:
     """
-    Generate a video from an input image (and optional prompt) using Veo.
+    Start generating a video from an input image (and optional prompt) using Veo.
+    Returns a job_id immediately; pass it to get_media_job to receive the video.
 
     Args:
         prompt (string, required): Text prompt for video generation.
@@ -38,54 +270,140 @@ def veo_i2v(
         num_videos (number, optional): Number of videos. Default: 1. Min: 1, Max: 4.
         aspect_ratio (string, optional): Aspect ratio. Default: "16:9".
         duration (number, optional): Duration in seconds. Default: 6. Min: 4, Max: 8
+        force_new (boolean, optional): Generate again even if the same request was already generated. Default: false.
+        model (string, optional): Veo model to use. Only set it when the user asks for a specific model; by default a faster model is chosen automatically when Veo is busy.
     """
-    mime_type, _ = mimetypes.guess_type(image_uri)
-    if not mime_type in ["image/jpeg", "image/png"]:
-        return {"status": f"エラー: '{image_uri}' は未対応の形式です ({mime_type})"}
+    # 課金される生成を始める前に、入力画像の有無・形式・解像度・縦横比を確かめる
+    check = await preflight_image(image_uri, aspect_ratio)
+    if check.error:
+        return _report_progress(tool_context, {"status": f"エラー: {check.error}"})
+    mime_type = check.mime_type
 
-    if not bucket.startswith("gs://"):
-        bucket = f"gs://{bucket}"
-    if not bucket.endswith("/"):
-        bucket = f"{bucket}/"
-
-    config = genai.types.GenerateVideosConfigDict(
-        generate_audio=True,
+    # キャッシュと実行中のジョブは、振り分ける前のリクエスト (指定されたモデル) で引く
+    # 振り分け先は混雑状況で変わるため、振り分け後のモデルで引くと同じリクエストでも当たらない
+    bucket = _normalize_bucket(bucket)
+    key = cache_key(
+        model=model,
+        prompt=prompt,
+        image_uri=image_uri,
+        bucket=bucket,
         aspect_ratio=aspect_ratio,
-        duration_seconds=duration,
-        number_of_videos=num_videos,
-        output_gcs_uri=bucket,
+        duration=duration,
+        count=num_videos,
     )
-    client = genai.Client()
     try:
-        operation = client.models.generate_videos(
-            model=veo_model,
-            prompt=prompt,
-            image=genai.types.Image(gcs_uri=image_uri, mime_type=mime_type),
-            config=config,
-        )
-        while not operation.done:
-            operation = client.operations.get(operation)
-            time.sleep(3)
+        job_manager.resume()
+        if uris := await lookup(key, force_new):
+            return _report_progress(
+                tool_context,
+                {"status": "success", "uri": uris[0], "uris": uris, "cached": True},
+            )
+
+        # 同じリクエストの生成が実行中なら、そのジョブの結果を待つようにする
+        if not force_new and (job_id := await job_manager.find_running(key)):
+            coalesced_calls.add(1, {"operation": veo_flights.name})
+            return _report_progress(
+                tool_context,
+                {"status": "submitted", "job_id": job_id, "coalesced": True},
+            )
 
-        if operation.error:
-            return {"status": f"エラーが発生しました {operation.error}"}
+        # 混雑していれば高速なモデルに振り分ける。どちらを選んだかは応答にも含める
+        model, routing = veo_router.route(model or None)
+
+        # 受け付けを待っている間も、クライアントにはすぐに最初の進捗が届く
+        if tool_context and tool_context.function_call_id:
+            progress_hub.publish(
+                tool_context.function_call_id,
+                {"status": QUEUED, "queue_depth": get_controller(model).queue_depth},
+            )
+
+        async def submit() -> str:
+            # operation 名を永続化してからジョブ ID を返すため、再起動しても生成結果を失わない
+            # 処理中の数え上げ (routing) と operation の枠は、ジョブの完了時に JobManager が返す
+            veo_router.begin()
+            try:
+                operation = await _submit_videos(
+                    prompt,
+                    image_uri,
+                    mime_type,
+                    bucket,
+                    num_videos,
+                    aspect_ratio,
+                    duration,
+                    model,
+                )
+            except BaseException:
+                veo_router.end(model)
+                raise
+            try:
+                return await job_manager.submit(
+                    operation.name, "veo_i2v", cache_key=key
+                )
+            except BaseException:
+                get_controller(model).release()
+                veo_router.end(model)
+                raise
+
+        if force_new:
+            job_id, coalesced = await submit(), False
         else:
-            video = operation.response.generated_videos[0].video
-            return {
-                "status": "success",
-                "uri": video.uri,
-            }
-    except exceptions.GoogleAPICallError as e:
-        return {"status": f"API 呼び出しでエラーが発生しました: {e}"}
+            job_id, coalesced = await veo_flights.do(key, submit)
+        response = {"status": "submitted", "job_id": job_id}
+        if coalesced:
+            # 相乗りした先のジョブは、別の呼び出しが振り分けたモデルで生成している
+            response["coalesced"] = True
+        else:
+            response.update(model=model, routing=routing)
+        return _report_progress(tool_context, response)
     except Exception as e:
-        return {"status": f"エラーが発生しました: {e}"}
+        return _report_progress(tool_context, {"status": _error_status(e)})
+
+
+async def get_media_job(
+    job_id: str,
+    wait_seconds: int = 50,
+    tool_context: ToolContext = None,
+) -> dict:
+    """
+    Get the status and results of a generation job started by veo_i2v.
+    Waits up to wait_seconds for the job to finish before returning.
+
+    Args:
+        job_id (string, required): The job_id returned by veo_i2v.
+        wait_seconds (number, optional): Seconds to wait for completion. Default: 50. Min: 0, Max: 50.
+    """
+    try:
+        job = await job_manager.get(job_id, wait_seconds=min(max(wait_seconds, 0), 50))
+    except Exception as e:
+        return {"status": _error_status(e)}
+    if not job:
+        return {"status": f"エラー: ジョブ '{job_id}' が見つかりません"}
+
+    elapsed = round(job["updated_at"] - job["created_at"], 1)
+    if job["status"] == RUNNING:
+        return {
+            "status": "running",
+            "job_id": job_id,
+            "elapsed_seconds": round(time.time() - job["created_at"], 1),
+        }
+    if job["status"] == SUCCEEDED:
+        return {
+            "status": "success",
+            "job_id": job_id,
+            "uri": job["uris"][0],
+            "uris": job["uris"],
+            "elapsed_seconds": elapsed,
+        }
+    return {"status": f"エラーが発生しました: {job['error']}", "job_id": job_id}
 
 
-def imagen_t2i(
+async def imagen_t2i(
     prompt: str,
     bucket: str,
     num_images: int = 1,
     aspect_ratio: str = "1:1",
+    force_new: bool = False,
+    model: str = "",
     tool_context: ToolContext = None,
 ) -> dict:
     """
@@ -97,29 +415,128 @@ def imagen_t2i(
         bucket (string, required): Google Cloud Storage bucket for output. Same logic as veo_t2v.
         num_images (number, optional): Number of images. Default: 1. Min: 1, Max: 4.
         aspect_ratio (string, optional): Aspect ratio. Default: "1:1".
+        force_new (boolean, optional): Generate again even if the same request was already generated. Default: false.
+        model (string, optional): Imagen model to use. Only set it when the user asks for a specific model; by default a faster model is chosen automatically when Imagen is busy.
     """
-    if not bucket.startswith("gs://"):
-        bucket = f"gs://{bucket}"
-    if not bucket.endswith("/"):
-        bucket = f"{bucket}/"
+    bucket = _normalize_bucket(bucket)
+    # veo_i2v と同じく、キャッシュは振り分ける前のリクエストで引く
+    key = cache_key(
+        model=model,
+        prompt=prompt,
+        image_uri=None,
+        bucket=bucket,
+        aspect_ratio=aspect_ratio,
+        duration=None,
+        count=num_images,
+    )
 
-    client = genai.Client()
-    try:
-        response = client.models.generate_images(
-            model=imagen_model,
-            prompt=prompt,
-            config=genai.types.GenerateImagesConfig(
-                number_of_images=num_images,
-                aspect_ratio=aspect_ratio,
-                output_gcs_uri=bucket,
-            ),
+    # 実際に生成するときだけ振り分け、どのモデルを選んだかを応答に含める
+    served: Dict[str, str] = {}
+
+    async def generate_images() -> List[str]:
+        served["model"], served["routing"] = imagen_router.route(model or None)
+        return await _generate_images(
+            prompt, bucket, num_images, aspect_ratio, served["model"]
         )
-        image = response.generated_images[0]
-        return {
+
+    def generate():
+        return cached_generation(key, force_new, generate_images)
+
+    try:
+        if force_new:
+            (uris, cached), coalesced = await generate(), False
+        else:
+            (uris, cached), coalesced = await imagen_flights.do(key, generate)
+        response = {
             "status": "success",
-            "uri": image.image.gcs_uri,
+            "uri": uris[0],
+            "uris": uris,
+            "cached": cached,
+            **served,
         }
-    except exceptions.GoogleAPICallError as e:
-        return {"status": f"API 呼び出しでエラーが発生しました: {e}"}
+        if coalesced:
+            response["coalesced"] = True
+        return response
     except Exception as e:
-        return {"status": f"エラーが発生しました: {e}"}
+        return {"status": _error_status(e)}
+
+
+async def veo_i2v_batch(
+    items: List[Dict[str, Any]],
+    bucket: str,
+    num_videos: int = 1,
+    aspect_ratio: str = "16:9",
+    duration: int = 6,
+    model: str = "",
+    tool_context: ToolContext = None,
+) -> dict:
+    """
+    Generate several videos concurrently using Veo, one per item.
+    Use this instead of calling veo_i2v repeatedly when asked for multiple variations.
+
+    Args:
+        items (array, required): Objects with "prompt" (string) and "image_uri" (string) keys. Each item may also override "num_videos", "aspect_ratio" and "duration".
+        bucket (string, required): Google Cloud Storage bucket for output. Same logic as veo_t2v.
+        num_videos (number, optional): Number of videos per item. Default: 1. Min: 1, Max: 4.
+        aspect_ratio (string, optional): Aspect ratio. Default: "16:9".
+        duration (number, optional): Duration in seconds. Default: 6. Min: 4, Max: 8
+        model (string, optional): Veo model to use. Only set it when the user asks for a specific model; by default a faster model is chosen automatically when Veo is busy.
+    """
+    if not items:
+        return {"status": "エラー: items が指定されていません"}
+    bucket = _normalize_bucket(bucket)
+    model, routing = veo_router.route(model or None)
+
+    def job(item: Dict[str, Any]):
+        async def generate() -> List[str]:
+            image_uri = item["image_uri"]
+            item_aspect_ratio = item.get("aspect_ratio", aspect_ratio)
+            check = await preflight_image(image_uri, item_aspect_ratio)
+            if check.error:
+                raise ValueError(check.error)
+            return await _generate_videos(
+                item["prompt"],
+                image_uri,
+                check.mime_type,
+                bucket,
+                item.get("num_videos", num_videos),
+                item_aspect_ratio,
+                item.get("duration", duration),
+                model,
+            )
+
+        return generate
+
+    results = await _run_batch([job(item) for item in items], batch_concurrency)
+    return dict(_batch_response(results), model=model, routing=routing)
+
+
+async def imagen_t2i_batch(
+    prompts: List[str],
+    bucket: str,
+    num_images: int = 1,
+    aspect_ratio: str = "1:1",
+    model: str = "",
+    tool_context: ToolContext = None,
+) -> dict:
+    """
+    Generates images for several prompts concurrently using Google's Imagen models.
+    Use this instead of calling imagen_t2i repeatedly when asked for multiple variations.
+
+    Args:
+        prompts (array, required): Prompts for text to image generation, one image set per prompt.
+        bucket (string, required): Google Cloud Storage bucket for output. Same logic as veo_t2v.
+        num_images (number, optional): Number of images per prompt. Default: 1. Min: 1, Max: 4.
+        aspect_ratio (string, optional): Aspect ratio. Default: "1:1".
+        model (string, optional): Imagen model to use. Only set it when the user asks for a specific model; by default a faster model is chosen automatically when Imagen is busy.
+    """
+    if not prompts:
+        return {"status": "エラー: prompts が指定されていません"}
+    bucket = _normalize_bucket(bucket)
+    model, routing = imagen_router.route(model or None)
+
+    def job(prompt: str):
+        return lambda: _generate_images(prompt, bucket, num_images, aspect_ratio, model)
+
+    results = await _run_batch([job(p) for p in prompts], batch_concurrency)
+    return dict(_batch_response(results), model=model, routing=routing)
@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from google import genai
+
+from .admission import get_controller, is_transient
+from .clients import get_client
+from .progress import progress_hub, SUBMITTED, SUCCESS, ERROR
+from .result_cache import store_result
+from ..routing import VEO_MODEL, veo_router, model_from_operation
+from ..telemetry import tracer, log_event, veo_poll_time, veo_poll_count
+
+
+JOB_DB_PATH = os.getenv("GENMEDIA_JOB_DB", "genmedia_jobs.sqlite3")
+
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def video_uris(operation: Any) -> Tuple[List[str], Optional[str]]:
+    """
+    Returns the video URIs of a finished operation and an error, if any.
+
+    An operation can finish without videos, for example when every output
+    was removed by the RAI filter; that is reported as an error with the
+    filter's reasons, not as a success with no URIs.
+    """
+    if operation.error:
+        return [], str(operation.error)
+    response = operation.response
+    videos = (response and response.generated_videos) or []
+    uris = [v.video.uri for v in videos if v.video and v.video.uri]
+    if uris:
+        return uris, None
+    reasons = (response and response.rai_media_filtered_reasons) or []
+    if reasons:
+        return [], f"no videos were generated (filtered: {'; '.join(reasons)})"
+    return [], "no videos were generated"
+
+
+def _job_model(job: Dict[str, Any]) -> str:
+    # operation の枠はモデルごとに管理する。operation 名にモデルがなければ既定のモデルとみなす
+    return model_from_operation(job["operation_name"]) or VEO_MODEL
+
+
+class JobStore(Protocol):
+    """Durable storage for generation jobs and their long-running operations."""
+
+    def create(self, job: Dict[str, Any]) -> None: ...
+
+    def update(self, job_id: str, **fields: Any) -> None: ...
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]: ...
+
+    def unfinished(self) -> List[Dict[str, Any]]: ...
+
+    def find_running(self, cache_key: str) -> Optional[Dict[str, Any]]: ...
+
+
+class SqliteJobStore:
+    """The default job store, kept in a local SQLite file."""
+
+    _columns = (
+        "job_id",
+        "kind",
+        "operation_name",
+        "status",
+        "uris",
+        "error",
+        "cache_key",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, "
+                "operation_name TEXT NOT NULL, status TEXT NOT NULL, "
+                "uris TEXT, error TEXT, cache_key TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_cache_key ON jobs (cache_key, status)"
+            )
+
+    def _to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(self._columns, row))
+        job["uris"] = json.loads(job["uris"]) if job["uris"] else []
+        return job
+
+    def create(self, job: Dict[str, Any]) -> None:
+        row = dict(job, uris=json.dumps(job.get("uris") or []))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self._columns)}) "
+                f"VALUES ({', '.join('?' for _ in self._columns)})",
+                tuple(row.get(c) for c in self._columns),
+            )
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        if "uris" in fields:
+            fields["uris"] = json.dumps(fields["uris"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._columns)} FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._columns)} FROM jobs WHERE status = ?",
+                (RUNNING,),
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def find_running(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._columns)} FROM jobs "
+                "WHERE cache_key = ? AND status = ? ORDER BY created_at LIMIT 1",
+                (cache_key, RUNNING),
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+
+class JobManager:
+    """
+    Tracks Veo long-running operations through a JobStore.
+
+    A submitted operation is persisted before its job id is returned, and is
+    polled in a background task on the running event loop. Operations that
+    were still running when the process stopped are picked up again by
+    `resume()`, so a restart never loses a billed generation.
+
+    Every poll publishes the job's progress (elapsed time, and the URIs once
+    they are ready) to `progress_hub` under the job id.
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, poll_interval: float = 3):
+        self._store = store
+        self.poll_interval = poll_interval
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._done: Dict[str, asyncio.Event] = {}
+        self._resumed = False
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = SqliteJobStore()
+        return self._store
+
+    async def submit(
+        self, operation_name: str, kind: str, cache_key: Optional[str] = None
+    ) -> str:
+        """Persists a running operation and starts polling it. Returns the job id."""
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "operation_name": operation_name,
+            "status": RUNNING,
+            "uris": [],
+            "error": None,
+            "cache_key": cache_key,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await asyncio.to_thread(self.store.create, job)
+        progress_hub.publish(
+            job["job_id"], {"status": SUBMITTED, "job_id": job["job_id"]}
+        )
+        self._start(job, occupied=True)
+        return job["job_id"]
+
+    async def get(self, job_id: str, wait_seconds: float = 0) -> Optional[Dict[str, Any]]:
+        """Returns the job, waiting up to `wait_seconds` for it to finish."""
+        self.resume()
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job and job["status"] == RUNNING and wait_seconds > 0:
+            if job_id not in self._done:
+                self._start(job)
+            try:
+                await asyncio.wait_for(self._done[job_id].wait(), wait_seconds)
+            except asyncio.TimeoutError:
+                pass
+            job = await asyncio.to_thread(self.store.get, job_id)
+        return job
+
+    async def find_running(self, cache_key: str) -> Optional[str]:
+        """Returns the id of a running job for the same request, if there is one."""
+        job = await asyncio.to_thread(self.store.find_running, cache_key)
+        return job["job_id"] if job else None
+
+    def resume(self) -> None:
+        """Starts polling every unfinished job once per process."""
+        if self._resumed:
+            return
+        self._resumed = True
+        for job in self.store.unfinished():
+            self._start(job)
+
+    def _start(self, job: Dict[str, Any], occupied: bool = False) -> None:
+        """
+        Starts polling `job`. Every polled operation holds a Veo operation slot
+        and counts as in flight for the model router until it finishes;
+        `occupied` means the caller already took both.
+        """
+        job_id = job["job_id"]
+        if job_id in self._tasks:
+            if occupied:
+                get_controller(_job_model(job)).release()
+                veo_router.end(None)
+            return
+        if not occupied:
+            get_controller(_job_model(job)).occupy()
+            veo_router.begin()
+        self._done[job_id] = asyncio.Event()
+        task = asyncio.get_running_loop().create_task(self._poll(job))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _poll(self, job: Dict[str, Any]) -> None:
+        job_id = job["job_id"]
+        client = get_client()
+        operation = genai.types.GenerateVideosOperation(name=job["operation_name"])
+        polls = 0
+        latency = None
+        try:
+            with tracer.start_as_current_span("veo.poll", attributes={"job_id": job_id}):
+                while True:
+                    polls += 1
+                    try:
+                        operation = await client.aio.operations.get(operation)
+                    except Exception as e:
+                        if isinstance(e, genai.errors.APIError) and e.code == 404:
+                            await self._finish(job, error=f"operation not found: {e}")
+                            return
+                        if not is_transient(e):
+                            await self._finish(job, error=str(e))
+                            return
+                        log_event(
+                            "veo_poll_failed",
+                            logging.WARNING,
+                            job_id=job_id,
+                            operation=job["operation_name"],
+                            error=str(e),
+                        )
+                        operation = genai.types.GenerateVideosOperation(
+                            name=job["operation_name"]
+                        )
+                    else:
+                        if operation.done:
+                            break
+                    progress_hub.publish(
+                        job_id,
+                        {
+                            "status": RUNNING,
+                            "job_id": job_id,
+                            "elapsed_seconds": round(time.time() - job["created_at"], 1),
+                        },
+                    )
+                    await asyncio.sleep(self.poll_interval)
+
+            uris, error = video_uris(operation)
+            await self._finish(job, uris=uris, error=error)
+            if not error:
+                latency = time.time() - job["created_at"]
+        except Exception as e:
+            # ジョブが running のまま残ると、get_media_job も同じ依頼の合流先も待ち続けてしまう
+            log_event(
+                "veo_job_failed",
+                logging.ERROR,
+                job_id=job_id,
+                operation=job["operation_name"],
+                error=str(e),
+            )
+            await self._finish(job, error=str(e))
+        finally:
+            # 投入 (永続化) されてから完了するまでの時間と、その間のポーリング回数
+            attributes = {"kind": job["kind"]}
+            veo_poll_time.record(time.time() - job["created_at"], attributes)
+            veo_poll_count.record(polls, attributes)
+            get_controller(_job_model(job)).release()
+            # 完了までの時間は、operation 名に含まれるモデルのレイテンシとして記録する
+            veo_router.end(model_from_operation(job["operation_name"]), latency)
+            self._done[job_id].set()
+
+    async def _finish(
+        self,
+        job: Dict[str, Any],
+        uris: Optional[List[str]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        job_id = job["job_id"]
+        elapsed = round(time.time() - job["created_at"], 1)
+        if error:
+            await asyncio.to_thread(self.store.update, job_id, status=FAILED, error=error)
+            progress_hub.publish(
+                job_id,
+                {
+                    "status": ERROR,
+                    "job_id": job_id,
+                    "error": error,
+                    "elapsed_seconds": elapsed,
+                },
+            )
+            return
+        await asyncio.to_thread(self.store.update, job_id, status=SUCCEEDED, uris=uris)
+        progress_hub.publish(
+            job_id,
+            {
+                "status": SUCCESS,
+                "job_id": job_id,
+                "uris": uris,
+                "elapsed_seconds": elapsed,
+            },
+        )
+        if job.get("cache_key") and uris:
+            # 結果は保存済みなので、キャッシュに書けなくてもジョブは成功のままにする
+            try:
+                await store_result(
+                    job["cache_key"], uris, time.time() - job["created_at"]
+                )
+            except Exception as e:
+                log_event(
+                    "result_cache_store_failed",
+                    logging.WARNING,
+                    job_id=job_id,
+                    error=str(e),
+                )
+
+
+job_manager = JobManager(poll_interval=float(os.getenv("VEO_POLL_INTERVAL", "3")))
@@ -0,0 +1,245 @@
+import os
+import math
+import struct
+import asyncio
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from google.api_core import exceptions
+from google.cloud import storage
+
+from ..lazy import Lazy
+from ..telemetry import log_event, record_cache
+
+
+# Veo に渡す前に入力画像を確かめる: on / off (off なら拡張子だけで判断する)
+PREFLIGHT = os.getenv("GENMEDIA_PREFLIGHT", "on") != "off"
+# 先頭から読むバイト数。JPEG は EXIF の後ろに寸法があるため少し多めに読む
+PREFLIGHT_READ_BYTES = int(os.getenv("GENMEDIA_PREFLIGHT_READ_BYTES", "65536"))
+# 受け付ける画像の大きさ (バイト) と、短辺・長辺のピクセル数
+PREFLIGHT_MAX_BYTES = int(os.getenv("GENMEDIA_PREFLIGHT_MAX_BYTES", "20971520"))
+PREFLIGHT_MIN_SIDE = int(os.getenv("GENMEDIA_PREFLIGHT_MIN_SIDE", "360"))
+PREFLIGHT_MAX_SIDE = int(os.getenv("GENMEDIA_PREFLIGHT_MAX_SIDE", "8192"))
+# 画像と aspect_ratio の縦横比が何倍まで離れていてよいか (0 なら確かめない)
+# 既定の 2 倍なら 16:9 に正方形は通し、縦長 (9:16) は断る
+PREFLIGHT_MAX_ASPECT_SKEW = float(os.getenv("GENMEDIA_PREFLIGHT_MAX_ASPECT_SKEW", "2"))
+PREFLIGHT_CACHE_SIZE = int(os.getenv("GENMEDIA_PREFLIGHT_CACHE_SIZE", "1024"))
+
+SUPPORTED_MIME_TYPES = ("image/jpeg", "image/png")
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_JPEG_SIGNATURE = b"\xff\xd8\xff"
+# 寸法を持つ JPEG の SOF マーカー (DHT / JPG / DAC を除く)
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# 参考までに判別する、Veo が受け付けない形式
+_OTHER_SIGNATURES = (
+    (b"GIF8", "image/gif"),
+    (b"%PDF", "application/pdf"),
+)
+
+# sniff_image の結果と、オブジェクトのバイト数
+ImageInfo = Tuple[Optional[str], Optional[int], Optional[int], Optional[int]]
+
+
+class ImageCheck(NamedTuple):
+    mime_type: Optional[str]
+    width: Optional[int] = None
+    height: Optional[int] = None
+    error: Optional[str] = None
+
+
+def sniff_image(head: bytes) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """
+    Returns (mime type, width, height) read from the first bytes of a file.
+
+    The size is None when it is not within `head`, such as a JPEG whose
+    frame header follows a large embedded thumbnail.
+    """
+    if head.startswith(_PNG_SIGNATURE):
+        if len(head) >= 24 and head[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", head[16:24])
+            return "image/png", width, height
+        return "image/png", None, None
+    if head.startswith(_JPEG_SIGNATURE):
+        return ("image/jpeg", *_jpeg_size(head))
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp", None, None
+    for signature, mime_type in _OTHER_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type, None, None
+    return None, None, None
+
+
+def _jpeg_size(head: bytes) -> Tuple[Optional[int], Optional[int]]:
+    position = 2
+    while position + 4 <= len(head):
+        if head[position] != 0xFF:
+            return None, None
+        marker = head[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker in (0x01, *range(0xD0, 0xD8)):
+            position += 2
+            continue
+        (length,) = struct.unpack(">H", head[position + 2 : position + 4])
+        if marker in _JPEG_SOF:
+            if position + 9 > len(head):
+                return None, None
+            height, width = struct.unpack(">HH", head[position + 5 : position + 9])
+            return width, height
+        position += 2 + length
+    return None, None
+
+
+def _aspect(aspect_ratio: str) -> Optional[float]:
+    try:
+        width, height = (float(v) for v in aspect_ratio.split(":"))
+        return width / height
+    except (AttributeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def validate(
+    image_uri: str,
+    mime_type: Optional[str],
+    width: Optional[int],
+    height: Optional[int],
+    size: Optional[int],
+    aspect_ratio: str,
+) -> ImageCheck:
+    """Checks a sniffed image against the format, size and aspect limits."""
+
+    def reject(reason: str) -> ImageCheck:
+        return ImageCheck(mime_type, width, height, f"'{image_uri}' {reason}")
+
+    if mime_type not in SUPPORTED_MIME_TYPES:
+        return reject(f"は未対応の形式です ({mime_type or '不明な形式'})")
+    if size is not None and size > PREFLIGHT_MAX_BYTES:
+        return reject(f"は大きすぎます ({size} バイト、上限 {PREFLIGHT_MAX_BYTES})")
+    if not (width and height):
+        return ImageCheck(mime_type, width, height)
+    short_side, long_side = sorted((width, height))
+    if short_side < PREFLIGHT_MIN_SIDE or long_side > PREFLIGHT_MAX_SIDE:
+        return reject(
+            f"の解像度 {width}x{height} は未対応です "
+            f"(短辺 {PREFLIGHT_MIN_SIDE} 以上、長辺 {PREFLIGHT_MAX_SIDE} 以下)"
+        )
+    target = _aspect(aspect_ratio)
+    if target and PREFLIGHT_MAX_ASPECT_SKEW > 0:
+        skew = abs(math.log(width / height / target))
+        if skew > math.log(PREFLIGHT_MAX_ASPECT_SKEW):
+            return reject(
+                f"の縦横比 ({width}x{height}) は {aspect_ratio} と合いません"
+            )
+    return ImageCheck(mime_type, width, height)
+
+
+def _parse_gcs_uri(image_uri: str) -> Tuple[Optional[str], Optional[str]]:
+    if not image_uri.startswith("gs://"):
+        return None, None
+    bucket, _, object_name = image_uri[len("gs://") :].partition("/")
+    return (bucket, object_name) if bucket and object_name else (None, None)
+
+
+class PreflightCache:
+    """
+    A bounded, thread-safe LRU of sniffed images keyed by (uri, generation).
+
+    A GCS generation changes whenever the object is overwritten, so a cached
+    entry never outlives the bytes it was read from. The limits are applied
+    on every call, since they depend on the requested aspect ratio.
+    """
+
+    def __init__(self, max_size: int = PREFLIGHT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, int], ImageInfo]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int]) -> Optional[ImageInfo]:
+        with self._lock:
+            info = self._entries.get(key)
+            if info is not None:
+                self._entries.move_to_end(key)
+            return info
+
+    def put(self, key: Tuple[str, int], info: ImageInfo) -> None:
+        with self._lock:
+            self._entries[key] = info
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+preflight_cache = PreflightCache()
+
+# 入力画像を読むクライアント。認証情報の探索が重いため初回利用時に作る
+_storage = Lazy(storage.Client)
+
+
+def _by_extension(image_uri: str) -> ImageCheck:
+    mime_type, _ = mimetypes.guess_type(image_uri)
+    if mime_type not in SUPPORTED_MIME_TYPES:
+        error = f"'{image_uri}' は未対応の形式です ({mime_type})"
+        return ImageCheck(mime_type, error=error)
+    return ImageCheck(mime_type)
+
+
+def _check_object(image_uri: str, aspect_ratio: str) -> ImageCheck:
+    bucket_name, object_name = _parse_gcs_uri(image_uri)
+    if not bucket_name:
+        return ImageCheck(None, error=f"'{image_uri}' は gs:// の URI ではありません")
+    blob = _storage.get().bucket(bucket_name).blob(object_name)
+    try:
+        blob.reload()
+    except exceptions.NotFound:
+        return ImageCheck(None, error=f"'{image_uri}' が見つかりません")
+    except exceptions.Forbidden:
+        return ImageCheck(None, error=f"'{image_uri}' を読む権限がありません")
+
+    key = (image_uri, blob.generation)
+    info = preflight_cache.get(key)
+    if info is not None:
+        record_cache("preflight", "hit")
+    else:
+        record_cache("preflight", "miss")
+        head = blob.download_as_bytes(
+            start=0, end=PREFLIGHT_READ_BYTES - 1, generation=blob.generation
+        )
+        info = (*sniff_image(head), blob.size)
+        preflight_cache.put(key, info)
+    return validate(image_uri, *info, aspect_ratio)
+
+
+async def preflight_image(
+    image_uri: str, aspect_ratio: str, enabled: bool = PREFLIGHT
+) -> ImageCheck:
+    """
+    Checks a Veo input image before any billed operation starts.
+
+    Reads the object's metadata and its first PREFLIGHT_READ_BYTES with a
+    ranged read, then checks that it exists and is readable, that its magic
+    bytes are JPEG or PNG, and that its size, resolution and aspect ratio
+    are within the PREFLIGHT_* limits. The returned mime type comes from
+    the bytes, so a mislabelled file is still sent to Veo correctly.
+    What was read is cached per (uri, generation).
+
+    Errors other than a missing object or a denied read do not block the
+    generation: the check then falls back to the file extension, as before.
+    """
+    if not enabled:
+        return _by_extension(image_uri)
+    try:
+        return await asyncio.to_thread(_check_object, image_uri, aspect_ratio)
+    except Exception as e:
+        log_event(
+            "preflight_failed", logging.WARNING, image_uri=image_uri, error=str(e)
+        )
+        return _by_extension(image_uri)
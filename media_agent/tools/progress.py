@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple
+
+
+QUEUED = "queued"
+SUBMITTED = "submitted"
+RUNNING = "running"
+SUCCESS = "success"
+ERROR = "error"
+
+TERMINAL = frozenset({SUCCESS, ERROR})
+
+# 最後の進捗を覚えておくキー (function_call_id / job_id) の数。古い順に捨てる
+_LATEST_LIMIT = 1024
+
+
+class ProgressHub:
+    """
+    Fans out progress events of long-running generations to subscribers.
+
+    Events are dicts with at least a "status" of queued, submitted, running,
+    success or error, published under a key: the function_call_id of a tool
+    call or a job id. `link` forwards the events of a job to a tool call, so
+    subscribers of the call keep receiving them after the job is submitted.
+    The latest event per key is kept, so a late subscriber starts from the
+    current state instead of waiting for the next poll.
+
+    Subscribers may live on any event loop; events are handed over with
+    `call_soon_threadsafe`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._subscribers: Dict[
+            str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]
+        ] = {}
+        self._links: Dict[str, Set[str]] = {}
+
+    def publish(self, key: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            keys = [key, *self._links.get(key, ())]
+            targets = []
+            for k in keys:
+                self._latest[k] = event
+                self._latest.move_to_end(k)
+                targets.extend(self._subscribers.get(k, ()))
+            while len(self._latest) > _LATEST_LIMIT:
+                stale, _ = self._latest.popitem(last=False)
+                self._links.pop(stale, None)
+            if event["status"] in TERMINAL:
+                self._links.pop(key, None)
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def link(self, job_id: str, call_id: str) -> None:
+        """Forwards the events published for `job_id` to `call_id` as well."""
+        with self._lock:
+            self._links.setdefault(job_id, set()).add(call_id)
+            latest = self._latest.get(job_id)
+        if latest is not None:
+            self.publish(call_id, latest)
+
+    def latest(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._latest.get(key, {})
+
+    async def subscribe(self, key: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yields the latest and every following event of `key` until a terminal one."""
+        queue: asyncio.Queue = asyncio.Queue()
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(entry)
+            latest = self._latest.get(key)
+        try:
+            if latest is not None:
+                queue.put_nowait(latest)
+            while True:
+                event = await queue.get()
+                yield event
+                if event["status"] in TERMINAL:
+                    return
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(key, [])
+                if entry in subscribers:
+                    subscribers.remove(entry)
+                if not subscribers:
+                    self._subscribers.pop(key, None)
+
+
+progress_hub = ProgressHub()
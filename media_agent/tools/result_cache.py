@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Protocol, Tuple
+
+from google.api_core import exceptions
+from google.cloud import storage
+
+from ..telemetry import log_event, record_cache
+
+
+# 生成結果キャッシュの保存先: memory / sqlite / gcs / off
+RESULT_CACHE_BACKEND = os.getenv("GENMEDIA_RESULT_CACHE", "memory")
+RESULT_CACHE_SIZE = int(os.getenv("GENMEDIA_RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_SQLITE_PATH = os.getenv(
+    "GENMEDIA_RESULT_CACHE_SQLITE_PATH", "genmedia_cache.sqlite3"
+)
+RESULT_CACHE_MANIFEST = os.getenv(
+    "GENMEDIA_RESULT_CACHE_MANIFEST", "genmedia-cache/manifest.json"
+)
+
+
+def cache_key(**params: Any) -> str:
+    """
+    Returns a canonical SHA-256 hash of the generation parameters.
+
+    Keys are sorted and strings are stripped, so two requests that differ only
+    in argument order or surrounding whitespace share an entry.
+    """
+    canonical = {
+        k: v.strip() if isinstance(v, str) else v for k, v in params.items()
+    }
+    payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultStore(Protocol):
+    """Storage for cached generation results: {"uris": [...], "seconds": float}."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]: ...
+
+    def put(self, key: str, value: Dict[str, Any]) -> None: ...
+
+
+class MemoryResultStore:
+    """A bounded in-process LRU store."""
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SqliteResultStore:
+    """A store in a local SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path: str = RESULT_CACHE_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+
+
+class GcsManifestResultStore:
+    """
+    A store kept as one JSON manifest object in the media bucket, so every
+    instance of the agent shares the same results. The manifest is kept in
+    memory, checked for a newer generation on every miss, and written back
+    with a generation precondition to avoid lost updates.
+    """
+
+    def __init__(self, bucket_name: str, object_name: str = RESULT_CACHE_MANIFEST):
+        self._blob = storage.Client().bucket(bucket_name).blob(object_name)
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._generation = 0
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            self._blob.reload()
+            self._entries = json.loads(self._blob.download_as_bytes())
+            self._generation = self._blob.generation
+        except exceptions.NotFound:
+            self._entries, self._generation = {}, 0
+        return self._entries
+
+    def _refresh(self) -> Dict[str, Dict[str, Any]]:
+        """Reloads the manifest when another instance has written a newer one."""
+        try:
+            self._blob.reload()
+        except exceptions.NotFound:
+            return self._entries
+        if self._blob.generation == self._generation:
+            return self._entries
+        return self._load()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._entries is None:
+                return self._load().get(key)
+            value = self._entries.get(key)
+            if value is None:
+                # 他のインスタンスが書き込んだ結果かもしれないので、世代が変わっていれば読み直す
+                value = self._refresh().get(key)
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            for _ in range(3):
+                entries = self._entries if self._entries is not None else self._load()
+                entries[key] = value
+                try:
+                    self._blob.upload_from_string(
+                        json.dumps(entries),
+                        content_type="application/json",
+                        if_generation_match=self._generation,
+                    )
+                    self._generation = self._blob.generation
+                    return
+                except exceptions.PreconditionFailed:
+                    # 他のインスタンスが先に書き込んだので読み直してから再度書く
+                    self._entries = None
+            log_event(
+                "result_cache_manifest_conflict",
+                logging.WARNING,
+                key=key,
+                manifest=self._blob.name,
+            )
+
+
+_store: Optional[ResultStore] = None
+_store_lock = threading.Lock()
+_stats: Dict[str, float] = {"hits": 0, "misses": 0, "bypassed": 0, "saved_seconds": 0.0}
+
+
+def get_result_store() -> Optional[ResultStore]:
+    """Returns the store selected by GENMEDIA_RESULT_CACHE, or None when disabled."""
+    global _store
+    if RESULT_CACHE_BACKEND == "off":
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if RESULT_CACHE_BACKEND == "sqlite":
+                    _store = SqliteResultStore()
+                elif RESULT_CACHE_BACKEND == "gcs":
+                    _store = GcsManifestResultStore(os.getenv("GENMEDIA_BUCKET"))
+                else:
+                    _store = MemoryResultStore()
+    return _store
+
+
+async def lookup(key: str, force_new: bool = False) -> Optional[List[str]]:
+    """Returns the stored URIs for `key`, or None on a miss or with `force_new`."""
+    store = get_result_store()
+    if store is not None and not force_new:
+        entry = await asyncio.to_thread(store.get, key)
+        if entry:
+            with _store_lock:
+                _stats["hits"] += 1
+                _stats["saved_seconds"] += entry.get("seconds", 0.0)
+            record_cache("result", "hit")
+            return entry["uris"]
+    with _store_lock:
+        _stats["bypassed" if force_new else "misses"] += 1
+    record_cache("result", "bypass" if force_new else "miss")
+    return None
+
+
+async def store_result(key: str, uris: List[str], seconds: float) -> None:
+    """Stores the URIs of a finished generation that took `seconds`."""
+    store = get_result_store()
+    if store is not None and uris:
+        value = {"uris": uris, "seconds": round(seconds, 3)}
+        await asyncio.to_thread(store.put, key, value)
+
+
+async def cached_generation(
+    key: str, force_new: bool, generate: Callable[[], Awaitable[List[str]]]
+) -> Tuple[List[str], bool]:
+    """
+    Returns stored URIs for `key` when present, otherwise runs `generate` and
+    stores its URIs together with how long the generation took.
+
+    Returns:
+        A tuple of (uris, whether the result came from the cache).
+    """
+    uris = await lookup(key, force_new)
+    if uris:
+        return uris, True
+
+    started = time.perf_counter()
+    uris = await generate()
+    await store_result(key, uris, time.perf_counter() - started)
+    return uris, False
+
+
+def result_cache_stats() -> Dict[str, float]:
+    """Returns hit / miss counters, the hit rate and generation seconds saved."""
+    with _store_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -1,15 +1,21 @@
+# リポジトリのルートからモジュールとして実行する (genmedia は相対 import を使うため)
+#   python -m media_agent.tools.test
+
 import os
 import time
+import asyncio
 
-from genmedia import imagen_t2i
+from media_agent.tools.genmedia import imagen_t2i
 
 
 def main():
     print(f"started at {time.strftime('%X')}")
 
-    response = imagen_t2i(
-        "新橋で酔い潰れているイルカ",
-        os.getenv("GENMEDIA_BUCKET"),
+    response = asyncio.run(
+        imagen_t2i(
+            "新橋で酔い潰れているイルカ",
+            os.getenv("GENMEDIA_BUCKET"),
+        )
     )
     print(response)
     print(f"finished at {time.strftime('%X')}")
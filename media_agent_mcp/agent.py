@@ -1,17 +1,24 @@
 import os
 import sys
+import asyncio
+from typing import Callable, Optional
+from urllib.parse import urlparse
 
-from vertexai.preview.reasoning_engines import AdkApp
 from google.adk.agents import LlmAgent
-from google.adk.tools.mcp_tool.mcp_toolset import (
-    MCPToolset,
-    StdioConnectionParams,
-    StdioServerParameters,
-    SseConnectionParams,
-)
+from google.adk.apps import App
+from google.adk.tools.base_toolset import BaseToolset
 
-from .auth import get_google_id_token
-from .callbacks import before_model, after_tool
+from .auth import id_token_header_provider
+from .callbacks import (
+    before_model,
+    after_model,
+    before_tool,
+    after_tool,
+    on_tool_error,
+)
+from .prompt_budget import context_cache_config
+from .telemetry import configure_telemetry
+from .lazy import Lazy
 
 
 if "GENMEDIA_BUCKET" not in os.environ:
@@ -29,42 +36,90 @@ bucket = os.getenv("GENMEDIA_BUCKET")
 image_uri = os.getenv("REFERENCE_IMAGE_URI")
 
 
-# MCP: Veo
-# veo_model = "veo-3.0-fast-generate-001"
-veo_model = "veo-3.0-generate-preview"
-veo = MCPToolset(
-    connection_params=StdioConnectionParams(
-        server_params=StdioServerParameters(
-            command="mcp-veo-go",
-            env=dict(os.environ, PROJECT_ID=project_id, LOCATION=location),
+class LazyToolset(BaseToolset):
+    """
+    A toolset that builds the wrapped toolset on first use.
+
+    Importing the MCP client and creating connection parameters is deferred
+    until the agent first lists its tools, so importing this module stays cheap.
+    """
+
+    def __init__(self, factory: Callable[[], BaseToolset]):
+        super().__init__()
+        self._toolset = Lazy(factory)
+        self._warming: Optional[asyncio.Task] = None
+
+    async def get_tools(self, readonly_context=None):
+        # 最初にツールを列挙したタイミングで、残りのセッションも裏で開いておく
+        if self._warming is None:
+            self._warming = asyncio.create_task(self.warm())
+        return await self._toolset.get().get_tools(readonly_context)
+
+    async def warm(self) -> None:
+        toolset = self._toolset.get()
+        if hasattr(toolset, "warm"):
+            await toolset.warm()
+
+    async def close(self) -> None:
+        if self._toolset.ready:
+            await self._toolset.get().close()
+
+
+def _mcp_toolset(
+    command: str, endpoint: Optional[str], timeout: float, tool_name: str
+) -> BaseToolset:
+    from google.adk.tools.mcp_tool.mcp_toolset import (
+        StdioConnectionParams,
+        StdioServerParameters,
+        SseConnectionParams,
+    )
+
+    from .pool import PooledMCPToolset
+
+    if endpoint:
+        # ID トークンは接続のたびに払い出す (キャッシュ済みならそれを、期限が近ければ裏で更新)
+        origin = urlparse(endpoint)
+        return PooledMCPToolset(
+            connection_params=SseConnectionParams(url=endpoint, timeout=timeout),
+            tool_filter=[tool_name],
+            single_flight=True,
+            header_provider=id_token_header_provider(
+                f"{origin.scheme}://{origin.netloc}"
+            ),
+        )
+    return PooledMCPToolset(
+        connection_params=StdioConnectionParams(
+            server_params=StdioServerParameters(
+                command=command,
+                env=dict(os.environ, PROJECT_ID=project_id, LOCATION=location),
+            ),
+            timeout=timeout,
         ),
-        timeout=120,
-    ),
-    tool_filter=["veo_i2v"],
-)
-if veo_endpoint := os.getenv("MCP_VEO_ENDPOINT"):
-    veo._connection_params = SseConnectionParams(
-        headers={"Authorization": get_google_id_token()},
-        url=veo_endpoint,
+        tool_filter=[tool_name],
+        single_flight=True,
+    )
+
+
+# MCP: Veo
+# モデルは callbacks.before_tool が混雑状況に応じて選ぶ (routing.VEO_MODEL / VEO_FAST_MODEL)
+veo = LazyToolset(
+    lambda: _mcp_toolset(
+        "mcp-veo-go", os.getenv("MCP_VEO_ENDPOINT"), timeout=120, tool_name="veo_i2v"
     )
+)
 
 # MCP: Imagen
-imagen_model = "imagen-4.0-generate-001"
-imagen = MCPToolset(
-    connection_params=StdioConnectionParams(
-        server_params=StdioServerParameters(
-            command="mcp-imagen-go",
-            env=dict(os.environ, PROJECT_ID=project_id, LOCATION=location),
-        ),
+imagen = LazyToolset(
+    lambda: _mcp_toolset(
+        "mcp-imagen-go",
+        os.getenv("MCP_IMAGEN_ENDPOINT"),
         timeout=60,
-    ),
-    tool_filter=["imagen_t2i"],
-)
-if imagen_endpoint := os.getenv("MCP_IMAGEN_ENDPOINT"):
-    imagen._connection_params = SseConnectionParams(
-        headers={"Authorization": get_google_id_token()},
-        url=imagen_endpoint,
+        tool_name="imagen_t2i",
     )
+)
+
+# OTEL_EXPORTER_OTLP_ENDPOINT が設定されていれば、スパンとメトリクスを OTLP で送る
+configure_telemetry()
 
 # Media agent
 root_agent = LlmAgent(
@@ -82,18 +137,47 @@ root_agent = LlmAgent(
         3. 依頼が動画像の生成なら、まずはいったん作業に着手する旨を応答した上で
         4. 適切なツールに英語で指示しつつ、ユーザーから頼まれた画像や動画を生成してください。
         5. ユーザへの応答は日本語で、生成した画像へのアクセス URL を含めてください。
-           URL には X-Goog-Algorithm といったクエリパラメタが付属しているはずですが
+           URL には X-Goog-Algorithm といったクエリパラメタや、短縮リンクの ID が含まれていますが
            これは **絶対に一切省略せず、一文字たりとも変更せずに** 応答に含めてください。
 
         veo_i2v を使う時は、ユーザーから明示的に指定されない限り imagen_t2i で作った画像ではなく
-        **必ず** image_uri パラメタに {image_uri} を、 bucket パラメタには {bucket} を
-        そして model パラメタには {veo_model} を指定してください。
-        imagen_t2i を使う時は gcs_bucket_uri パラメタに {bucket} を
-        そして model パラメタには {imagen_model} を指定してください。
+        **必ず** image_uri パラメタに {image_uri} を、 bucket パラメタには {bucket} を指定してください。
+        imagen_t2i を使う時は gcs_bucket_uri パラメタに {bucket} を指定してください。
+        model パラメタは混雑状況に応じて自動で選ばれるため、ユーザーから明示的に指定された場合を除き省略してください。
     """,
     tools=[veo, imagen],
     before_model_callback=before_model,
+    after_model_callback=after_model,
+    before_tool_callback=before_tool,
     after_tool_callback=after_tool,
+    on_tool_error_callback=on_tool_error,
+)
+
+
+# adk web などはこの app を読み込む。システム指示とツール定義をコンテキストキャッシュに載せる
+app = App(
+    name="media_agent_mcp",
+    root_agent=root_agent,
+    context_cache_config=context_cache_config,
 )
 
-app = AdkApp(agent=root_agent, enable_tracing=True)
+
+async def warm_up() -> None:
+    """MCP サーバとのセッションをあらかじめ開き、ツールのスキーマを取得しておく"""
+    await asyncio.gather(veo.warm(), imagen.warm())
+
+
+# Agent Engine 向けのアプリ。vertexai の読み込みは重いため、参照されたときに初めて作る
+def _create_agent_engine_app():
+    from vertexai.preview.reasoning_engines import AdkApp
+
+    return AdkApp(agent=root_agent, enable_tracing=True)
+
+
+_agent_engine_app = Lazy(_create_agent_engine_app)
+
+
+def __getattr__(name: str):
+    if name == "agent_engine_app":
+        return _agent_engine_app.get()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,170 @@
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from google.adk.models import LlmRequest
+from google.genai import types
+
+from .rewrite import rewrite_tree
+from .scanner import GcsUrlScanner
+from .telemetry import estimate_tokens, history_tokens, tokens_saved
+
+
+# 過去のターンの署名付き URL を gs:// URI に戻し、古いツール応答を要約する: on / off
+HISTORY_COMPACTION = os.getenv("GENMEDIA_HISTORY_COMPACTION", "on") != "off"
+# 過去のターンのツール応答に使ってよいトークン数。超えた分は古いものから要約する
+HISTORY_TOOL_TOKEN_BUDGET = int(
+    os.getenv("GENMEDIA_HISTORY_TOOL_TOKEN_BUDGET", "4000")
+)
+
+# 要約したツール応答に残すキー (短い値に限る)
+SUMMARY_KEYS = ("status", "job_id", "uri", "uris", "model", "error", "message")
+_SUMMARY_VALUE_MAX_CHARS = 200
+
+_SIGNED_URL = re.compile(
+    r"https://storage\.googleapis\.com/"
+    r"(?P<bucket>[a-z0-9][a-z0-9._-]*[a-z0-9])/(?P<object>[^\s\"'<>?#]+)"
+    r"\?[^\s\"'<>`]*?X-Goog-Signature=[0-9a-fA-F]+(?:&[^\s\"'<>`]*)?"
+)
+
+
+def unsign_urls(text: str) -> str:
+    """
+    Replaces V4 signed URLs in `text` with the gs:// URI of their object.
+
+    A URL is kept when the scanner would not read the URI back as the same
+    object (names with spaces, quotes or brackets, or without a media
+    extension), since after_model could not sign it again. Returns `text` itself when it holds no
+    signed URL, as `rewrite_tree` expects.
+    """
+    if "X-Goog-Signature=" not in text:
+        return text
+    return _SIGNED_URL.sub(_gs_uri, text)
+
+
+def _gs_uri(match: re.Match) -> str:
+    bucket, object_name = match.group("bucket"), unquote(match.group("object"))
+    uri = f"gs://{bucket}/{object_name}"
+    # 再署名できない URI (途中で切れる名前やメディア以外) は、署名付き URL のまま残す
+    if GcsUrlScanner([bucket]).parse(uri) != (bucket, object_name):
+        return match.group(0)
+    return uri
+
+
+def _part_tokens(part: types.Part) -> int:
+    if part.text:
+        return estimate_tokens(part.text)
+    payload = part.function_call or part.function_response
+    if payload is None:
+        return 0
+    payload = json.dumps(payload.model_dump(mode="json"), ensure_ascii=False)
+    return estimate_tokens(payload)
+
+
+def request_tokens(contents: List[types.Content]) -> int:
+    """Estimates the tokens of the text, function calls and function responses."""
+    return sum(_part_tokens(part) for c in contents for part in c.parts or ())
+
+
+def current_turn_start(contents: List[types.Content]) -> int:
+    """Returns the index of the latest user message that is not a tool result."""
+    for index in range(len(contents) - 1, -1, -1):
+        content = contents[index]
+        if content.role == "user" and not any(
+            part.function_response for part in content.parts or ()
+        ):
+            return index
+    return 0
+
+
+def summarize_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Keeps the short SUMMARY_KEYS values of a tool response and marks it compacted."""
+    summary = {}
+    for key in SUMMARY_KEYS:
+        value = response.get(key)
+        if value is None:
+            continue
+        encoded = json.dumps(value, ensure_ascii=False, default=str)
+        if len(encoded) > _SUMMARY_VALUE_MAX_CHARS:
+            continue
+        summary[key] = value
+    summary["compacted"] = True
+    return summary
+
+
+def _unsign_part(part: types.Part) -> types.Part:
+    if part.text:
+        text = unsign_urls(part.text)
+        return part if text is part.text else part.model_copy(update={"text": text})
+    for name in ("function_call", "function_response"):
+        payload = getattr(part, name)
+        field = "args" if name == "function_call" else "response"
+        value = getattr(payload, field, None) if payload else None
+        if value:
+            new = rewrite_tree(value, unsign_urls)
+            if new is not value:
+                payload = payload.model_copy(update={field: new})
+                return part.model_copy(update={name: payload})
+    return part
+
+
+def compact_history(
+    llm_request: LlmRequest,
+    enabled: bool = HISTORY_COMPACTION,
+    budget: int = HISTORY_TOOL_TOKEN_BUDGET,
+) -> Optional[Tuple[int, int]]:
+    """
+    Shrinks the turns before the current one.
+
+    Signed URLs in earlier turns become the gs:// URIs of their objects:
+    each is about 1 KB of query string the model never needs again, and
+    after_model signs any gs:// URI it repeats to the user. When the tool
+    responses of earlier turns still exceed `budget` estimated tokens, the
+    oldest ones are replaced with `summarize_response` until they fit. The
+    current turn, from the latest user message on, is never changed, and
+    changed contents are copies, so the session's history stays intact.
+
+    Returns:
+        A tuple of the estimated input tokens (before, after), or None when
+        compaction is disabled.
+    """
+    if not enabled:
+        return None
+    contents = llm_request.contents
+    current = current_turn_start(contents)
+    before = request_tokens(contents)
+
+    compacted: List[types.Content] = []
+    for content in contents[:current]:
+        parts = [_unsign_part(part) for part in content.parts or ()]
+        if any(new is not old for new, old in zip(parts, content.parts or ())):
+            content = content.model_copy(update={"parts": parts})
+        compacted.append(content)
+
+    responses = [
+        (i, j, _part_tokens(part))
+        for i, content in enumerate(compacted)
+        for j, part in enumerate(content.parts or ())
+        if part.function_response and part.function_response.response
+    ]
+    excess = sum(tokens for _, _, tokens in responses) - budget
+    for i, j, tokens in responses:
+        if excess <= 0:
+            break
+        part = compacted[i].parts[j]
+        summary = summarize_response(part.function_response.response)
+        payload = part.function_response.model_copy(update={"response": summary})
+        parts = list(compacted[i].parts)
+        parts[j] = part.model_copy(update={"function_response": payload})
+        compacted[i] = compacted[i].model_copy(update={"parts": parts})
+        excess -= tokens - _part_tokens(parts[j])
+
+    llm_request.contents = compacted + contents[current:]
+    after = request_tokens(llm_request.contents)
+    history_tokens.record(before, {"stage": "before"})
+    history_tokens.record(after, {"stage": "after"})
+    if before > after:
+        tokens_saved.record(before - after, {"source": "compaction"})
+    return before, after
@@ -0,0 +1,291 @@
+import os
+import asyncio
+import inspect
+import logging
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.mcp_tool.mcp_session_manager import MCPSessionManager
+from google.adk.tools.mcp_tool.mcp_tool import MCPTool
+from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
+
+from .singleflight import SingleFlight, flight_key
+from .telemetry import log_event
+
+
+# MCP サーバとのセッション (stdio のサブプロセス、または SSE 接続) をいくつ保持するか
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+# プールしたセッションを ping で確認する間隔 (秒)。0 なら確認しない
+MCP_POOL_HEALTH_INTERVAL = float(os.getenv("MCP_POOL_HEALTH_INTERVAL", "30"))
+MCP_POOL_PING_TIMEOUT = float(os.getenv("MCP_POOL_PING_TIMEOUT", "5"))
+# list_tools の結果 (ツールのスキーマ) を使い回す秒数
+MCP_TOOL_LIST_CACHE_TTL = float(os.getenv("MCP_TOOL_LIST_CACHE_TTL", "600"))
+
+T = TypeVar("T")
+Headers = Optional[Dict[str, str]]
+
+# ツール呼び出しの間、どのメンバー (番号とセッションマネージャ) を使っているか
+_member: contextvars.ContextVar[Optional[Tuple[int, MCPSessionManager]]] = (
+    contextvars.ContextVar("mcp_pool_member", default=None)
+)
+
+
+async def _no_headers() -> Headers:
+    return None
+
+
+class McpSessionPool:
+    """
+    A stand-in for ADK's MCPSessionManager that spreads calls over `size`
+    independent MCP sessions.
+
+    Each member is an MCPSessionManager of its own, so each holds its own
+    subprocess or SSE connection. `run` picks the member with the fewest
+    calls in flight for the duration of a tool call; every session-manager
+    method that ADK's MCPTool and MCPToolset call during that call is
+    forwarded to the same member, whatever its name, so the pool does not
+    depend on the manager's private interface. Dead sessions are recreated
+    by the member on the next call, and `check_health` finds them first.
+
+    `headers` returns the headers to open sessions with. It is called on
+    every warm-up and health check, so refreshed ID tokens are used and the
+    sessions checked are the ones that serve calls.
+    """
+
+    def __init__(
+        self,
+        connection_params: Any,
+        size: int = MCP_POOL_SIZE,
+        headers: Callable[[], Awaitable[Headers]] = _no_headers,
+        **kwargs,
+    ):
+        self._factory = lambda: MCPSessionManager(
+            connection_params=connection_params, **kwargs
+        )
+        self._members = [self._factory() for _ in range(max(1, size))]
+        self._in_flight = [0] * len(self._members)
+        self._next = 0
+        self._headers = headers
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def size(self) -> int:
+        return len(self._members)
+
+    def _pick(self) -> Tuple[int, MCPSessionManager]:
+        # 処理中の呼び出しが最も少ないメンバーを、同数なら順番に選ぶ
+        count = len(self._members)
+        order = [(self._next + i) % count for i in range(count)]
+        index = min(order, key=self._in_flight.__getitem__)
+        self._next = (index + 1) % count
+        return index, self._members[index]
+
+    def _current(self) -> MCPSessionManager:
+        member = _member.get()
+        if member is None:
+            member = self._pick()
+            _member.set(member)
+        return member[1]
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Runs one tool call on the least busy member."""
+        member = self._pick()
+        token = _member.set(member)
+        self._in_flight[member[0]] += 1
+        try:
+            return await call()
+        finally:
+            self._in_flight[member[0]] -= 1
+            _member.reset(token)
+
+    async def create_session(self, headers: Headers = None):
+        return await self._current().create_session(headers=headers)
+
+    def __getattr__(self, name: str) -> Any:
+        # ADK が呼び出し中に使うその他のメソッドは、選んだメンバーに渡す
+        if name.startswith("__") or "_members" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self._current(), name)
+
+    async def warm(self) -> None:
+        """Opens a session on every member concurrently and starts health checks."""
+        headers = await self._headers()
+
+        async def _open(member: MCPSessionManager):
+            try:
+                await member.create_session(headers=headers)
+            except Exception as e:
+                log_event("mcp_pool_warm_failed", logging.WARNING, error=str(e))
+
+        await asyncio.gather(*(_open(member) for member in self._members))
+        if MCP_POOL_HEALTH_INTERVAL > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def check_health(self) -> int:
+        """
+        Pings each idle member's session and replaces the members that fail
+        with new ones. Returns the number of members that were recycled.
+        """
+        headers = await self._headers()
+        recycled = 0
+        for index, member in enumerate(self._members):
+            if self._in_flight[index]:
+                continue
+            try:
+                session = await member.create_session(headers=headers)
+                await asyncio.wait_for(session.send_ping(), MCP_POOL_PING_TIMEOUT)
+                continue
+            except Exception as e:
+                error = repr(e)
+            # ping の間に呼び出しが始まったメンバーは、その呼び出しに任せる
+            if self._in_flight[index] or self._members[index] is not member:
+                continue
+            log_event(
+                "mcp_pool_recycled", logging.WARNING, member=index, error=error
+            )
+            self._members[index] = self._factory()
+            recycled += 1
+            try:
+                await member.close()
+            except Exception as e:
+                log_event("mcp_pool_close_failed", logging.WARNING, error=str(e))
+            try:
+                await self._members[index].create_session(headers=headers)
+            except Exception as e:
+                log_event(
+                    "mcp_pool_reopen_failed",
+                    logging.WARNING,
+                    member=index,
+                    error=str(e),
+                )
+        return recycled
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(MCP_POOL_HEALTH_INTERVAL)
+            await self.check_health()
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(member.close() for member in self._members))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_health_task"] = None
+        state["_in_flight"] = [0] * len(self._members)
+        return state
+
+
+# 同じ引数のツール呼び出しが同時に来たら、MCP サーバへは 1 回だけ送って結果を共有する
+_flights: Dict[str, SingleFlight] = {}
+
+
+class PooledMCPTool(BaseTool):
+    """
+    Wraps an MCPTool so that each call runs on one member of a McpSessionPool.
+
+    With `single_flight`, concurrent calls with identical arguments share one
+    call to the MCP server, across sessions and pooled connections.
+    """
+
+    def __init__(self, tool: MCPTool, pool: McpSessionPool, single_flight: bool):
+        super().__init__(
+            name=tool.name,
+            description=tool.description,
+            is_long_running=tool.is_long_running,
+        )
+        self.tool = tool
+        self._pool = pool
+        self._single_flight = single_flight
+
+    def _get_declaration(self):
+        return self.tool._get_declaration()
+
+    async def process_llm_request(self, *, tool_context, llm_request) -> None:
+        # 宣言は元のツールに任せ、呼び出しはこのラッパーに届くよう差し替える
+        await self.tool.process_llm_request(
+            tool_context=tool_context, llm_request=llm_request
+        )
+        llm_request.tools_dict[self.name] = self
+
+    async def run_async(self, *, args: Dict[str, Any], tool_context) -> Any:
+        def call():
+            return self._pool.run(
+                lambda: self.tool.run_async(args=args, tool_context=tool_context)
+            )
+
+        if not self._single_flight:
+            return await call()
+        flights = _flights.setdefault(self.name, SingleFlight(self.name))
+        result, _ = await flights.do(flight_key(self.name, args), call)
+        return result
+
+
+def _accepts(callable_: Any, name: str) -> bool:
+    return name in inspect.signature(callable_).parameters
+
+
+class PooledMCPToolset(MCPToolset):
+    """
+    An MCPToolset whose tools share a McpSessionPool and whose tool schemas
+    are cached for MCP_TOOL_LIST_CACHE_TTL seconds.
+
+    `warm` opens every pooled session ahead of the first tool call, using the
+    headers from `header_provider` when there is one. With `single_flight`,
+    identical concurrent calls to its tools are coalesced; only enable it for
+    tools whose identical calls may share one result, such as generation.
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_size: int = MCP_POOL_SIZE,
+        single_flight: bool = False,
+        **kwargs,
+    ):
+        if MCP_TOOL_LIST_CACHE_TTL > 0 and _accepts(
+            MCPToolset.__init__, "tool_list_cache_ttl_seconds"
+        ):
+            kwargs.setdefault("tool_list_cache_ttl_seconds", MCP_TOOL_LIST_CACHE_TTL)
+        super().__init__(**kwargs)
+        self._single_flight = single_flight
+        self._provide_headers = kwargs.get("header_provider")
+        # セッションマネージャに渡す引数は、このバージョンの ADK が受け付けるものだけにする
+        options = {
+            name: value
+            for name, value in kwargs.items()
+            if name != "connection_params" and _accepts(MCPSessionManager, name)
+        }
+        # MCPToolset は自身のセッションマネージャをツールに渡すため、プールに置き換える
+        self._mcp_session_manager = McpSessionPool(
+            kwargs["connection_params"], pool_size, self._headers, **options
+        )
+
+    async def _headers(self) -> Headers:
+        if not self._provide_headers:
+            return None
+        headers = self._provide_headers(None)
+        if inspect.isawaitable(headers):
+            headers = await headers
+        return headers or None
+
+    async def get_tools(self, readonly_context=None) -> List[BaseTool]:
+        tools = await super().get_tools(readonly_context)
+        return [
+            PooledMCPTool(tool, self._mcp_session_manager, self._single_flight)
+            if isinstance(tool, MCPTool)
+            else tool
+            for tool in tools
+        ]
+
+    async def warm(self) -> None:
+        try:
+            await self._mcp_session_manager.warm()
+            if not self._provide_headers:
+                # 認証ヘッダのない接続 (stdio) なら、ツールのスキーマも取得しておく
+                await self.get_tools()
+        except Exception as e:
+            log_event("mcp_pool_warm_failed", logging.WARNING, error=str(e))
@@ -0,0 +1,151 @@
+import os
+import re
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+
+# これを超える長さの文字列や、バイナリを符号化したような文字列は URL の検出対象にしない
+REWRITE_MAX_STRING_LENGTH = int(os.getenv("REWRITE_MAX_STRING_LENGTH", "262144"))
+BLOB_SNIFF_LENGTH = 512
+
+_BASE64 = re.compile(r"[A-Za-z0-9+/=_-]+")
+
+# MCP の content part のうち、バイナリ (base64) を持つキー
+MCP_BINARY_KEYS = frozenset({"data", "blob"})
+
+
+def looks_like_blob(text: str) -> bool:
+    """True for data URIs and long runs of base64, such as inline image bytes."""
+    if text.startswith("data:"):
+        return True
+    if len(text) < BLOB_SNIFF_LENGTH:
+        return False
+    return _BASE64.fullmatch(text, 0, BLOB_SNIFF_LENGTH) is not None
+
+
+def is_rewritable(text: str) -> bool:
+    return len(text) <= REWRITE_MAX_STRING_LENGTH and not looks_like_blob(text)
+
+
+def rewrite_tree(
+    obj: Any, rewrite: Callable[[str], str], ignore_keys: Iterable[str] = ()
+) -> Any:
+    """
+    Applies `rewrite` to every eligible string in nested dicts and lists.
+
+    Only the containers on the path to a changed string are copied; everything
+    else is shared with the input, and the input itself is returned when
+    nothing changed. `rewrite` must return its argument unchanged (the same
+    object) when it has nothing to replace.
+    """
+    if isinstance(obj, str):
+        return rewrite(obj) if is_rewritable(obj) else obj
+    if isinstance(obj, dict):
+        changed = None
+        for key, value in obj.items():
+            if key in ignore_keys:
+                continue
+            new = rewrite_tree(value, rewrite, ignore_keys)
+            if new is not value:
+                if changed is None:
+                    changed = dict(obj)
+                changed[key] = new
+        return obj if changed is None else changed
+    if isinstance(obj, list):
+        changed = None
+        for index, value in enumerate(obj):
+            new = rewrite_tree(value, rewrite, ignore_keys)
+            if new is not value:
+                if changed is None:
+                    changed = list(obj)
+                changed[index] = new
+        return obj if changed is None else changed
+    return obj
+
+
+def iter_strings(obj: Any, ignore_keys: Iterable[str] = ()) -> Iterator[str]:
+    """Yields every string `rewrite_tree` would pass to its rewrite function."""
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, str):
+            if is_rewritable(current):
+                yield current
+        elif isinstance(current, dict):
+            stack.extend(v for k, v in current.items() if k not in ignore_keys)
+        elif isinstance(current, list):
+            stack.extend(current)
+
+
+_MCP_TEXT_FIELDS = ("text", "uri")
+# 構造化された結果のフィールド名 (mcp 2 で structured_content に変わった)
+_MCP_STRUCTURED_FIELDS = ("structuredContent", "structured_content")
+
+
+def _structured_field(result: Any) -> Optional[str]:
+    fields = getattr(type(result), "model_fields", {})
+    return next((name for name in _MCP_STRUCTURED_FIELDS if name in fields), None)
+
+
+def iter_mcp_strings(result: Any) -> Iterator[str]:
+    """Yields the strings of an MCP CallToolResult that may hold GCS references."""
+    if isinstance(result, dict):
+        yield from iter_strings(result, MCP_BINARY_KEYS)
+        return
+    for part in getattr(result, "content", None) or []:
+        for model in (part, getattr(part, "resource", None)):
+            for name in _MCP_TEXT_FIELDS:
+                value = getattr(model, name, None)
+                if isinstance(value, str) and is_rewritable(value):
+                    yield value
+    field = _structured_field(result)
+    structured = getattr(result, field, None) if field else None
+    if structured:
+        yield from iter_strings(structured)
+
+
+def _rewrite_model(model: Any, names: Iterable[str], rewrite: Callable[[str], str]):
+    update = {}
+    for name in names:
+        value = getattr(model, name, None)
+        if isinstance(value, str) and is_rewritable(value):
+            new = rewrite(value)
+            if new is not value:
+                update[name] = new
+    return model.model_copy(update=update) if update else model
+
+
+def rewrite_mcp_result(result: Any, rewrite: Callable[[str], str]) -> Any:
+    """
+    Applies `rewrite` to every content part of an MCP CallToolResult.
+
+    Works on both the pydantic model and its dict dump. Binary parts (images,
+    audio, blobs) are never scanned, and only the changed parts and the result
+    itself are copied. Returns `result` itself when nothing changed.
+    """
+    if isinstance(result, dict):
+        return rewrite_tree(result, rewrite, MCP_BINARY_KEYS)
+
+    content = getattr(result, "content", None) or []
+    new_content = None
+    for index, part in enumerate(content):
+        new_part = _rewrite_model(part, _MCP_TEXT_FIELDS, rewrite)
+        resource = getattr(new_part, "resource", None)
+        if resource is not None:
+            new_resource = _rewrite_model(resource, _MCP_TEXT_FIELDS, rewrite)
+            if new_resource is not resource:
+                new_part = new_part.model_copy(update={"resource": new_resource})
+        if new_part is not part:
+            if new_content is None:
+                new_content = list(content)
+            new_content[index] = new_part
+
+    update = {}
+    if new_content is not None:
+        update["content"] = new_content
+    field = _structured_field(result)
+    structured = getattr(result, field, None) if field else None
+    if structured:
+        new_structured = rewrite_tree(structured, rewrite)
+        if new_structured is not structured:
+            update[field] = new_structured
+    return result.model_copy(update=update) if update else result
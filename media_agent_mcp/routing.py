@@ -0,0 +1,147 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from .telemetry import routing_decisions
+
+
+# 品質優先のモデルと、混雑時に切り替える高速なモデル
+VEO_MODEL = os.getenv("VEO_MODEL", "veo-3.0-generate-preview")
+VEO_FAST_MODEL = os.getenv("VEO_FAST_MODEL", "veo-3.0-fast-generate-001")
+IMAGEN_MODEL = os.getenv("IMAGEN_MODEL", "imagen-4.0-generate-001")
+IMAGEN_FAST_MODEL = os.getenv("IMAGEN_FAST_MODEL", "imagen-4.0-fast-generate-001")
+
+# 直近の完了レイテンシ (p90, 秒) の SLO と、処理中のリクエスト数のしきい値
+# どちらかを超えたら高速なモデルに切り替える。0 ならその条件では切り替えない
+VEO_LATENCY_SLO = float(os.getenv("GENMEDIA_VEO_LATENCY_SLO", "120"))
+VEO_FAST_THRESHOLD = int(os.getenv("GENMEDIA_VEO_FAST_THRESHOLD", "3"))
+IMAGEN_LATENCY_SLO = float(os.getenv("GENMEDIA_IMAGEN_LATENCY_SLO", "20"))
+IMAGEN_FAST_THRESHOLD = int(os.getenv("GENMEDIA_IMAGEN_FAST_THRESHOLD", "8"))
+
+# レイテンシを集計する時間窓 (秒)。この間に ROUTER_MIN_SAMPLES 件以上の完了がなければ判断に使わない
+ROUTER_WINDOW_SECONDS = float(os.getenv("GENMEDIA_ROUTER_WINDOW_SECONDS", "600"))
+ROUTER_MIN_SAMPLES = 3
+# 元のモデルに戻すのは、SLO やしきい値のこの割合まで下がってから (行ったり来たりを防ぐ)
+ROUTER_RECOVERY_RATIO = 0.8
+
+DEFAULT = "default"
+OVERRIDE = "override"
+LATENCY_SLO = "latency_slo"
+CONCURRENCY = "concurrency"
+
+_OPERATION_MODEL = re.compile(r"/models/([^/]+)/operations/")
+
+
+def model_from_operation(operation_name: str) -> Optional[str]:
+    """Returns the model in a Vertex AI operation name, if it has one."""
+    match = _OPERATION_MODEL.search(operation_name or "")
+    return match.group(1) if match else None
+
+
+class ModelRouter:
+    """
+    Picks between a quality model and a fast model of one family.
+
+    The router tracks the requests in flight for the family and the recent
+    completion latency of each model. New requests go to the fast model
+    while the quality model's p90 latency over the last `window` seconds is
+    above `latency_slo`, or while `max_in_flight` or more requests are in
+    flight. They go back to the quality model once both have dropped to
+    ROUTER_RECOVERY_RATIO of their limits. Latency samples age out of the
+    window, so a quality model that receives no traffic while degraded is
+    judged by the load alone.
+
+    Callers report work with `begin()` and `end(model, seconds)`.
+    """
+
+    def __init__(
+        self,
+        family: str,
+        model: str,
+        fast_model: str,
+        latency_slo: float,
+        max_in_flight: int,
+        window: float = ROUTER_WINDOW_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.family = family
+        self.model = model
+        self.fast_model = fast_model
+        self.latency_slo = latency_slo
+        self.max_in_flight = max_in_flight
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._in_flight = 0
+        self._degraded: Optional[str] = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def latency(self, model: str) -> Optional[float]:
+        """The p90 completion latency of `model` within the window, or None."""
+        with self._lock:
+            return self._p90(model)
+
+    def _p90(self, model: str) -> Optional[float]:
+        samples = self._latencies.get(model)
+        if not samples:
+            return None
+        horizon = self._clock() - self.window
+        while samples and samples[0][0] < horizon:
+            samples.popleft()
+        if len(samples) < ROUTER_MIN_SAMPLES:
+            return None
+        values = sorted(seconds for _, seconds in samples)
+        return values[min(len(values) - 1, int(len(values) * 0.9))]
+
+    def _overloaded(self, ratio: float) -> Optional[str]:
+        p90 = self._p90(self.model)
+        if self.latency_slo > 0 and p90 is not None and p90 > self.latency_slo * ratio:
+            return LATENCY_SLO
+        if self.max_in_flight > 0 and self._in_flight >= self.max_in_flight * ratio:
+            return CONCURRENCY
+        return None
+
+    def route(self, override: Optional[str] = None) -> Tuple[str, str]:
+        """Returns (model, reason); `override` wins when given."""
+        if override:
+            model, reason = override, OVERRIDE
+        else:
+            with self._lock:
+                if self._degraded is None:
+                    self._degraded = self._overloaded(1.0)
+                else:
+                    self._degraded = self._overloaded(ROUTER_RECOVERY_RATIO)
+                reason = self._degraded or DEFAULT
+                model = self.fast_model if self._degraded else self.model
+        routing_decisions.add(
+            1, {"family": self.family, "model": model, "reason": reason}
+        )
+        return model, reason
+
+    def begin(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+
+    def end(self, model: Optional[str], seconds: Optional[float] = None) -> None:
+        """Finishes a request; `seconds` is its latency when it completed successfully."""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if model and seconds is not None:
+                self._latencies.setdefault(model, deque(maxlen=256)).append(
+                    (self._clock(), seconds)
+                )
+
+
+veo_router = ModelRouter(
+    "veo", VEO_MODEL, VEO_FAST_MODEL, VEO_LATENCY_SLO, VEO_FAST_THRESHOLD
+)
+imagen_router = ModelRouter(
+    "imagen", IMAGEN_MODEL, IMAGEN_FAST_MODEL, IMAGEN_LATENCY_SLO, IMAGEN_FAST_THRESHOLD
+)
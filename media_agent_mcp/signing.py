@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from google.auth import credentials as auth_credentials
+from google.auth import crypt
+
+from .lazy import Lazy
+
+
+CacheKey = Tuple[str, str, str]
+ObjectKey = Tuple[str, str]
+
+# 署名付き URL の有効期限と、キャッシュから払い出すために最低限残っているべき有効期間
+SIGNED_URL_EXPIRATION_SECONDS = int(os.getenv("SIGNED_URL_EXPIRATION_SECONDS", "300"))
+SIGNED_URL_MIN_REMAINING_SECONDS = int(
+    os.getenv("SIGNED_URL_MIN_REMAINING_SECONDS", "60")
+)
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "1024"))
+
+# 1 つのツール応答に含まれる複数パスを同時に署名するスレッド数
+SIGNING_CONCURRENCY = int(os.getenv("SIGNING_CONCURRENCY", "8"))
+
+# サービスアカウント鍵 (ファイルやマウントされたシークレット) でローカル署名する場合の設定
+# SIGNING_PROCESSES が 1 以上なら、同時署名数が閾値を超えた分の RSA 計算をプロセスプールへ逃がす
+SIGNING_KEY_FILE = os.getenv("SIGNING_KEY_FILE")
+SIGNING_PROCESSES = int(os.getenv("SIGNING_PROCESSES", "0"))
+SIGNING_OFFLOAD_THRESHOLD = int(os.getenv("SIGNING_OFFLOAD_THRESHOLD", "2"))
+
+
+class SignedUrlCache:
+    """
+    A bounded, thread-safe LRU cache of signed URLs keyed by (bucket, object, method).
+
+    Each entry remembers when its URL expires. A cached URL is only handed out
+    while at least `min_remaining` seconds of its lifetime are left, so callers
+    never pass on a URL that is about to stop working.
+    """
+
+    def __init__(
+        self,
+        max_size: int = SIGNED_URL_CACHE_SIZE,
+        min_remaining: float = SIGNED_URL_MIN_REMAINING_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_size = max_size
+        self.min_remaining = min_remaining
+        self._clock = clock
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+        }
+
+    def get(self, bucket: str, blob: str, method: str = "GET") -> Optional[str]:
+        """Returns a cached URL with enough lifetime left, or None."""
+        key = (bucket, blob, method)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            url, expires_at = entry
+            if expires_at - self._clock() < self.min_remaining:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return url
+
+    def put(
+        self, bucket: str, blob: str, method: str, url: str, lifetime: float
+    ) -> None:
+        """Stores a URL that stays valid for `lifetime` seconds from now."""
+        key = (bucket, blob, method)
+        with self._lock:
+            self._entries[key] = (url, self._clock() + lifetime)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns hit / miss / expiry / eviction counters and the current size."""
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+
+signed_url_cache = SignedUrlCache()
+
+
+_executor = Lazy(
+    lambda: ThreadPoolExecutor(
+        max_workers=SIGNING_CONCURRENCY, thread_name_prefix="signer"
+    )
+)
+
+
+def sign_concurrently(
+    keys: Iterable[ObjectKey], sign: Callable[[ObjectKey], Optional[str]]
+) -> Dict[ObjectKey, Optional[str]]:
+    """
+    Signs every unique object with `sign` on a bounded thread pool.
+
+    Each signature can be an IAM signBlob round trip, so a response holding
+    several assets waits for the slowest signature instead of their sum.
+
+    Args:
+        keys: (bucket, object) pairs to sign. Duplicates are signed once.
+        sign: Function returning the signed URL for a pair, or None.
+
+    Returns:
+        A mapping from each pair to its signed URL (or None on failure).
+    """
+    unique = list(dict.fromkeys(keys))
+    if len(unique) <= 1:
+        return {key: sign(key) for key in unique}
+    return dict(zip(unique, _executor.get().map(sign, unique)))
+
+
+_worker_signer: Optional[crypt.Signer] = None
+
+
+def _init_worker(key_info: Dict[str, Any]) -> None:
+    global _worker_signer
+    _worker_signer = crypt.RSASigner.from_service_account_info(key_info)
+
+
+def _sign_in_worker(message: bytes) -> bytes:
+    return _worker_signer.sign(message)
+
+
+class LocalKeySigner(auth_credentials.Signing):
+    """
+    Signs V4 URLs locally with a service account private key.
+
+    The key is parsed once and kept in memory, so a signature costs one RSA
+    operation instead of an IAM Credentials signBlob round trip. Pass an
+    instance as `credentials` to `Blob.generate_signed_url`.
+
+    When `processes` is positive, signatures beyond `offload_threshold`
+    concurrent ones are computed on a process pool whose workers parse the
+    key once at startup, so RSA work does not contend for the GIL under load.
+    """
+
+    def __init__(
+        self,
+        key_info: Dict[str, Any],
+        processes: int = 0,
+        offload_threshold: int = SIGNING_OFFLOAD_THRESHOLD,
+    ):
+        self._signer = crypt.RSASigner.from_service_account_info(key_info)
+        self._email = key_info["client_email"]
+        self._offload_threshold = offload_threshold
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._pool = (
+            ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker, initargs=(key_info,)
+            )
+            if processes > 0
+            else None
+        )
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "LocalKeySigner":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    @property
+    def signer(self) -> crypt.Signer:
+        return self._signer
+
+    @property
+    def signer_email(self) -> str:
+        return self._email
+
+    @property
+    def service_account_email(self) -> str:
+        return self._email
+
+    def sign_bytes(self, message: bytes) -> bytes:
+        with self._lock:
+            self._in_flight += 1
+            offload = self._pool is not None and (
+                self._in_flight > self._offload_threshold
+            )
+        try:
+            if offload:
+                return self._pool.submit(_sign_in_worker, message).result()
+            return self._signer.sign(message)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+_local_signer = Lazy(
+    lambda: LocalKeySigner.from_file(SIGNING_KEY_FILE, processes=SIGNING_PROCESSES)
+)
+
+
+def get_local_signer() -> Optional[LocalKeySigner]:
+    """
+    Returns the LocalKeySigner configured by SIGNING_KEY_FILE, or None when
+    URLs should be signed through the IAM signBlob API instead.
+    """
+    if not SIGNING_KEY_FILE:
+        return None
+    return _local_signer.get()
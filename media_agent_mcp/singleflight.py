@@ -0,0 +1,72 @@
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from .telemetry import coalesced_calls
+
+
+T = TypeVar("T")
+
+
+def flight_key(name: str, params: Dict[str, Any]) -> str:
+    """Returns a canonical SHA-256 hash of a call's name and parameters."""
+    payload = json.dumps([name, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it runs wait for the same task and receive its result or its
+    exception. Nothing is kept once the task finishes, so a failed call is
+    retried by the next caller.
+
+    A caller that is cancelled only stops waiting. The shared call keeps
+    running even when nobody waits for it anymore: a generation is billed
+    once it is submitted, and its result still reaches the result cache or
+    the job store. If the shared task itself is cancelled, the callers that
+    were not cancelled start the call again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # 待っている呼び出し元がいなくても "never retrieved" の警告を出さない
+            task.exception()
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Runs `call` once for all concurrent callers with `key`.
+
+        Returns:
+            A tuple of (result, whether it was shared with an earlier caller).
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            task = self._calls.get(key)
+            shared = task is not None and task.get_loop() is loop and not task.done()
+            if shared:
+                coalesced_calls.add(1, {"operation": self.name})
+            else:
+                task = loop.create_task(call())
+                self._calls[key] = task
+                task.add_done_callback(lambda t, key=key: self._forget(key, t))
+            try:
+                return await asyncio.shield(task), shared
+            except asyncio.CancelledError:
+                current = asyncio.current_task()
+                if task.cancelled() and not (current and current.cancelling()):
+                    continue
+                raise
@@ -0,0 +1,71 @@
+"""
+テスト共通の設定: GCP に接続せずに済むよう、モジュールの import より前に環境変数を設定する
+
+genai.Client、GCS、ID トークンのフェイクは benchmarks/fakes.py のものを使う
+"""
+
+import os
+import sys
+import tempfile
+import warnings
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+os.environ.setdefault("GENMEDIA_BUCKET", "test-bucket")
+os.environ.setdefault("REFERENCE_IMAGE_URI", "gs://test-bucket/ref.png")
+os.environ.setdefault("IMAGEN_INSTRUCTION", "")
+os.environ.setdefault("GENMEDIA_JOB_DB", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+os.environ.setdefault("TELEMETRY_LOG_SAMPLE_RATE", "0")
+os.environ.setdefault("GENMEDIA_RETRY_BASE_SECONDS", "0.001")
+warnings.simplefilter("ignore")
+
+import pytest  # noqa: E402
+
+import fakes  # noqa: E402
+
+
+class Ready:
+    """A Lazy that is already built."""
+
+    def __init__(self, value):
+        self._value = value
+        self.ready = True
+
+    def get(self):
+        return self._value
+
+
+@pytest.fixture(scope="session")
+def telemetry():
+    """In-memory span exporter and metric reader, installed once per process."""
+    from media_agent.telemetry import use_in_memory_exporters
+
+    return use_in_memory_exporters()
+
+
+@pytest.fixture
+def genai_client(monkeypatch):
+    """A FakeGenaiClient used by the genmedia tools and the job manager."""
+    from media_agent.tools import genmedia, jobs
+
+    client = fakes.FakeGenaiClient(polls_until_done=2)
+    monkeypatch.setattr(genmedia, "get_client", lambda: client)
+    monkeypatch.setattr(genmedia, "poll_interval", 0)
+    monkeypatch.setattr(jobs, "get_client", lambda: client)
+    return client
+
+
+@pytest.fixture
+def signer(monkeypatch):
+    """Signs GCS URLs of media_agent.callbacks locally with a fake key."""
+    from media_agent import callbacks
+
+    signer = fakes.FakeSigner()
+    monkeypatch.setattr(callbacks, "get_local_signer", lambda: signer)
+    monkeypatch.setattr(
+        callbacks, "_storage", Ready((signer, fakes.fake_storage_client()))
+    )
+    callbacks.signed_url_cache.clear()
+    yield signer
+    callbacks.signed_url_cache.clear()
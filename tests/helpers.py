@@ -0,0 +1,46 @@
+"""テストで使う LlmRequest / LlmResponse の組み立て"""
+
+from typing import Any, Dict, Optional
+
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+SIGNED_URL = (
+    "https://storage.googleapis.com/test-bucket/out/{}.png"
+    "?X-Goog-Algorithm=GOOG4-RSA-SHA256&X-Goog-Expires=300"
+    "&X-Goog-SignedHeaders=host&X-Goog-Signature={}"
+)
+
+
+def user(text: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def model(text: str) -> types.Content:
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+
+def call(name: str, args: Dict[str, Any], call_id: Optional[str] = None) -> types.Content:
+    return types.Content(
+        role="model",
+        parts=[types.Part(function_call=types.FunctionCall(id=call_id, name=name, args=args))],
+    )
+
+
+def result(name: str, response: Dict[str, Any]) -> types.Content:
+    return types.Content(
+        role="user",
+        parts=[
+            types.Part(
+                function_response=types.FunctionResponse(name=name, response=response)
+            )
+        ],
+    )
+
+
+def request(*contents: types.Content) -> LlmRequest:
+    return LlmRequest(model="gemini-2.5-flash", contents=list(contents))
+
+
+def answer(text: str) -> LlmResponse:
+    return LlmResponse(content=model(text))
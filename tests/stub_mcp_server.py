@@ -0,0 +1,29 @@
+"""
+テスト用のスタブ MCP サーバ (stdio)。ツールは自身のプロセス ID を返す
+
+    python tests/stub_mcp_server.py
+"""
+
+import os
+import uuid
+import asyncio
+
+try:
+    from mcp.server.mcpserver import MCPServer
+except ImportError:  # mcp < 2
+    from mcp.server.fastmcp import FastMCP as MCPServer
+
+STUB_LATENCY_SECONDS = float(os.getenv("STUB_LATENCY_SECONDS", "0.2"))
+
+server = MCPServer("genmedia-stub")
+
+
+@server.tool()
+async def imagen_t2i(prompt: str) -> str:
+    """Generates an image (stub)."""
+    await asyncio.sleep(STUB_LATENCY_SECONDS)
+    return f"{os.getpid()}:{uuid.uuid4().hex}"
+
+
+if __name__ == "__main__":
+    server.run()
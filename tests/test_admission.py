@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from google import genai
+from google.api_core import exceptions
+
+from media_agent.tools import admission
+from media_agent.tools.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    TokenBucket,
+    is_transient,
+    retry_after,
+    with_retries,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_at_its_rate():
+    clock = Clock()
+    bucket = TokenBucket(60, burst=2, clock=clock)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == pytest.approx(1.0)
+    clock.now = 1.0
+    assert bucket.try_take() == 0
+
+
+@pytest.mark.asyncio
+async def test_operation_slots_limit_concurrency():
+    controller = AdmissionController("veo", 600000, max_operations=1, timeout=1)
+    await controller.acquire()
+    waiting = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+    assert controller.queue_depth == 1
+    controller.release()
+    await asyncio.wait_for(waiting, 1)
+    assert controller.operations == 1
+
+
+@pytest.mark.asyncio
+async def test_requests_are_rejected_after_the_deadline():
+    controller = AdmissionController("veo", 600000, max_operations=1)
+    await controller.acquire()
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire(timeout=0.1)
+    assert rejected.value.model == "veo"
+    assert controller.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_requests_leave_the_queue():
+    controller = AdmissionController("veo", 600000, max_operations=1, timeout=5)
+    await controller.acquire()
+    waiting = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0.01)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert controller.queue_depth == 0
+
+
+@pytest.fixture
+def controllers(monkeypatch):
+    monkeypatch.setattr(admission, "_controllers", {})
+
+
+def test_controllers_are_per_model(controllers, monkeypatch):
+    monkeypatch.setenv("GENMEDIA_VEO_3_0_FAST_GENERATE_001_MAX_OPERATIONS", "8")
+    monkeypatch.setenv("GENMEDIA_VEO_3_0_FAST_GENERATE_001_RPM", "30")
+    quality = admission.get_controller("veo-3.0-generate-001")
+    fast = admission.get_controller("veo-3.0-fast-generate-001")
+    imagen = admission.get_controller("imagen-4.0-generate-001")
+
+    assert admission.get_controller("veo-3.0-generate-001") is quality
+    assert len({id(quality), id(fast), id(imagen)}) == 3
+    assert quality.max_operations == admission.VEO_MAX_OPERATIONS
+    assert quality.bucket.rate == admission.VEO_RPM / 60
+    assert fast.max_operations == 8
+    assert fast.bucket.rate == 0.5
+    assert imagen.max_operations is None
+
+
+def _api_error(code: int) -> genai.errors.APIError:
+    return genai.errors.APIError(code, {"error": {"message": "error"}})
+
+
+def test_transient_errors():
+    assert is_transient(_api_error(429))
+    assert is_transient(exceptions.ServiceUnavailable("down"))
+    assert not is_transient(_api_error(400))
+    assert not is_transient(AdmissionRejected("veo", 1))
+
+
+def test_retry_after_reads_retry_info():
+    error = _api_error(429)
+    error.details = {
+        "error": {
+            "details": [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "2s"}
+            ]
+        }
+    }
+    assert retry_after(error) == 2.0
+    assert retry_after(_api_error(429)) is None
+
+
+@pytest.mark.asyncio
+async def test_with_retries_retries_transient_errors_only():
+    attempts = 0
+
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise _api_error(503)
+        return "ok"
+
+    assert await with_retries(flaky, "veo", base=0.001) == "ok"
+    assert attempts == 3
+
+    async def invalid():
+        nonlocal attempts
+        attempts += 1
+        raise _api_error(400)
+
+    attempts = 0
+    with pytest.raises(genai.errors.APIError):
+        await with_retries(invalid, "veo", base=0.001)
+    assert attempts == 1
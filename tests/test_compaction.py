@@ -0,0 +1,60 @@
+from media_agent.compaction import compact_history, summarize_response, unsign_urls
+
+from .helpers import SIGNED_URL, call, model, request, result, user
+
+
+def test_unsign_urls():
+    text = f"画像はこちら: {SIGNED_URL.format(0, 'ab' * 32)} です"
+    assert unsign_urls(text) == "画像はこちら: gs://test-bucket/out/0.png です"
+    plain = "https://example.com/out/0.png"
+    assert unsign_urls(plain) is plain
+
+
+def test_unsafe_object_names_keep_their_signed_url():
+    url = SIGNED_URL.format(0, "ab").replace("out/0.png", "out/my%20cat.png")
+    assert unsign_urls(url) == url
+
+
+def test_urls_that_could_not_be_signed_again_are_kept():
+    url = SIGNED_URL.format(0, "ab").replace("out/0.png", "out/0.txt")
+    assert unsign_urls(url) == url
+    text = f"**{SIGNED_URL.format(0, 'ab')}**。"
+    assert unsign_urls(text) == "**gs://test-bucket/out/0.png**。"
+
+
+def test_summarize_response_keeps_short_values():
+    summary = summarize_response(
+        {"status": "success", "uris": ["gs://b/0.png"], "prompt": "x" * 1000}
+    )
+    assert summary == {"status": "success", "uris": ["gs://b/0.png"], "compacted": True}
+
+
+def test_earlier_turns_are_compacted_and_the_current_turn_is_kept():
+    signed = SIGNED_URL.format(0, "ab" * 256)
+    contents = [
+        user("猫の画像を作って"),
+        call("imagen_t2i", {"prompt": "a cat"}),
+        result("imagen_t2i", {"status": "success", "uri": signed, "log": "x" * 4000}),
+        model(f"できました: {signed}"),
+        user(f"これを動画にして {signed}"),
+    ]
+    llm_request = request(*contents)
+
+    before, after = compact_history(llm_request, enabled=True, budget=100)
+
+    assert after < before
+    compacted = llm_request.contents
+    assert compacted[2].parts[0].function_response.response == {
+        "status": "success",
+        "uri": "gs://test-bucket/out/0.png",
+        "compacted": True,
+    }
+    assert compacted[3].parts[0].text == "できました: gs://test-bucket/out/0.png"
+    assert compacted[4] is contents[4]
+    # セッションの履歴 (元の Content) は書き換えない
+    assert contents[3].parts[0].text == f"できました: {signed}"
+
+
+def test_disabled_compaction_changes_nothing():
+    llm_request = request(user("hi"))
+    assert compact_history(llm_request, enabled=False) is None
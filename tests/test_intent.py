@@ -0,0 +1,70 @@
+import pytest
+from google.adk.models import LlmResponse
+
+from media_agent import intent
+from media_agent.intent import CAPABILITIES, CLARIFY, GENERATE, GREETING, OTHER, classify
+
+from .helpers import answer, call, model, request, result, user
+
+
+@pytest.mark.parametrize(
+    "text, label",
+    [
+        ("こんにちは", GREETING),
+        ("Hello!", GREETING),
+        ("何ができますか？", CAPABILITIES),
+        ("猫の画像を作って", GENERATE),
+        ("海辺の動画をお願いします", GENERATE),
+    ],
+)
+def test_classify(text, label):
+    assert classify(text).label == label
+
+
+def test_long_messages_are_not_classified():
+    assert classify("こんにちは" * 20) == (OTHER, 0.0)
+
+
+def test_fast_path_answers_greetings_when_on():
+    predicted, response = intent.fast_path(request(user("こんにちは")), "inv", "on")
+    assert predicted.label == GREETING
+    assert response.content.parts[0].text == intent.TEMPLATES[GREETING]
+
+
+def test_fast_path_never_answers_in_shadow_mode():
+    predicted, response = intent.fast_path(request(user("こんにちは")), "inv-s", "shadow")
+    assert predicted.label == GREETING and response is None
+    assert intent.compare_with_model(answer("こんにちは！"), "inv-s") == (
+        predicted,
+        True,
+    )
+
+
+def test_shadow_prediction_disagrees_when_the_model_calls_a_tool():
+    intent.fast_path(request(user("こんにちは")), "inv-t", "shadow")
+    response = LlmResponse(content=call("imagen_t2i", {"prompt": "hello"}))
+    assert intent.compare_with_model(response, "inv-t")[1] is False
+
+
+def test_fast_path_is_off():
+    assert intent.fast_path(request(user("こんにちは")), "inv", "off") == (None, None)
+
+
+def test_fast_path_asks_what_to_create_on_the_opening_turn():
+    predicted, response = intent.fast_path(request(user("何か作って")), "inv", "on")
+    assert predicted.label == CLARIFY
+    assert response.content.parts[0].text == intent.TEMPLATES[CLARIFY]
+
+
+@pytest.mark.parametrize("text", ["同じのを作って", "3枚作って", "OK お願い", "こんにちは"])
+def test_fast_path_leaves_follow_ups_to_the_model(text):
+    history = (
+        user("猫の画像を作って"),
+        call("imagen_t2i", {"prompt": "a cat"}),
+        result("imagen_t2i", {"status": "success"}),
+        model("猫の画像を作りました"),
+    )
+    assert intent.fast_path(request(*history, user(text)), "inv-f", "on") == (None, None)
+    assert intent.fast_path(
+        request(user("こんにちは"), model("こんにちは！"), user(text)), "inv-f", "on"
+    ) == (None, None)
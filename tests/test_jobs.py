@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from google import genai
+
+from media_agent.tools import jobs
+
+OPERATION = "projects/p/locations/l/publishers/google/models/veo-3.0-generate-001/operations/1"
+
+
+@pytest.fixture
+def manager(tmp_path, genai_client):
+    return jobs.JobManager(jobs.SqliteJobStore(str(tmp_path / "jobs.db")), 0)
+
+
+def _finished(response=None, error=None):
+    async def get(operation):
+        return genai.types.GenerateVideosOperation(
+            name=operation.name, done=True, response=response, error=error
+        )
+
+    return get
+
+
+async def _submit(manager, name=OPERATION, cache_key=None) -> str:
+    # 投入する側 (genmedia) が operation の枠を確保してから submit する
+    jobs.get_controller(jobs.model_from_operation(name)).occupy()
+    return await manager.submit(name, "veo_i2v", cache_key)
+
+
+@pytest.mark.asyncio
+async def test_job_succeeds_with_the_video_uris(manager):
+    job_id = await _submit(manager)
+    job = await manager.get(job_id, wait_seconds=5)
+    assert job["status"] == jobs.SUCCEEDED
+    assert job["uris"] == ["gs://bench-bucket/1/sample_0.mp4"]
+
+
+@pytest.mark.asyncio
+async def test_rai_filtered_operation_fails_the_job(manager, genai_client):
+    response = genai.types.GenerateVideosResponse(
+        generated_videos=None, rai_media_filtered_reasons=["unsafe content"]
+    )
+    genai_client.aio.operations.get = _finished(response)
+    job = await manager.get(await _submit(manager), wait_seconds=5)
+    assert job["status"] == jobs.FAILED
+    assert "unsafe content" in job["error"]
+
+
+@pytest.mark.asyncio
+async def test_operation_without_response_fails_the_job(manager, genai_client):
+    genai_client.aio.operations.get = _finished()
+    job = await manager.get(await _submit(manager), wait_seconds=5)
+    assert job["status"] == jobs.FAILED
+    assert job["error"] == "no videos were generated"
+
+
+@pytest.mark.asyncio
+async def test_unexpected_error_after_polling_fails_the_job(manager, monkeypatch):
+    def broken(operation):
+        raise ValueError("malformed operation")
+
+    monkeypatch.setattr(jobs, "video_uris", broken)
+    job_id = await _submit(manager, cache_key="key")
+    job = await manager.get(job_id, wait_seconds=5)
+    assert job["status"] == jobs.FAILED
+    assert await manager.find_running("key") is None
+
+
+@pytest.mark.asyncio
+async def test_missing_operation_fails_the_job(manager, genai_client):
+    async def get(operation):
+        raise genai.errors.APIError(404, {"error": {"message": "not found"}})
+
+    genai_client.aio.operations.get = get
+    job = await manager.get(await _submit(manager), wait_seconds=5)
+    assert job["status"] == jobs.FAILED
+    assert job["error"].startswith("operation not found")
+
+
+@pytest.mark.asyncio
+async def test_running_jobs_are_found_by_cache_key(manager, genai_client):
+    genai_client.polls_until_done = 1000
+    job_id = await _submit(manager, cache_key="key")
+    assert await manager.find_running("key") == job_id
+    assert await manager.find_running("other") is None
+    for task in list(manager._tasks.values()):
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_resume_polls_unfinished_jobs(tmp_path, genai_client):
+    store = jobs.SqliteJobStore(str(tmp_path / "jobs.db"))
+    genai_client.polls_until_done = 1000
+    first = jobs.JobManager(store, 0)
+    job_id = await _submit(first)
+    for task in list(first._tasks.values()):
+        task.cancel()
+    await asyncio.sleep(0)
+
+    # 再起動後のプロセスでは、未完了のジョブを取得した時点でポーリングを再開する
+    genai_client.polls_until_done = 1
+    job = await jobs.JobManager(store, 0).get(job_id, wait_seconds=5)
+    assert job["status"] == jobs.SUCCEEDED
@@ -0,0 +1,112 @@
+import httpx
+import pytest
+
+from media_agent import links, server
+from media_agent.lazy import Lazy
+from media_agent.links import (
+    MemoryLinkStore,
+    SqliteLinkStore,
+    create_redirect_app,
+    link_id,
+    short_link_problem,
+    short_links,
+)
+
+
+def test_link_id_is_stable_and_keyed():
+    assert link_id("b", "o.png", "secret") == link_id("b", "o.png", "secret")
+    assert link_id("b", "o.png", "secret") != link_id("b", "o.png", "other")
+    assert len(link_id("b", "o.png", "secret")) == 22
+
+
+def test_memory_store_expires_entries():
+    now = [0.0]
+    store = MemoryLinkStore(max_size=1, ttl=10, clock=lambda: now[0])
+    store.put("a", ("b", "a.png"))
+    assert store.get("a") == ("b", "a.png")
+    now[0] = 10
+    assert store.get("a") is None
+    store.put("a", ("b", "a.png"))
+    store.put("c", ("b", "c.png"))
+    assert store.get("a") is None
+
+
+def test_sqlite_store_is_opened_on_first_use(tmp_path, monkeypatch):
+    path = tmp_path / "links.db"
+    monkeypatch.setattr(links, "SHORT_LINK_DB_PATH", str(path))
+    monkeypatch.setattr(links, "_link_store", Lazy(links._create_link_store))
+    assert not path.exists()
+
+    [link] = short_links([("b", "a.png")], "").values()
+    assert isinstance(links._link_store.get(), SqliteLinkStore)
+    assert SqliteLinkStore(str(path)).get(link.rsplit("/", 1)[-1]) == ("b", "a.png")
+
+
+def test_sqlite_store_is_shared_by_connections(tmp_path):
+    path = str(tmp_path / "links.db")
+    SqliteLinkStore(path).put("a", ("b", "a.png"))
+    assert SqliteLinkStore(path).get("a") == ("b", "a.png")
+    assert SqliteLinkStore(path).get("missing") is None
+
+
+def test_short_links_register_each_object_once():
+    store = MemoryLinkStore()
+    keys = [("b", "a.png"), ("b", "a.png"), ("b", "c.png")]
+    links = short_links(keys, "https://agent.example.com", store)
+    assert len(links) == 2
+    link = links[("b", "a.png")]
+    assert link.startswith("https://agent.example.com/m/")
+    assert store.get(link.rsplit("/", 1)[-1]) == ("b", "a.png")
+
+
+async def _get(app, path: str, method: str = "GET"):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path}, None, send)
+    headers = dict(sent[0].get("headers", []))
+    return sent[0]["status"], {k.decode(): v.decode() for k, v in headers.items()}
+
+
+@pytest.mark.asyncio
+async def test_redirect_app():
+    store = MemoryLinkStore()
+    [link] = short_links([("b", "a.png")], "", store).values()
+    app = create_redirect_app(lambda b, o: f"https://signed/{b}/{o}", store)
+
+    status, headers = await _get(app, link)
+    assert status == 302
+    assert headers["location"] == "https://signed/b/a.png"
+    assert (await _get(app, "/m/unknown"))[0] == 404
+    assert (await _get(app, link, "POST"))[0] == 405
+
+    failing = create_redirect_app(lambda b, o: None, store)
+    assert (await _get(failing, link))[0] == 502
+
+
+def test_short_links_need_a_shared_secret_and_store():
+    base = "https://agent.example.com"
+    assert short_link_problem("", "secret", "links.db")
+    assert "SECRET" in short_link_problem(base, "", "links.db")
+    assert "DB" in short_link_problem(base, "secret", None)
+    assert short_link_problem(base, "secret", "links.db") is None
+    # 既定の設定では短縮リンクを使わない
+    assert not links.SHORT_LINKS
+
+
+@pytest.mark.asyncio
+async def test_server_mounts_the_redirector(telemetry, signer, monkeypatch):
+    # ADK のサーバはトレースの設定もするため、テスト用のエクスポータ (telemetry) を先に設定しておく
+    monkeypatch.setattr(server, "SHORT_LINKS", True)
+    app = server.create_app(web=False)
+    [link] = short_links([("test-bucket", "out/a.png")], "").values()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get(link)
+    assert response.status_code == 302
+    assert response.headers["location"].startswith(
+        "https://storage.googleapis.com/test-bucket/out/a.png?"
+    )
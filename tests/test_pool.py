@@ -0,0 +1,149 @@
+import os
+import sys
+import asyncio
+
+import pytest
+from google.adk.tools.mcp_tool.mcp_toolset import (
+    StdioConnectionParams,
+    StdioServerParameters,
+)
+
+from media_agent_mcp import pool
+from media_agent_mcp.pool import McpSessionPool, PooledMCPTool, PooledMCPToolset
+
+STUB_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_mcp_server.py")
+
+
+def _stub_toolset(**kwargs) -> PooledMCPToolset:
+    return PooledMCPToolset(
+        connection_params=StdioConnectionParams(
+            server_params=StdioServerParameters(
+                command=sys.executable, args=[STUB_SERVER]
+            ),
+            timeout=30,
+        ),
+        tool_filter=["imagen_t2i"],
+        **kwargs,
+    )
+
+
+def _text(result) -> str:
+    return result["content"][0]["text"]
+
+
+@pytest.fixture(autouse=True)
+def no_health_loop(monkeypatch):
+    monkeypatch.setattr(pool, "MCP_POOL_HEALTH_INTERVAL", 0)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_use_separate_sessions():
+    toolset = _stub_toolset(pool_size=2)
+    try:
+        await toolset.warm()
+        [tool] = await toolset.get_tools()
+        assert isinstance(tool, PooledMCPTool)
+        results = await asyncio.gather(
+            tool.run_async(args={"prompt": "a cat"}, tool_context=None),
+            tool.run_async(args={"prompt": "a dog"}, tool_context=None),
+        )
+    finally:
+        await toolset.close()
+    pids = {_text(result).split(":")[0] for result in results}
+    assert len(pids) == 2
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_calls_share_one_server_call():
+    toolset = _stub_toolset(pool_size=2, single_flight=True)
+    try:
+        [tool] = await toolset.get_tools()
+        results = await asyncio.gather(
+            *(
+                tool.run_async(args={"prompt": "a cat"}, tool_context=None)
+                for _ in range(3)
+            )
+        )
+    finally:
+        await toolset.close()
+    assert len({_text(result) for result in results}) == 1
+
+
+class _Session:
+    def __init__(self, alive: bool):
+        self.alive = alive
+
+    async def send_ping(self):
+        if not self.alive:
+            raise ConnectionError("session closed")
+
+
+class _Member:
+    """An MCPSessionManager stand-in that records the headers it is opened with."""
+
+    def __init__(self, alive: bool = True):
+        self.alive = alive
+        self.headers = []
+        self.closed = False
+
+    async def create_session(self, headers=None):
+        self.headers.append(headers)
+        return _Session(self.alive)
+
+    async def close(self):
+        self.closed = True
+
+
+def _fake_pool(members, headers) -> McpSessionPool:
+    created = iter(members)
+    fake = McpSessionPool(connection_params=None, size=2, headers=headers)
+    fake._factory = lambda: next(created)
+    fake._members = [next(created), next(created)]
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_health_check_uses_the_current_headers():
+    tokens = iter(["token-1", "token-2"])
+
+    async def headers():
+        return {"Authorization": f"Bearer {next(tokens)}"}
+
+    members = [_Member(), _Member()]
+    fake = _fake_pool(members, headers)
+    await fake.warm()
+    assert await fake.check_health() == 0
+    for member in members:
+        assert member.headers == [
+            {"Authorization": "Bearer token-1"},
+            {"Authorization": "Bearer token-2"},
+        ]
+
+
+@pytest.mark.asyncio
+async def test_health_check_replaces_dead_idle_members():
+    dead, alive, fresh = _Member(alive=False), _Member(), _Member()
+    fake = _fake_pool([dead, alive, fresh], pool._no_headers)
+    assert await fake.check_health() == 1
+    assert dead.closed
+    assert fake._members == [fresh, alive]
+    assert fresh.headers == [None]
+
+
+@pytest.mark.asyncio
+async def test_health_check_skips_members_in_use():
+    dead = _Member(alive=False)
+    fake = _fake_pool([dead, _Member()], pool._no_headers)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def call():
+        started.set()
+        await release.wait()
+
+    task = asyncio.create_task(fake.run(call))
+    await started.wait()
+    assert await fake.check_health() == 0
+    release.set()
+    await task
+    assert not dead.closed
@@ -0,0 +1,85 @@
+import struct
+
+import fakes
+import pytest
+
+from media_agent.tools import preflight
+from media_agent.tools.preflight import preflight_image, sniff_image, validate
+
+from .conftest import Ready
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    sof0 = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1)
+    return b"\xff\xd8" + app0 + sof0 + b"\x01\x11\x00"
+
+
+@pytest.fixture
+def gcs(monkeypatch):
+    client = fakes.FakeGcsClient({})
+    monkeypatch.setattr(preflight, "_storage", Ready(client))
+    preflight.preflight_cache.clear()
+    yield client.objects
+    preflight.preflight_cache.clear()
+
+
+def test_sniff_png_and_jpeg_sizes():
+    assert sniff_image(fakes.png_header(1280, 720)) == ("image/png", 1280, 720)
+    assert sniff_image(_jpeg(720, 1280)) == ("image/jpeg", 720, 1280)
+    assert sniff_image(b"GIF89a") == ("image/gif", None, None)
+    assert sniff_image(b"hello") == (None, None, None)
+
+
+@pytest.mark.parametrize(
+    "info, aspect_ratio, error",
+    [
+        (("image/png", 1280, 720, 1000), "16:9", None),
+        (("image/png", 1024, 1024, 1000), "16:9", None),
+        (("image/png", None, None, 1000), "16:9", None),
+        (("image/gif", 1280, 720, 1000), "16:9", "未対応の形式"),
+        (("image/png", 1280, 720, 10**9), "16:9", "大きすぎます"),
+        (("image/png", 320, 180, 1000), "16:9", "解像度"),
+        (("image/png", 720, 1280, 1000), "16:9", "縦横比"),
+    ],
+)
+def test_validate(info, aspect_ratio, error):
+    check = validate("gs://b/in.png", *info, aspect_ratio)
+    if error is None:
+        assert check.error is None
+    else:
+        assert error in check.error
+
+
+@pytest.mark.asyncio
+async def test_mime_type_comes_from_the_bytes(gcs):
+    gcs[("b", "in.png")] = _jpeg(1280, 720)
+    check = await preflight_image("gs://b/in.png", "16:9")
+    assert check == ("image/jpeg", 1280, 720, None)
+
+
+@pytest.mark.asyncio
+async def test_missing_objects_are_rejected(gcs):
+    check = await preflight_image("gs://b/missing.png", "16:9")
+    assert "見つかりません" in check.error
+
+
+@pytest.mark.asyncio
+async def test_sniffed_images_are_cached_per_generation(gcs):
+    gcs[("b", "in.png")] = fakes.png_header(1280, 720)
+    await preflight_image("gs://b/in.png", "16:9")
+    # 同じ世代なら読み直さない。縦横比の制限は呼び出しごとに確かめる
+    gcs[("b", "in.png")] = fakes.png_header(720, 1280)
+    assert (await preflight_image("gs://b/in.png", "16:9")).error is None
+    assert "縦横比" in (await preflight_image("gs://b/in.png", "9:16")).error
+
+
+@pytest.mark.asyncio
+async def test_unexpected_errors_fall_back_to_the_extension(monkeypatch):
+    def broken():
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(preflight, "_storage", preflight.Lazy(broken))
+    check = await preflight_image("gs://b/in.png", "16:9")
+    assert check == ("image/png", None, None, None)
+    assert (await preflight_image("gs://b/in.png", "16:9", enabled=False)).error is None
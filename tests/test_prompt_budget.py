@@ -0,0 +1,65 @@
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from media_agent import prompt_budget
+from media_agent.prompt_budget import apply_prompt_budget, record_cached_tokens
+
+from .helpers import user
+
+INSTRUCTION = "Always answer in English."
+
+
+def _request(*contents: types.Content) -> LlmRequest:
+    return LlmRequest(
+        contents=list(contents),
+        config=types.GenerateContentConfig(system_instruction="You are an agent."),
+    )
+
+
+def test_instruction_is_added_to_the_system_instruction_once():
+    request = _request(user("a cat"))
+    assert apply_prompt_budget(request, INSTRUCTION) > 0
+    assert apply_prompt_budget(request, INSTRUCTION) == 0
+    assert request.config.system_instruction.count(INSTRUCTION) == 1
+    assert request.contents[0].parts[0].text == "a cat"
+
+
+def test_instructions_injected_into_history_are_removed():
+    injected = user(f"{INSTRUCTION}\n\na cat")
+    request = _request(injected, user("a dog"))
+    apply_prompt_budget(request, INSTRUCTION)
+    assert [c.parts[0].text for c in request.contents] == ["a cat", "a dog"]
+    # セッションの履歴そのものは書き換えない
+    assert injected.parts[0].text.startswith(INSTRUCTION)
+
+
+def test_cache_is_left_to_the_app():
+    request = _request(user("a cat"))
+    apply_prompt_budget(request, INSTRUCTION)
+    assert request.cache_config is None
+
+
+def test_agents_enable_context_caching_on_their_app():
+    from media_agent import agent as media_agent
+    from media_agent_mcp import agent as media_agent_mcp
+
+    config = prompt_budget.context_cache_config
+    assert config is not None
+    # Gemini 2.5 がキャッシュできない小さなリクエストでは作らない
+    assert config.min_tokens >= 2048
+    for module in (media_agent, media_agent_mcp):
+        runner = Runner(app=module.app, session_service=InMemorySessionService())
+        assert runner.agent is module.root_agent
+        assert runner.context_cache_config == config
+
+
+def test_cached_tokens_are_read_from_the_usage():
+    response = LlmResponse(
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=3000, cached_content_token_count=2500
+        )
+    )
+    assert record_cached_tokens(response) == 2500
+    assert record_cached_tokens(LlmResponse()) == 0
@@ -0,0 +1,106 @@
+import functools
+
+from media_agent import callbacks, response_cache
+from media_agent.response_cache import LlmResponseCache, request_key
+
+from .helpers import SIGNED_URL, answer, call, model, request, result, user
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_request_key_ignores_call_ids_and_signatures():
+    def history(call_id, signature):
+        return request(
+            user("ジョブはどうなった？"),
+            call("get_media_job", {"job_id": "1"}, call_id),
+            result("get_media_job", {"uris": [SIGNED_URL.format(0, signature)]}),
+        )
+
+    assert request_key(history("a", "ab")) == request_key(history("b", "cd"))
+    assert request_key(request(user("こんにちは"))) != request_key(
+        request(user("こんばんは"))
+    )
+
+
+def test_histories_with_side_effects_are_not_cached():
+    history = request(
+        user("猫の画像を作って"),
+        call("imagen_t2i", {"prompt": "a cat"}),
+        result("imagen_t2i", {"status": "success"}),
+    )
+    assert request_key(history) is None
+
+
+def test_entries_expire_and_are_evicted():
+    clock = Clock()
+    cache = LlmResponseCache(max_size=2, ttl=10, clock=clock)
+    cache.put("a", answer("A"), 1.0)
+    cache.put("b", answer("B"), 1.0)
+    cache.put("c", answer("C"), 1.0)
+    assert cache.get("a") is None
+    response, seconds = cache.get("b")
+    assert response.content.parts[0].text == "B" and seconds == 1.0
+    clock.now = 11
+    assert cache.get("c") is None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["expired"], stats["hits"]) == (1, 1, 1)
+
+
+def test_answers_are_stored_and_replayed(monkeypatch):
+    monkeypatch.setattr(response_cache, "llm_response_cache", LlmResponseCache())
+    first = request(user("こんにちは"))
+    assert response_cache.lookup_response(first, "inv-1", enabled=True) is None
+    assert response_cache.store_response(answer("こんにちは！"), "inv-1")
+
+    replayed = response_cache.lookup_response(
+        request(user("こんにちは")), "inv-2", enabled=True
+    )
+    assert replayed.content.parts[0].text == "こんにちは！"
+    assert replayed.custom_metadata == {"llm_cache": "hit"}
+
+
+def test_partial_and_unmatched_responses_are_not_stored():
+    partial = answer("...")
+    partial.partial = True
+    assert not response_cache.store_response(partial, "inv-x")
+    assert not response_cache.store_response(answer("hi"), "unknown-invocation")
+    assert response_cache.lookup_response(request(model("x")), "inv", enabled=False) is None
+
+
+def test_signed_urls_are_stored_as_gs_uris():
+    cache = LlmResponseCache()
+    cache.put("a", answer(f"できました: {SIGNED_URL.format(0, 'ab')}"), 1.0)
+    response, _ = cache.get("a")
+    assert response.content.parts[0].text == "できました: gs://test-bucket/out/0.png"
+
+
+class _CallbackContext:
+    agent_name = "media_agent"
+
+    def __init__(self, invocation_id: str):
+        self.invocation_id = invocation_id
+
+
+def test_cache_hits_are_signed_before_they_reach_the_user(signer, monkeypatch):
+    monkeypatch.setattr(response_cache, "llm_response_cache", LlmResponseCache())
+    monkeypatch.setattr(
+        callbacks,
+        "lookup_response",
+        functools.partial(response_cache.lookup_response, enabled=True),
+    )
+    history = (user("ロゴはどこ？"),)
+    first = _CallbackContext("inv-sign-1")
+    assert callbacks.before_model(first, request(*history)) is None
+    callbacks.after_model(first, answer("こちらです: gs://test-bucket/out/logo.png"))
+
+    # ADK は before_model が返した応答に after_model を呼ばない
+    replayed = callbacks.before_model(_CallbackContext("inv-sign-2"), request(*history))
+    text = replayed.content.parts[0].text
+    assert text.startswith("こちらです: https://storage.googleapis.com/test-bucket/out/logo.png?")
+    assert "X-Goog-Signature=" in text
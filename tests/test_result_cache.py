@@ -0,0 +1,133 @@
+import json
+import logging
+
+import pytest
+from google.api_core import exceptions
+
+from media_agent.tools import result_cache
+from media_agent.tools.result_cache import (
+    GcsManifestResultStore,
+    MemoryResultStore,
+    SqliteResultStore,
+    cache_key,
+)
+
+
+class _Blob:
+    """A GCS object with generations and if_generation_match, shared by instances."""
+
+    def __init__(self, objects: dict, name: str):
+        self._objects = objects
+        self.name = name
+        self.generation = None
+
+    def reload(self) -> None:
+        if self.name not in self._objects:
+            raise exceptions.NotFound(self.name)
+        self.generation = self._objects[self.name][1]
+
+    def download_as_bytes(self) -> bytes:
+        data, self.generation = self._objects[self.name]
+        return data
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        current = self._objects.get(self.name, (None, 0))[1]
+        if if_generation_match != current:
+            raise exceptions.PreconditionFailed(self.name)
+        self.generation = current + 1
+        self._objects[self.name] = (data.encode(), self.generation)
+
+
+class _Client:
+    def __init__(self, objects: dict):
+        self._objects = objects
+
+    def bucket(self, name: str) -> "_Client":
+        return self
+
+    def blob(self, name: str) -> _Blob:
+        return _Blob(self._objects, name)
+
+
+@pytest.fixture
+def gcs_store(monkeypatch):
+    objects = {}
+    monkeypatch.setattr(result_cache.storage, "Client", lambda: _Client(objects))
+    return lambda: GcsManifestResultStore("test-bucket")
+
+
+def test_cache_key_ignores_order_and_whitespace():
+    assert cache_key(prompt=" a cat ", model="m") == cache_key(model="m", prompt="a cat")
+    assert cache_key(prompt="a cat") != cache_key(prompt="a dog")
+
+
+def test_memory_store_evicts_the_least_recently_used():
+    store = MemoryResultStore(max_size=2)
+    store.put("a", {"uris": ["gs://b/a.png"]})
+    store.put("b", {"uris": ["gs://b/b.png"]})
+    store.get("a")
+    store.put("c", {"uris": ["gs://b/c.png"]})
+    assert store.get("b") is None
+    assert store.get("a") and store.get("c")
+
+
+def test_sqlite_store_is_shared_across_connections(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SqliteResultStore(path).put("k", {"uris": ["gs://b/0.png"], "seconds": 1.5})
+    assert SqliteResultStore(path).get("k") == {"uris": ["gs://b/0.png"], "seconds": 1.5}
+
+
+def test_gcs_manifest_reloads_entries_written_by_another_instance(gcs_store):
+    first, second = gcs_store(), gcs_store()
+    assert second.get("k") is None
+
+    first.put("k", {"uris": ["gs://b/0.png"]})
+    assert second.get("k") == {"uris": ["gs://b/0.png"]}
+
+    second.put("j", {"uris": ["gs://b/1.png"]})
+    assert first.get("j") == {"uris": ["gs://b/1.png"]}
+
+    # 古い世代のまま書こうとした側は、読み直してから書く
+    third = gcs_store()
+    third.get("k")
+    first.put("i", {"uris": ["gs://b/2.png"]})
+    third.put("h", {"uris": ["gs://b/3.png"]})
+    manifest = json.loads(third._blob.download_as_bytes())
+    assert set(manifest) == {"k", "j", "i", "h"}
+
+
+def test_gcs_manifest_logs_when_it_cannot_be_written(gcs_store, monkeypatch, caplog):
+    store = gcs_store()
+
+    def conflict(*args, **kwargs):
+        raise exceptions.PreconditionFailed("manifest")
+
+    monkeypatch.setattr(store._blob, "upload_from_string", conflict)
+    with caplog.at_level(logging.WARNING, logger="genmedia"):
+        store.put("k", {"uris": ["gs://b/0.png"]})
+    assert "result_cache_manifest_conflict" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_cached_generation_stores_and_replays(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_BACKEND", "memory")
+    monkeypatch.setattr(result_cache, "_store", MemoryResultStore())
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        return ["gs://b/0.png"]
+
+    assert await result_cache.cached_generation("k", False, generate) == (
+        ["gs://b/0.png"],
+        False,
+    )
+    assert await result_cache.cached_generation("k", False, generate) == (
+        ["gs://b/0.png"],
+        True,
+    )
+    assert await result_cache.cached_generation("k", True, generate) == (
+        ["gs://b/0.png"],
+        False,
+    )
+    assert len(calls) == 2
@@ -0,0 +1,90 @@
+import base64
+
+from mcp import types as mcp_types
+
+from media_agent.rewrite import (
+    iter_mcp_strings,
+    iter_strings,
+    looks_like_blob,
+    rewrite_mcp_result,
+    rewrite_tree,
+)
+
+
+def _upper_gs(text: str) -> str:
+    return text.replace("gs://", "GS://") if "gs://" in text else text
+
+
+def test_only_the_path_to_a_change_is_copied():
+    untouched = {"log": ["a", "b"]}
+    tree = {"result": {"uri": "gs://b/0.png", "size": 3}, "meta": untouched}
+    rewritten = rewrite_tree(tree, _upper_gs)
+
+    assert rewritten["result"] == {"uri": "GS://b/0.png", "size": 3}
+    assert rewritten["meta"] is untouched
+    assert tree["result"]["uri"] == "gs://b/0.png"
+
+
+def test_unchanged_trees_are_returned_as_is():
+    tree = {"uris": ["https://example.com/0.png"], "n": 1}
+    assert rewrite_tree(tree, _upper_gs) is tree
+
+
+def test_blobs_and_ignored_keys_are_skipped():
+    blob = base64.b64encode(b"gs://b/0.png" * 100).decode()
+    tree = {
+        "data": "gs://b/0.png",
+        "image": blob,
+        "inline": "data:image/png,gs://b/0.png",
+    }
+    assert looks_like_blob(blob)
+    assert rewrite_tree(tree, _upper_gs, ignore_keys={"data"}) is tree
+    assert list(iter_strings(tree, {"data"})) == []
+
+
+def test_mcp_results_rewrite_text_and_resources_but_not_images():
+    image = mcp_types.ImageContent(
+        type="image", data="Z3M6Ly9iLzAucG5n", mimeType="image/png"
+    )
+    result = mcp_types.CallToolResult(
+        content=[
+            mcp_types.TextContent(type="text", text="done: gs://b/0.png"),
+            image,
+            mcp_types.EmbeddedResource(
+                type="resource",
+                resource=mcp_types.TextResourceContents(
+                    uri="gs://b/1.png", text="gs://b/1.png", mimeType="text/plain"
+                ),
+            ),
+        ],
+        structuredContent={"uri": "gs://b/0.png"},
+    )
+    assert set(iter_mcp_strings(result)) == {
+        "done: gs://b/0.png",
+        "gs://b/0.png",
+        "gs://b/1.png",
+    }
+
+    rewritten = rewrite_mcp_result(result, _upper_gs)
+    assert rewritten.content[0].text == "done: GS://b/0.png"
+    assert rewritten.content[1] is image
+    assert rewritten.content[2].resource.text == "GS://b/1.png"
+    structured = rewritten.model_dump(by_alias=True)["structuredContent"]
+    assert structured == {"uri": "GS://b/0.png"}
+    assert result.content[0].text == "done: gs://b/0.png"
+
+
+def test_mcp_dict_dumps_skip_binary_keys():
+    dump = {
+        "content": [{"type": "image", "data": "gs://b/0.png"}, {"text": "gs://b/0.png"}]
+    }
+    rewritten = rewrite_mcp_result(dump, _upper_gs)
+    assert rewritten["content"][0] is dump["content"][0]
+    assert rewritten["content"][1] == {"text": "GS://b/0.png"}
+
+
+def test_unchanged_mcp_results_are_returned_as_is():
+    result = mcp_types.CallToolResult(
+        content=[mcp_types.TextContent(type="text", text="no assets")]
+    )
+    assert rewrite_mcp_result(result, _upper_gs) is result
@@ -0,0 +1,67 @@
+import pytest
+from google.genai import types
+
+from media_agent.routing import DEFAULT, OVERRIDE, imagen_router, veo_router
+from media_agent.tools import genmedia
+from media_agent.tools.result_cache import result_cache_stats
+
+
+class _Tool:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class _ToolContext:
+    agent_name = "media_agent_mcp"
+
+    def __init__(self, text: str, function_call_id: str = "call-routing"):
+        self.function_call_id = function_call_id
+        self.user_content = types.Content(role="user", parts=[types.Part(text=text)])
+
+
+@pytest.fixture
+def mcp_callbacks():
+    from media_agent_mcp import callbacks
+
+    return callbacks
+
+
+def _route(callbacks, text: str, model: str):
+    args = {"prompt": "a cat", "model": model}
+    context = _ToolContext(text)
+    callbacks.before_tool(_Tool("veo_i2v"), args, context)
+    routing = callbacks._end_routing(_Tool("veo_i2v"), args, context, None)
+    return args["model"], routing
+
+
+def test_default_model_filled_in_by_the_llm_is_routed(mcp_callbacks):
+    assert _route(mcp_callbacks, "猫の動画を作って", veo_router.model)[1] == DEFAULT
+
+
+def test_default_model_named_by_the_user_is_an_override(mcp_callbacks):
+    text = f"{veo_router.model} で猫の動画を作って"
+    assert _route(mcp_callbacks, text, veo_router.model) == (veo_router.model, OVERRIDE)
+
+
+def test_other_models_are_overrides(mcp_callbacks):
+    model = veo_router.fast_model
+    assert _route(mcp_callbacks, "猫の動画を作って", model) == (model, OVERRIDE)
+
+
+@pytest.mark.asyncio
+async def test_cache_is_keyed_on_the_request_before_routing(genai_client, monkeypatch):
+    args = dict(prompt="a routed cat", bucket="test-bucket")
+    first = await genmedia.imagen_t2i(**args)
+    assert first["model"] == imagen_router.model
+    assert not first["cached"]
+
+    # 混雑して高速なモデルに振り分けられる状況でも、同じリクエストはキャッシュに当たる
+    monkeypatch.setattr(
+        imagen_router, "route", lambda override=None: (imagen_router.fast_model, "busy")
+    )
+    hits = result_cache_stats()["hits"]
+    second = await genmedia.imagen_t2i(**args)
+    assert second["cached"]
+    assert second["uris"] == first["uris"]
+    assert "model" not in second
+    assert result_cache_stats()["hits"] == hits + 1
@@ -0,0 +1,80 @@
+import pytest
+
+from media_agent.scanner import GcsUrlScanner
+
+from .helpers import SIGNED_URL
+
+scanner = GcsUrlScanner(["bk"])
+
+
+def _objects(text: str):
+    return [match.object_name for match in scanner.scan(text)]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "gs://bk/x.png",
+        "gs://bk/x.png.",
+        "gs://bk/x.png:",
+        "gs://bk/x.png;",
+        "**gs://bk/x.png**",
+        "(gs://bk/x.png)",
+        "gs://bk/x.pngです",
+        "画像: gs://bk/x.png！",
+    ],
+)
+def test_match_ends_at_the_extension(text):
+    assert _objects(text) == ["x.png"]
+    assert scanner.scan(text)[0].text == "gs://bk/x.png"
+
+
+def test_japanese_punctuation_after_a_video():
+    assert _objects("動画: gs://bk/x.mp4。") == ["x.mp4"]
+
+
+@pytest.mark.parametrize(
+    "text, objects",
+    [
+        ("gs://bk/x.png.mp4 を", ["x.png.mp4"]),
+        ("gs://bk/dir.png/x.mp4", ["dir.png/x.mp4"]),
+        ("gs://bk/x.png_2.webm", ["x.png_2.webm"]),
+        ("gs://bk/x.png.bak", []),
+        ("gs://bk/x.txt", []),
+        ("gs://other/x.png", []),
+    ],
+)
+def test_object_names_continue_past_an_inner_extension(text, objects):
+    assert _objects(text) == objects
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://storage.googleapis.com/bk/out/0.png",
+        "https://storage.cloud.google.com/bk/out/0.png",
+    ],
+)
+def test_https_forms(url):
+    (match,) = scanner.scan(f"こちら: {url}。")
+    assert match.key == ("bk", "out/0.png")
+    assert match.text == url
+
+
+def test_signed_urls_are_skipped():
+    signed = SIGNED_URL.format(0, "ab" * 32)
+    text = f"{signed} と gs://test-bucket/out/1.png"
+    matches = GcsUrlScanner(["test-bucket"]).scan(text)
+    assert [match.object_name for match in matches] == ["out/1.png"]
+
+
+def test_rewrite_keeps_the_surrounding_text():
+    text = "**gs://bk/a.png** と gs://bk/b.mp4。"
+    matches = scanner.scan(text)
+    rewritten = scanner.rewrite(text, matches, lambda m: f"<{m.object_name}>")
+    assert rewritten == "**<a.png>** と <b.mp4>。"
+
+
+def test_parse():
+    assert scanner.parse("gs://bk/out/0.png") == ("bk", "out/0.png")
+    assert scanner.parse("gs://bk/out/0.txt") == (None, None)
@@ -0,0 +1,45 @@
+"""
+media_agent と media_agent_mcp は別々にデプロイする (Agent Engine へはディレクトリごと送る) ため、
+共通のモジュールを両方に置いている。片方だけ直して食い違わないよう、中身が同じであることを確かめる
+"""
+
+import os
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SHARED_MODULES = (
+    "compaction.py",
+    "intent.py",
+    "lazy.py",
+    "links.py",
+    "prompt_budget.py",
+    "response_cache.py",
+    "rewrite.py",
+    "routing.py",
+    "scanner.py",
+    "signing.py",
+    "singleflight.py",
+    "telemetry.py",
+)
+
+
+def _read(*path: str) -> str:
+    with open(os.path.join(ROOT, *path), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("module", SHARED_MODULES)
+def test_shared_modules_are_identical(module):
+    assert _read("media_agent_mcp", module) == _read("media_agent", module), (
+        f"media_agent/{module} and media_agent_mcp/{module} differ; "
+        "apply the change to both copies"
+    )
+
+
+def test_auth_differs_only_in_its_package():
+    # media_agent では tools パッケージの中にあるため、telemetry の import だけが異なる
+    tools_auth = _read("media_agent", "tools", "auth.py")
+    mcp_auth = _read("media_agent_mcp", "auth.py")
+    assert tools_auth.replace("from ..telemetry", "from .telemetry") == mcp_auth
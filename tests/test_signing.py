@@ -0,0 +1,97 @@
+import json
+import threading
+
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from media_agent import signing
+from media_agent.lazy import Lazy
+from media_agent.signing import LocalKeySigner, SignedUrlCache, sign_concurrently
+
+
+@pytest.fixture(scope="module")
+def key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def key_file(key, tmp_path):
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    path = tmp_path / "key.json"
+    path.write_text(
+        json.dumps(
+            {
+                "type": "service_account",
+                "client_email": "signer@example.iam.gserviceaccount.com",
+                "private_key": pem.decode("ascii"),
+                "private_key_id": "1",
+            }
+        )
+    )
+    return str(path)
+
+
+def test_cache_hands_out_urls_with_enough_lifetime_left():
+    now = [0.0]
+    cache = SignedUrlCache(max_size=2, min_remaining=60, clock=lambda: now[0])
+    cache.put("b", "a.png", "GET", "https://signed/a", lifetime=300)
+    assert cache.get("b", "a.png") == "https://signed/a"
+    now[0] = 241
+    assert cache.get("b", "a.png") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_cache_evicts_the_least_recently_used():
+    cache = SignedUrlCache(max_size=2)
+    for name in ("a.png", "b.png"):
+        cache.put("b", name, "GET", f"https://signed/{name}", lifetime=300)
+    cache.get("b", "a.png")
+    cache.put("b", "c.png", "GET", "https://signed/c.png", lifetime=300)
+    assert cache.get("b", "b.png") is None
+    assert cache.stats() == dict(hits=1, misses=1, expired=0, evictions=1, size=2)
+
+
+def test_sign_concurrently_signs_each_object_once_on_the_pool():
+    keys = [("b", "a.png"), ("b", "c.png"), ("b", "a.png")]
+    threads = set()
+
+    def sign(key):
+        threads.add(threading.current_thread().name)
+        return f"https://signed/{key[0]}/{key[1]}"
+
+    urls = sign_concurrently(keys, sign)
+    assert urls == {
+        ("b", "a.png"): "https://signed/b/a.png",
+        ("b", "c.png"): "https://signed/b/c.png",
+    }
+    assert all(name.startswith("signer") for name in threads)
+
+
+def test_single_object_is_signed_on_the_calling_thread():
+    name = sign_concurrently([("b", "a.png")], lambda key: threading.current_thread().name)
+    assert name == {("b", "a.png"): threading.current_thread().name}
+
+
+def test_local_key_signer_signs_with_the_key(key, key_file):
+    signer = LocalKeySigner.from_file(key_file)
+    signature = signer.sign_bytes(b"GOOG4-RSA-SHA256")
+    key.public_key().verify(
+        signature, b"GOOG4-RSA-SHA256", padding.PKCS1v15(), hashes.SHA256()
+    )
+    assert signer.signer_email == "signer@example.iam.gserviceaccount.com"
+
+
+def test_local_signer_is_built_once_from_the_key_file(key_file, monkeypatch):
+    monkeypatch.setattr(signing, "SIGNING_KEY_FILE", None)
+    assert signing.get_local_signer() is None
+
+    monkeypatch.setattr(signing, "SIGNING_KEY_FILE", key_file)
+    monkeypatch.setattr(signing, "_local_signer", Lazy(signing._local_signer._factory))
+    signer = signing.get_local_signer()
+    assert isinstance(signer, LocalKeySigner)
+    assert signing.get_local_signer() is signer
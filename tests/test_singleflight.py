@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from media_agent.singleflight import SingleFlight, flight_key
+
+
+def test_flight_key_ignores_parameter_order():
+    assert flight_key("veo_i2v", {"a": 1, "b": 2}) == flight_key(
+        "veo_i2v", {"b": 2, "a": 1}
+    )
+    assert flight_key("veo_i2v", {"a": 1}) != flight_key("imagen_t2i", {"a": 1})
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_with_one_key_run_once():
+    flights = SingleFlight("test")
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flights.do("key", call) for _ in range(3)))
+    assert calls == 1
+    assert [result for result, _ in results] == [1, 1, 1]
+    assert [shared for _, shared in results] == [False, True, True]
+    assert flights.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    flights = SingleFlight("test")
+
+    async def call(value):
+        await asyncio.sleep(0)
+        return value
+
+    results = await asyncio.gather(
+        flights.do("a", lambda: call("a")), flights.do("b", lambda: call("b"))
+    )
+    assert results == [("a", False), ("b", False)]
+
+
+@pytest.mark.asyncio
+async def test_failures_are_shared_and_not_kept():
+    flights = SingleFlight("test")
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(
+        flights.do("key", failing), flights.do("key", failing), return_exceptions=True
+    )
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    with pytest.raises(RuntimeError):
+        await flights.do("key", failing)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flights = SingleFlight("test")
+    finished = asyncio.Event()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        finished.set()
+        return "done"
+
+    first = asyncio.create_task(flights.do("key", call))
+    second = asyncio.create_task(flights.do("key", call))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == ("done", True)
+    assert finished.is_set()
@@ -0,0 +1,83 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from google.adk.events import Event
+
+from media_agent.server import add_progress_route
+from media_agent.streaming import run_with_progress
+from media_agent.tools.progress import progress_hub, QUEUED, SUBMITTED, RUNNING, SUCCESS
+
+from .helpers import call
+
+
+class _Runner:
+    """Calls veo_i2v twice: once submitting `job_id`, once answered without progress."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    async def run_async(self, *, user_id, session_id, new_message):
+        yield Event(
+            invocation_id="inv",
+            author="media_agent",
+            content=call("veo_i2v", {"prompt": "a cat"}, f"call-{self.job_id}"),
+        )
+        yield Event(
+            invocation_id="inv",
+            author="media_agent",
+            content=call("veo_i2v", {"prompt": "a dog"}, f"cached-{self.job_id}"),
+        )
+        # ツールの実行: 受け付けてジョブを投入する
+        progress_hub.publish(f"call-{self.job_id}", {"status": QUEUED})
+        progress_hub.publish(self.job_id, {"status": SUBMITTED, "job_id": self.job_id})
+        progress_hub.link(self.job_id, f"call-{self.job_id}")
+
+
+async def _finish_job(job_id: str) -> None:
+    await asyncio.sleep(0.05)
+    progress_hub.publish(job_id, {"status": RUNNING, "elapsed_seconds": 3.0})
+    await asyncio.sleep(0.05)
+    progress_hub.publish(job_id, {"status": SUCCESS, "uris": ["gs://b/v.mp4"]})
+
+
+@pytest.mark.asyncio
+async def test_progress_is_streamed_until_the_job_finishes():
+    finishing = asyncio.create_task(_finish_job("job-stream"))
+    events = [
+        event
+        async for event in run_with_progress(
+            _Runner("job-stream"), user_id="u", session_id="s", new_message=None
+        )
+    ]
+    await finishing
+
+    progress = [
+        event.custom_metadata["progress"] for event in events if event.partial
+    ]
+    assert [p["status"] for p in progress][-2:] == [RUNNING, SUCCESS]
+    assert {p["function_call_id"] for p in progress} == {"call-job-stream"}
+    assert progress[-1]["uris"] == ["gs://b/v.mp4"]
+
+
+@pytest.mark.asyncio
+async def test_progress_route_streams_server_sent_events():
+    app = FastAPI()
+    add_progress_route(app)
+    progress_hub.publish("job-route", {"status": SUBMITTED, "job_id": "job-route"})
+    finishing = asyncio.create_task(_finish_job("job-route"))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/progress/job-route")
+    await finishing
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line[len("data: ") :])
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert [event["status"] for event in events] == [SUBMITTED, RUNNING, SUCCESS]
@@ -0,0 +1,117 @@
+import pytest
+
+from media_agent import callbacks
+from media_agent.tools import genmedia, jobs
+
+
+class _Tool:
+    name = "imagen_t2i"
+
+
+class _ToolContext:
+    agent_name = "media_agent"
+
+    def __init__(self, function_call_id=None):
+        self.function_call_id = function_call_id
+
+
+def _points(reader, name):
+    data = reader.get_metrics_data()
+    for resource in data.resource_metrics if data else ():
+        for scope in resource.scope_metrics:
+            for metric in scope.metrics:
+                if metric.name == name:
+                    return list(metric.data.data_points)
+    return []
+
+
+def _count(reader, name, **attributes) -> float:
+    """The number of histogram samples, or the counter's sum, with `attributes`."""
+    total = 0
+    for point in _points(reader, name):
+        if all(point.attributes.get(k) == v for k, v in attributes.items()):
+            total += getattr(point, "count", None) or getattr(point, "value", 0)
+    return total
+
+
+def _spans(exporter, name):
+    return [span for span in exporter.get_finished_spans() if span.name == name]
+
+
+def test_tool_duration(telemetry):
+    _, reader = telemetry
+    before = _count(reader, "genmedia.tool.duration", tool="imagen_t2i")
+    context = _ToolContext("call-1")
+    callbacks.before_tool(_Tool(), {}, context)
+    callbacks.after_tool(_Tool(), {}, context, {"status": "success"})
+    assert _count(reader, "genmedia.tool.duration", tool="imagen_t2i") == before + 1
+
+
+def test_signing_span_latency_and_cache(telemetry, signer):
+    exporter, reader = telemetry
+    exporter.clear()
+    hits = _count(reader, "genmedia.cache.lookups", cache="signed_url", result="hit")
+    misses = _count(reader, "genmedia.cache.lookups", cache="signed_url", result="miss")
+    signings = _count(reader, "genmedia.signing.duration", backend="local")
+
+    response = {"status": "success", "uri": "gs://test-bucket/out/0.png"}
+    for _ in range(2):
+        signed = callbacks.after_tool(_Tool(), {}, _ToolContext(), response)
+        assert signed["uri"].startswith("https://storage.googleapis.com/")
+
+    assert len(_spans(exporter, "gcs.sign_objects")) == 2
+    assert _count(reader, "genmedia.signing.duration", backend="local") == signings + 1
+    assert (
+        _count(reader, "genmedia.cache.lookups", cache="signed_url", result="miss")
+        == misses + 1
+    )
+    assert (
+        _count(reader, "genmedia.cache.lookups", cache="signed_url", result="hit")
+        == hits + 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_veo_queue_and_poll(telemetry, genai_client):
+    exporter, reader = telemetry
+    exporter.clear()
+    model = genmedia.veo_model
+    queued = _count(reader, "genmedia.veo.queue_time", model=model)
+    polled = _count(reader, "genmedia.veo.poll_time", model=model)
+
+    uris = await genmedia._generate_videos(
+        "a cat", "gs://test-bucket/ref.png", "image/png", "gs://test-bucket/", 1,
+        "16:9", 6, model,
+    )
+
+    assert uris and uris[0].endswith(".mp4")
+    [admission] = _spans(exporter, "veo.admission")
+    [submit] = _spans(exporter, "veo.submit")
+    # 待ち時間のスパンは投入の RPC を含まない
+    assert admission.end_time <= submit.start_time
+    [poll] = _spans(exporter, "veo.poll")
+    assert poll.attributes["polls"] == genai_client.polls_until_done
+    assert _count(reader, "genmedia.veo.queue_time", model=model) == queued + 1
+    assert _count(reader, "genmedia.veo.poll_time", model=model) == polled + 1
+    assert _count(reader, "genmedia.veo.poll_count", model=model) >= 1
+
+
+@pytest.mark.asyncio
+async def test_job_poll(telemetry, genai_client, tmp_path):
+    exporter, reader = telemetry
+    exporter.clear()
+    polled = _count(reader, "genmedia.veo.poll_count", kind="veo_i2v")
+    manager = jobs.JobManager(jobs.SqliteJobStore(str(tmp_path / "jobs.db")), 0)
+    operation = await genai_client.aio.models.generate_videos(
+        model=genmedia.veo_model, prompt=""
+    )
+    jobs.get_controller(genmedia.veo_model).occupy()
+
+    job_id = await manager.submit(operation.name, "veo_i2v")
+    job = await manager.get(job_id, wait_seconds=5)
+
+    assert job["status"] == jobs.SUCCEEDED
+    assert [span.attributes["job_id"] for span in _spans(exporter, "veo.poll")] == [
+        job_id
+    ]
+    assert _count(reader, "genmedia.veo.poll_count", kind="veo_i2v") == polled + 1